@@ -7,9 +7,16 @@
  * Date: 3/23/16
  * Time: 1:24 AM
 """
+from cStringIO import StringIO
 from datetime import datetime
+import base64
+import csv
+import functools
+import hashlib
 import json
 import os
+import random
+import re
 import time
 
 import endpoints
@@ -17,22 +24,35 @@ from google.appengine.api import taskqueue
 from google.appengine.ext.ndb import get_multi
 from protorpc import messages
 from protorpc import message_types
+from protorpc import protojson
 from protorpc import remote
 
+from google.appengine.api import datastore_errors
 from google.appengine.api import urlfetch
 from google.appengine.ext import ndb
 from google.appengine.api import memcache
+from google.appengine.api import search
+from google.net.proto.ProtocolBuffer import ProtocolBufferDecodeError
 
 from models import Profile, ConferenceForm, Conference, ConferenceQueryForms, \
     ConferenceForms, BooleanMessage, ConflictException, StringMessage, \
     SessionForm, Session, SessionForms, SpeakerForm, Speaker, SessionByTypeForm, \
     SessionQueryForm, SessionQueryForms, SpecificQueryForm, LocationQueryForm, \
-    ConferenceDateRangeForm, ConferenceAvailableForm
+    ConferenceDateRangeForm, ConferenceAvailableForm, SeatShard, \
+    Announcement, SpeakerIndex, ConferenceSearchForm, ScheduleImportForm, \
+    ScheduleImportResultForm, Registration, WaitlistEntry, \
+    IdempotentResponse, SpeakerEmail, SpeakerForms, AttendeeForm, \
+    AttendeeForms, batch_counters, MEMCACHE_SESSIONS_VERSION_PREFIX, \
+    MEMCACHE_GENERATION_PREFIX, MEMCACHE_PROFILE_VERSION_PREFIX, \
+    MEMCACHE_REGISTRATIONS_VERSION_PREFIX, MEMCACHE_CONFERENCE_PREFIX
 from models import ProfileMiniForm
 from models import ProfileForm
 from models import TeeShirtSize
 
-from settings import WEB_CLIENT_ID
+from instrumentation import RequestStatsMiddleware
+from mailer import enqueue_mail
+from mappers import FormMapper
+from settings import WEB_CLIENT_ID, USER_ID_TYPE
 from utils import get_user_id
 
 EMAIL_SCOPE = endpoints.EMAIL_SCOPE
@@ -43,6 +63,7 @@ DEFAULTS = {
     "maxAttendees": 0,
     "seatsAvailable": 0,
     "topics": ["Default", "Topic"],
+    "seatShards": 0,
 }
 
 OPERATORS = {
@@ -61,14 +82,81 @@ FIELDS = {
     'MAX_ATTENDEES': 'maxAttendees',
 }
 
+PROFILE_MAPPER = FormMapper(
+    Profile, ProfileForm,
+    converters={'teeShirtSize': lambda size: getattr(TeeShirtSize, size)},
+    exclude=('conferenceKeysToAttend',))
+ATTENDEE_MAPPER = FormMapper(
+    Profile, AttendeeForm,
+    converters={'teeShirtSize': lambda size: getattr(TeeShirtSize, size)})
+# convert Date and Time to strings
+CONFERENCE_MAPPER = FormMapper(
+    Conference, ConferenceForm,
+    converters={'startDate': str, 'endDate': str})
+SESSION_MAPPER = FormMapper(
+    Session, SessionForm, converters={'date': str, 'startTime': str},
+    exclude=('speakerKey',))
+SPEAKER_MAPPER = FormMapper(Speaker, SpeakerForm)
+
+# model properties of the form fields not copied from the property with the
+# same name, for projection queries; None if the full entity is needed.
+# Sharded seats need seatShards, missing in conferences created before seat
+# sharding, which projection queries would leave out.
+CONFERENCE_FIELD_PROPERTIES = {
+    'websafeKey': (),
+    'organizerDisplayName': (),
+    'etag': (),
+    'notModified': (),
+    'seatsAvailable': None,
+}
+SESSION_FIELD_PROPERTIES = {
+    'websafeKey': (),
+    'speakerName': ('speakerKey',),
+}
+
 CONF_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeConferenceKey=messages.StringField(1),
 )
 
+CONF_CONDITIONAL_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    ifNoneMatch=messages.StringField(2),
+)
+
+CONDITIONAL_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    ifNoneMatch=messages.StringField(1),
+)
+
+CONF_ATTENDEES_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    pageSize=messages.IntegerField(2, variant=messages.Variant.INT32),
+    pageToken=messages.StringField(3),
+)
+
+CONF_CREATE_REQUEST = endpoints.ResourceContainer(
+    ConferenceForm,
+    idempotencyKey=messages.StringField(1),
+)
+
 SESSION_ADD_REQUEST = endpoints.ResourceContainer(
     SessionForm,
     websafeConferenceKey=messages.StringField(1),
+    idempotencyKey=messages.StringField(2),
+)
+
+SPEAKER_CREATE_REQUEST = endpoints.ResourceContainer(
+    SpeakerForm,
+    idempotencyKey=messages.StringField(1),
+)
+
+SPEAKER_SEARCH_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    query=messages.StringField(1),
+    pageSize=messages.IntegerField(2, variant=messages.Variant.INT32),
 )
 
 SESSION_BY_TYPE_REQUEST = endpoints.ResourceContainer(
@@ -78,7 +166,15 @@ SESSION_BY_TYPE_REQUEST = endpoints.ResourceContainer(
 
 SESSION_SPEAKER_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
-    websafeSpeakerKey=messages.StringField(1)
+    websafeSpeakerKey=messages.StringField(1),
+    fields=messages.StringField(2, repeated=True),
+)
+
+CONF_SESSIONS_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    ifNoneMatch=messages.StringField(2),
+    fields=messages.StringField(3, repeated=True),
 )
 
 SESSION_GET_REQUEST = endpoints.ResourceContainer(
@@ -98,8 +194,77 @@ SESSION_FIELDS = {
     'DURATION': 'duration',
 }
 
+# convert filter values to the field property type; to compare just the
+# time, startTime uses the same date stored in Datastore
+FILTER_CONVERTERS = {
+    'month': int,
+    'maxAttendees': int,
+    'duration': int,
+    'startTime': lambda value: datetime.strptime(
+        "1970-01-01 {}".format(value), "%Y-%m-%d %H:%M"),
+    'date': lambda value: datetime.strptime(value, "%Y-%m-%d"),
+}
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# keys fetched per batch, and at most per inequality field, when
+# intersecting queries
+INTERSECTION_BATCH_SIZE = 1000
+MAX_INTERSECTION_KEYS = 10000
+
+MAX_SEAT_SHARDS = 20
+NEARLY_SOLD_OUT_SEATS = 5
+SESSION_CITY_BATCH_SIZE = 100
+REGISTRATION_MIGRATION_BATCH_SIZE = 100
+WAITLIST_PROMOTION_BATCH_SIZE = 20
+IMPORT_BATCH_SIZE = 500
+EXPORT_PAGE_SIZE = 100
+# sessions per schedule export response, the rest is in the next pages
+EXPORT_MAX_SESSIONS = 1000
+# at most this many invalid rows are reported when an import is rejected
+IMPORT_MAX_ERRORS = 20
+# imports with more data characters than this are rejected
+IMPORT_MAX_DATA_LENGTH = 1000000
+CONFERENCE_SEARCH_INDEX = 'conferences'
+CONFERENCE_INDEX_BATCH_SIZE = 100
+# words are indexed by all their prefixes within this length range
+SEARCH_PREFIX_LENGTHS = (2, 20)
+SPEAKER_PREFIX_LENGTHS = (1, 10)
+# speakers read at most by a search with words longer than the prefixes
+SPEAKER_SEARCH_MAX_SCAN = 1000
+# speaker emails claimed per transaction, each Speaker and SpeakerEmail
+# being in its own entity group within the 25 of a cross-group one
+SPEAKER_EMAIL_BATCH_SIZE = 12
+SPEAKER_INDEX_BATCH_SIZE = 100
+# featured speaker tasks of a conference enqueued within this many seconds
+# are coalesced into one
+FEATURED_SPEAKER_TASK_DELAY = 10
+
 MEMCACHE_ANNOUNCEMENTS_KEY = "RECENT ANNOUNCEMENTS"
+MEMCACHE_NEARLY_SOLD_OUT_KEY = "NEARLY SOLD OUT"
+MEMCACHE_SEATS_PREFIX = "SEATS AVAILABLE "
+CONFERENCE_CACHE_TTL = 600
+# placeholder stored while a conference view is read, so the fill can be
+# compare-and-set and loses to an invalidation
+CONFERENCE_FILL_MARKER = "FILLING"
+CONFERENCE_FILL_TTL = 30
+MEMCACHE_CACHE_STATS_PREFIX = "CACHE STATS "
+MEMCACHE_QUERY_PREFIX = "CONFERENCE QUERY "
+QUERY_CACHE_TTL = 600
+MEMCACHE_IDEMPOTENCY_PREFIX = "IDEMPOTENT RESPONSE "
+MEMCACHE_SPEAKER_SEARCH_PREFIX = "SPEAKER SEARCH "
+# retries are replayed for a day, and a request whose first try died
+# without storing a response runs again after a minute
+IDEMPOTENCY_KEY_TTL = 24 * 3600
+IDEMPOTENCY_RESERVATION_TTL = 60
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+CACHES = ('conference', 'query', 'speaker')
 MEMCACHE_FEATURED_SPEAKER = "FEATURED SPEAKER"
+MEMCACHE_FEATURED_SPEAKERS_PREFIX = "FEATURED SPEAKERS "
+# query shapes whose projection failed, fetched as full entities for the
+# life of the instance
+_unprojectable_shapes = set()
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 
@@ -113,61 +278,81 @@ class ConferenceApi(remote.Service):
     # - - - Profile objects - - - - - - - - - - - - - - - - - - -
 
     @staticmethod
-    def _copy_profile_to_form(prof):
+    def _copy_profile_to_form(prof, conference_keys):
         """
         Copy relevant fields from Profile to ProfileForm.
 
         Args:
             prof: The Profile object.
+            conference_keys: The websafe keys of the conferences the user is
+            registered for.
 
         Returns:
             A ProfileForm object with relevant fields from Profile
         """
-        pf = ProfileForm()
-        for field in pf.all_fields():
-            if hasattr(prof, field.name):
-                # convert t-shirt string to Enum; just copy others
-                if field.name == 'teeShirtSize':
-                    setattr(pf, field.name,
-                            getattr(TeeShirtSize, getattr(prof, field.name)))
-                else:
-                    setattr(pf, field.name, getattr(prof, field.name))
-        pf.check_initialized()
+        pf = PROFILE_MAPPER.to_form(prof,
+                                    conferenceKeysToAttend=conference_keys)
+        PROFILE_MAPPER.check_initialized(pf)
         return pf
 
-    @staticmethod
-    def _get_profile_from_user():
+    def _get_current_user(self):
         """
-        Return user Profile from datastore, creating new one if non-existent.
+        Return current user and user id, resolved once per request.
 
         Returns:
-            A Profile object from current user
+            A tuple with the current user and its user id.
 
         Raises:
             endpoints.UnauthorizedException: An error if current user is not
             logged in.
         """
-        user = endpoints.get_current_user()
-        if not user:
-            # Raise unauthorized exception if user not logged in
-            raise endpoints.UnauthorizedException('Authorization required')
+        if getattr(self, '_current_user', None) is None:
+            user = endpoints.get_current_user()
+            if not user:
+                # Raise unauthorized exception if user not logged in
+                raise endpoints.UnauthorizedException('Authorization required')
+            self._current_user = (user, get_user_id(user, USER_ID_TYPE))
+        return self._current_user
 
-        # Generate a new key of kind Profile from user id
-        p_key = ndb.Key(Profile, get_user_id(user))
+    def _get_profile_from_user(self):
+        """
+        Return user Profile from datastore, creating new one if non-existent.
+        The Profile is memoized for the request, but always read again inside
+        transactions so they see the committed Profile. Legacy registrations
+        of the Profile are migrated first, see _migrate_profile_registrations.
 
-        # Get profile from Datastore
-        profile = p_key.get()
+        Returns:
+            A Profile object from current user
 
-        # Create profile with current user info if profile is not stored
-        if not profile:
-            profile = Profile(
-                key=p_key,
+        Raises:
+            endpoints.UnauthorizedException: An error if current user is not
+            logged in.
+        """
+        profile = getattr(self, '_profile', None)
+        if profile is None or ndb.in_transaction():
+            user, user_id = self._get_current_user()
+            # Get profile from Datastore, creating it with current user info
+            # if profile is not stored
+            profile = Profile.get_or_insert(
+                user_id,
                 displayName=user.nickname(),
                 mainEmail=user.email()
             )
-            profile.put()
+            if profile.conferenceKeysToAttend and not ndb.in_transaction():
+                profile = self._migrate_profile_registrations(profile.key)
+            self._profile = profile
         return profile  # return Profile
 
+    def _get_profile_key(self):
+        """
+        Return the key of the current user Profile, without reading it.
+
+        Returns:
+            A Profile key.
+        """
+        user, user_id = self._get_current_user()
+        return ndb.Key(Profile, user_id)
+
     def _do_profile(self, save_request=None):
         """
         Get user Profile and return to ProfileForm, possibly updating it first.
@@ -183,6 +368,7 @@ class ConferenceApi(remote.Service):
 
         # if save_request, process user-modifiable fields
         if save_request:
+            display_name = prof.displayName
             for field in ('displayName', 'teeShirtSize'):
                 if hasattr(save_request, field):
                     val = getattr(save_request, field)
@@ -190,8 +376,15 @@ class ConferenceApi(remote.Service):
                         setattr(prof, field, str(val))
             # Put profile to Datastore
             prof.put()
+            # organizer name is cached along with user conferences
+            if prof.displayName != display_name:
+                c_keys = Conference.query(ancestor=prof.key).fetch(
+                    keys_only=True)
+                self._invalidate_conference_views(
+                    [c_key.urlsafe() for c_key in c_keys])
         # return ProfileForm
-        return self._copy_profile_to_form(prof)
+        return self._copy_profile_to_form(
+            prof, self._get_registered_conference_keys(prof.key))
 
     @endpoints.method(message_types.VoidMessage, ProfileForm,
                       path='profile', http_method='GET', name='getProfile')
@@ -221,37 +414,358 @@ class ConferenceApi(remote.Service):
         """
         return self._do_profile(request)
 
+    # - - - Idempotency keys - - - - - - - - - - - - - - - - - -
+
+    def _get_idempotency_key(self, request):
+        """
+        Return the idempotency key of a create request, read from the
+        idempotencyKey parameter or the Idempotency-Key header.
+
+        Args:
+            request: The request sent to this API endpoint.
+
+        Returns:
+            The idempotency key, None if not given.
+
+        Raises:
+            endpoints.BadRequestException: An error if the key is too long.
+        """
+        key = getattr(request, 'idempotencyKey', None)
+        if not key:
+            headers = getattr(self.request_state, 'headers', None) or {}
+            key = headers.get('Idempotency-Key')
+        if key and len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+            raise endpoints.BadRequestException(
+                "Idempotency key must have at most {} characters.".format(
+                    MAX_IDEMPOTENCY_KEY_LENGTH))
+        return key or None
+
+    @staticmethod
+    def _get_request_hash(request):
+        """
+        Return the hash of a create request, without its idempotency key, so
+        a key sent as a parameter or as a header hashes the same request.
+
+        Args:
+            request: The request sent to this API endpoint.
+
+        Returns:
+            The hex md5 digest of the request fields.
+        """
+        # clear the key on a copy, the create function reads the request
+        data = json.loads(protojson.encode_message(request))
+        data.pop('idempotencyKey', None)
+        return hashlib.md5(json.dumps(data, sort_keys=True)).hexdigest()
+
+    @staticmethod
+    @ndb.transactional
+    def _reserve_idempotency_key(r_key, request_hash):
+        """
+        Return the stored response of an idempotency key, or reserve the key
+        for the current request if it is new or expired.
+
+        Args:
+            r_key: The IdempotentResponse key.
+            request_hash: The hash of the current request.
+
+        Returns:
+            The IdempotentResponse of a previous request, None if the key was
+            reserved. Its response is None while the request is running.
+        """
+        record = r_key.get()
+        if record:
+            age = (datetime.utcnow() - record.created).total_seconds()
+            if age < (IDEMPOTENCY_KEY_TTL if record.response is not None
+                      else IDEMPOTENCY_RESERVATION_TTL):
+                return record
+        IdempotentResponse(key=r_key, requestHash=request_hash).put()
+        return None
+
+    def _idempotent(self, request, response_class, create):
+        """
+        Run a create function once per idempotency key of the current user.
+        The first response is stored in memcache and Datastore, and retries
+        get it back without any write, ID allocation or task.
+        Requests without idempotency key always run.
+
+        Args:
+            request: The request sent to this API endpoint.
+            response_class: The ProtoRPC Message class of the response.
+            create: The function creating the object from the request and
+            returning the response.
+
+        Returns:
+            A response_class object.
+
+        Raises:
+            ConflictException: If the key was used for a different request or
+            its first request is still running.
+        """
+        key = self._get_idempotency_key(request)
+        if not key:
+            return create(request)
+        user, user_id = self._get_current_user()
+        r_id = hashlib.md5(repr((user_id, create.__name__, key))).hexdigest()
+        request_hash = self._get_request_hash(request)
+        cache_key = MEMCACHE_IDEMPOTENCY_PREFIX + r_id
+
+        stored = memcache.get(cache_key)
+        if stored is None:
+            r_key = ndb.Key(IdempotentResponse, r_id)
+            record = self._reserve_idempotency_key(r_key, request_hash)
+            if record is None:
+                try:
+                    response = create(request)
+                except Exception:
+                    # let the client retry with the same key
+                    r_key.delete()
+                    raise
+                stored = (request_hash, protojson.encode_message(response))
+                IdempotentResponse(key=r_key, requestHash=request_hash,
+                                   response=stored[1]).put()
+                memcache.set(cache_key, stored, time=IDEMPOTENCY_KEY_TTL)
+                return response
+            if record.response is None:
+                raise ConflictException(
+                    "A request with this idempotency key is in progress.")
+            stored = (record.requestHash, record.response)
+            memcache.set(cache_key, stored, time=IDEMPOTENCY_KEY_TTL)
+
+        if stored[0] != request_hash:
+            raise ConflictException(
+                "Idempotency key already used for a different request.")
+        return protojson.decode_message(response_class, stored[1])
+
     # - - - Conference objects - - - - - - - - - - - - - - - - -
 
     @staticmethod
-    def _copy_conference_to_form(conf, displayName):
+    def _copy_conference_to_form(conf, displayName, seats=None, fields=None):
         """
         Copy relevant fields from Conference to ConferenceForm.
 
         Args:
             conf: The Conference object.
             displayName: The name of the conference organizer.
+            seats: The seats available summed over the conference seat
+            shards. None if the conference seats are not sharded.
+            fields: A frozenset of the ConferenceForm fields to copy, None
+            for all fields. See _get_fields.
 
         Returns:
             A ConferenceForm with relevant Conference fields.
         """
-        cf = ConferenceForm()
-        for field in cf.all_fields():
-            if hasattr(conf, field.name):
-                # convert Date to date string; just copy others
-                if field.name.endswith('Date'):
-                    setattr(cf, field.name, str(getattr(conf, field.name)))
-                else:
-                    setattr(cf, field.name, getattr(conf, field.name))
-            elif field.name == "websafeKey":
-                setattr(cf, field.name, conf.key.urlsafe())
-        if displayName:
+        cf = CONFERENCE_MAPPER.to_form(conf, fields,
+                                       websafeKey=conf.key.urlsafe())
+        if displayName and (fields is None or
+                            'organizerDisplayName' in fields):
             setattr(cf, 'organizerDisplayName', displayName)
-        cf.check_initialized()
+        if seats is not None and (fields is None or
+                                  'seatsAvailable' in fields):
+            setattr(cf, 'seatsAvailable', seats)
+        CONFERENCE_MAPPER.check_initialized(cf, fields)
         return cf
 
+    def _copy_conferences_to_forms(self, conferences, displayName="",
+                                   fields=None):
+        """
+        Copy a set of Conferences to ConferenceForms, resolving the seats of
+        sharded conferences in a single batch.
+
+        Args:
+            conferences: An iterable of Conference objects (or a Conference
+            query). None items, e.g. from get_multi of deleted keys, are
+            skipped.
+            displayName: The name of the conferences organizer.
+            fields: A frozenset of the ConferenceForm fields to copy, None
+            for all fields.
+
+        Returns:
+            A ConferenceForms object with a ConferenceForm per Conference.
+        """
+        conferences = [conf for conf in conferences if conf]
+        seats = {}
+        if fields is None or 'seatsAvailable' in fields:
+            seats = self._get_sharded_seats(conferences)
+        return ConferenceForms(
+            items=[self._copy_conference_to_form(
+                conf, displayName, seats.get(conf.key.urlsafe()), fields)
+                for conf in conferences]
+        )
+
+    # - - - Conference cache - - - - - - - - - - - - - - - - - - -
+
+    @staticmethod
+    def _record_cache_access(cache, hit):
+        """
+        Increment the hit or miss counter of a cache in memcache.
+
+        Args:
+            cache: The name of the cache, one of CACHES.
+            hit (bool): True for a cache hit and False for a miss.
+        """
+        memcache.incr('{}{} {}'.format(MEMCACHE_CACHE_STATS_PREFIX, cache,
+                                       'hits' if hit else 'misses'),
+                      initial_value=0)
+
+    @staticmethod
+    def _get_cache_stats():
+        """
+        Return the hit and miss counters and the hit rate of every cache.
+
+        Returns:
+            A dict with a dict of 'hits' and 'misses' counters and 'hitRate'
+            by cache name.
+        """
+        keys = ['{} {}'.format(cache, counter) for cache in CACHES
+                for counter in ('hits', 'misses')]
+        counters = memcache.get_multi(keys,
+                                      key_prefix=MEMCACHE_CACHE_STATS_PREFIX)
+        stats = {cache: {counter: counters.get(
+            '{} {}'.format(cache, counter), 0)
+            for counter in ('hits', 'misses')} for cache in CACHES}
+        for cache_stats in stats.values():
+            accesses = cache_stats['hits'] + cache_stats['misses']
+            cache_stats['hitRate'] = (float(cache_stats['hits']) / accesses
+                                      if accesses else None)
+        return stats
+
+    @staticmethod
+    def _get_conference_view(wsck):
+        """
+        Return Conference and its organizer display name, read through
+        memcache. The cache is filled with compare-and-set on a placeholder
+        added before reading Datastore, so a fill racing an invalidation
+        fails instead of caching a stale view.
+
+        Args:
+            wsck: The websafe key of the conference.
+
+        Returns:
+            A tuple with the Conference object and the organizer display name.
+            (None, None) if conference not found.
+        """
+        key = MEMCACHE_CONFERENCE_PREFIX + wsck
+        client = memcache.Client()
+        view = client.gets(key)
+        hit = isinstance(view, tuple)
+        ConferenceApi._record_cache_access('conference', hit)
+        if hit:
+            return view
+        if view is None:
+            client.add(key, CONFERENCE_FILL_MARKER, time=CONFERENCE_FILL_TTL)
+            client.gets(key)
+
+        conf = ndb.Key(urlsafe=wsck).get()
+        if not conf:
+            return None, None
+        prof = conf.key.parent().get()
+        view = (conf, getattr(prof, 'displayName', None))
+        # fails if the placeholder was deleted by an invalidation meanwhile
+        client.cas(key, view, time=CONFERENCE_CACHE_TTL)
+        return view
+
+    @staticmethod
+    def _invalidate_conference_views(wscks):
+        """
+        Delete cached conference views, after Conference or organizer
+        Profile changes.
+
+        Args:
+            wscks: A list of websafe keys of conferences.
+        """
+        if wscks:
+            memcache.delete_multi(wscks,
+                                  key_prefix=MEMCACHE_CONFERENCE_PREFIX)
+
+    # - - - Conditional GET - - - - - - - - - - - - - - - - - - -
+
+    @staticmethod
+    def _make_etag(*parts):
+        """
+        Return an ETag hashed from the version stamps of a response.
+
+        Args:
+            *parts: The values the response depends on.
+
+        Returns:
+            A string with the ETag.
+        """
+        return hashlib.md5(repr(parts)).hexdigest()
+
+    def _check_not_modified(self, request, etag):
+        """
+        Return whether the client already has the response, in which case
+        endpoints answer with only the ETag and notModified set instead of
+        the full payload. The client ETag is read from the ifNoneMatch
+        parameter or the If-None-Match header.
+
+        Args:
+            request: The request sent to this API endpoint.
+            etag: The ETag of the current response.
+
+        Returns:
+            True if the client ETag matches, False otherwise.
+        """
+        if_none_match = getattr(request, 'ifNoneMatch', None)
+        if not if_none_match:
+            headers = getattr(self.request_state, 'headers', None) or {}
+            if_none_match = headers.get('If-None-Match')
+        if not if_none_match:
+            return False
+        client_etags = [e.strip().strip('"') for e in
+                        if_none_match.replace('W/', '').split(',')]
+        return '*' in client_etags or etag in client_etags
+
+    @staticmethod
+    def _get_counters(keys):
+        """
+        Return memcache version counters, bumped by models.bump_counter,
+        read at once.
+
+        Args:
+            keys: The memcache keys of the counters.
+
+        Returns:
+            A list with an int version per key.
+        """
+        versions = memcache.get_multi(keys)
+        missing = [key for key in keys if key not in versions]
+        if missing:
+            # start from the current time so an evicted version is not reused
+            memcache.add_multi(dict.fromkeys(missing,
+                                             int(time.time() * 1000)))
+            versions.update(memcache.get_multi(missing))
+        return [versions.get(key) for key in keys]
+
+    @staticmethod
+    def _get_counter(key):
+        """
+        Return a memcache version counter, bumped by models.bump_counter.
+
+        Args:
+            key: The memcache key of the counter.
+
+        Returns:
+            An int with the version.
+        """
+        return ConferenceApi._get_counters([key])[0]
+
     @staticmethod
-    def _create_conference_object(request):
+    def _get_sessions_version(c_key):
+        """
+        Return the version of the sessions of a conference, bumped by
+        Session puts.
+
+        Args:
+            c_key: The Conference key.
+
+        Returns:
+            An int with the version.
+        """
+        return ConferenceApi._get_counter(
+            MEMCACHE_SESSIONS_VERSION_PREFIX + c_key.urlsafe())
+
+    def _create_conference_object(self, request):
         """
         Create or update Conference object, returning ConferenceForm/request.
 
@@ -259,7 +773,8 @@ class ConferenceApi(remote.Service):
             request: The request sent to this API endpoint.
 
         Returns:
-            Updated request.
+            A ConferenceForm with the request fields, the values set on
+            creation and the websafe key of the new conference.
 
         Raises:
             endpoints.UnauthorizedException: An error if current user is not
@@ -267,20 +782,73 @@ class ConferenceApi(remote.Service):
             endpoints.BadRequestException: An error if request does not have a
             name field. This field is required.
         """
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required')
-        user_id = get_user_id(user)
+        user, user_id = self._get_current_user()
+        data = self._conference_data(request)
+
+        # make Profile Key from user ID
+        p_key = ndb.Key(Profile, user_id)
+        # allocate new Conference ID with Profile key as parent
+        c_id = Conference.allocate_ids(size=1, parent=p_key)[0]
+        # make Conference key from ID
+        c_key = ndb.Key(Conference, c_id, parent=p_key)
+        data['key'] = c_key
+        data['organizerUserId'] = request.organizerUserId = user_id
+
+        # create Conference & return (modified) ConferenceForm
+        conf = Conference(**data)
+        ndb.put_multi([conf] + self._make_seat_shards(conf))
+
+        form = ConferenceForm(**{
+            name: value for name, value in
+            CONFERENCE_MAPPER.to_dict(request).iteritems()
+            if value is not None})
+        form.websafeKey = c_key.urlsafe()
+        # send email to organizer confirming
+        self._enqueue_confirmation_email(user.email(), repr(form))
+        return form
+
+    @staticmethod
+    def _enqueue_confirmation_email(email, conference_info):
+        """
+        Queue the email confirming a Conference creation to its organizer,
+        sent in a batch by the send emails cron job.
+
+        Args:
+            email: The organizer email address.
+            conference_info: The text describing the conference.
+        """
+        enqueue_mail(email, 'You created a new Conference!',
+                     'Hi, you have created the following '
+                     'conference:\r\n\r\n%s' % conference_info)
+
+    @staticmethod
+    def _conference_data(request):
+        """
+        Copy a ConferenceForm into a dict of Conference fields, adding default
+        values and converting dates. The request is updated with the values
+        set on creation.
+
+        Args:
+            request: The ConferenceForm.
+
+        Returns:
+            A dict of Conference fields, without key and organizerUserId.
 
+        Raises:
+            endpoints.BadRequestException: An error if request does not have a
+            name field. This field is required.
+            ValueError: An error if a date is not in the format YYYY-mm-dd.
+        """
         if not request.name:
             raise endpoints.BadRequestException(
                 "Conference 'name' field required")
 
         # copy ConferenceForm/ProtoRPC Message into dict
-        data = {field.name: getattr(request, field.name) for field in
-                request.all_fields()}
-        del data['websafeKey']
-        del data['organizerDisplayName']
+        data = CONFERENCE_MAPPER.to_dict(request)
+        # outbound only fields
+        for name in ('websafeKey', 'organizerDisplayName', 'etag',
+                     'notModified'):
+            del data[name]
 
         # add default values for those missing (both data model & outbound
         # Message)
@@ -307,125 +875,447 @@ class ConferenceApi(remote.Service):
             data["seatsAvailable"] = data["maxAttendees"]
             setattr(request, "seatsAvailable", data["maxAttendees"])
 
-        # make Profile Key from user ID
-        p_key = ndb.Key(Profile, user_id)
-        # allocate new Conference ID with Profile key as parent
-        c_id = Conference.allocate_ids(size=1, parent=p_key)[0]
-        # make Conference key from ID
-        c_key = ndb.Key(Conference, c_id, parent=p_key)
-        data['key'] = c_key
-        data['organizerUserId'] = request.organizerUserId = user_id
-
-        # create Conference & return (modified) ConferenceForm
-        Conference(**data).put()
-
-        # send email to organizer confirming
-        taskqueue.add(params={'email': user.email(),
-                              'conferenceInfo': repr(request)},
-                      url='/tasks/send_confirmation_email'
-                      )
-        return request
+        # number of seat shards can't be greater than the seats available
+        data["seatShards"] = max(0, min(data["seatShards"], MAX_SEAT_SHARDS,
+                                        data["seatsAvailable"]))
+        setattr(request, "seatShards", data["seatShards"])
+        return data
 
-    @endpoints.method(ConferenceForm, ConferenceForm, path='conference',
+    @endpoints.method(CONF_CREATE_REQUEST, ConferenceForm, path='conference',
                       http_method='POST', name='createConference')
     def create_conference(self, request):
         """
         API endpoint to create new conference and stores it to Datastore.
+        Retries with the same idempotencyKey get the first response back.
 
         Args:
-            request: The request sent to this API endpoint.
+            request: The CONF_CREATE_REQUEST request sent to this API
+            endpoint.
 
         Returns:
-            Updated request.
+            A ConferenceForm of the new conference.
         """
-        return self._create_conference_object(request)
+        return self._idempotent(request, ConferenceForm,
+                                self._create_conference_object)
 
-    def _get_query(self, request):
+    def _run_conference_query(self, request, projection=None):
         """
-        Return formatted query from the submitted filters.
+        Run the queries of the submitted filters, reading the keys of the
+        page of results through memcache. Cache entries are keyed by the
+        normalized filters, in any order, the projection, the page and the
+        Conference generation bumped on any Conference write, so a write
+        invalidates all of them at once.
 
         Args:
             request: The request sent to this API endpoint.
+            projection: The properties to project the queries on, on a cache
+            miss, None to fetch full entities. See _get_projection.
 
         Returns:
-            A query object after applying the filters.
+            A tuple with the list of Conferences and the token of the next
+            page. See _run_queries.
+        """
+        inequality_fields, filters = self._format_filters(request.filters)
+        generation = self._get_counter(
+            MEMCACHE_GENERATION_PREFIX + Conference._get_kind())
+        cache_key = MEMCACHE_QUERY_PREFIX + hashlib.md5(repr((
+            generation,
+            sorted((filtr['field'], filtr['operator'], filtr['value'])
+                   for filtr in filters),
+            sorted(projection or ()),
+            request.pageSize, request.pageToken))).hexdigest()
+        cached = memcache.get(cache_key)
+        self._record_cache_access('query', cached is not None)
+        if cached is not None:
+            keys, next_page_token = cached
+            return [conf for conf in get_multi(keys) if conf], next_page_token
+
+        conferences, next_page_token = self._run_queries(
+            self._build_queries(Conference.query(), Conference,
+                                inequality_fields, filters),
+            request, projection)
+        memcache.set(cache_key, ([conf.key for conf in conferences],
+                                 next_page_token), time=QUERY_CACHE_TTL)
+        return conferences, next_page_token
+
+    @staticmethod
+    def _build_queries(query, model, inequality_fields, filters):
         """
-        q = Conference.query()
-        inequality_filter, filters = self._format_filters(request.filters)
+        Build the queries to run for formatted filters.
+        With inequalities on one field at most, a single query sorted by the
+        inequality field, name and key is built; the key order lets queries
+        with a '!=' filter, which run as several queries, page with cursors.
+        Otherwise, a query per inequality field is built with the equality
+        filters and the inequality filters of that field, sorted by that
+        field and key, to be run keys-only and intersected.
+
+        Args:
+            query: The base query object, e.g. with the ancestor set.
+            model: The model class of the query kind.
+            inequality_fields: The list of fields with inequality filters.
+            filters: The list of formatted filters.
 
-        # If exists, sort on inequality filter first
-        if not inequality_filter:
-            q = q.order(Conference.name)
+        Returns:
+            A list of query objects.
+        """
+        if len(inequality_fields) <= 1:
+            # If exists, sort on inequality filter first
+            if inequality_fields:
+                query = query.order(ndb.GenericProperty(inequality_fields[0]))
+            query = query.order(model.name, model.key)
+            field_filters = [(query, filters)]
         else:
-            q = q.order(ndb.GenericProperty(inequality_filter))
-            q = q.order(Conference.name)
+            equality_filters = [filtr for filtr in filters
+                                if filtr["operator"] == "="]
+            field_filters = [(
+                query.order(ndb.GenericProperty(field), model.key),
+                equality_filters + [
+                    filtr for filtr in filters if filtr["field"] == field and
+                    filtr["operator"] != "="])
+                for field in inequality_fields]
+
+        queries = []
+        for q, q_filters in field_filters:
+            for filtr in q_filters:
+                formatted_query = ndb.query.FilterNode(filtr["field"],
+                                                       filtr["operator"],
+                                                       filtr["value"])
+                q = q.filter(formatted_query)
+            queries.append(q)
+        return queries
+
+    def _run_queries(self, queries, request, projection=None):
+        """
+        Run queries built by _build_queries and fetch a page of results.
+        Multiple queries run in parallel keys-only, fetching all their keys
+        in batches of INTERSECTION_BATCH_SIZE. Their keys are intersected and
+        sorted, and only the entities of the requested page are fetched, in
+        a single batch.
+
+        Args:
+            queries: The list of query objects.
+            request: The request with pageSize and pageToken fields.
+            projection: The properties to project a single query on, None to
+            fetch full entities. See _get_projection.
 
-        for filtr in filters:
-            if filtr["field"] in ["month", "maxAttendees"]:
-                filtr["value"] = int(filtr["value"])
-            formatted_query = ndb.query.FilterNode(filtr["field"],
-                                                   filtr["operator"],
-                                                   filtr["value"])
-            q = q.filter(formatted_query)
-        return q
+        Returns:
+            A tuple with the list of results and the token of the next page.
+            The token is None if there are no more results.
+
+        Raises:
+            endpoints.BadRequestException: An error if a query matches more
+            than MAX_INTERSECTION_KEYS keys.
+        """
+        if len(queries) == 1:
+            return self._fetch_page(queries[0], request, projection)
+
+        query_keys = [[] for _ in queries]
+        futures = {i: q.fetch_page_async(INTERSECTION_BATCH_SIZE,
+                                         keys_only=True)
+                   for i, q in enumerate(queries)}
+        while futures:
+            next_futures = {}
+            for i, future in futures.items():
+                batch, cursor, more = future.get_result()
+                query_keys[i].extend(batch)
+                if len(query_keys[i]) > MAX_INTERSECTION_KEYS:
+                    raise endpoints.BadRequestException(
+                        "Too many results for inequality filters on more "
+                        "than one field, add an equality filter.")
+                if more and cursor:
+                    next_futures[i] = queries[i].fetch_page_async(
+                        INTERSECTION_BATCH_SIZE, keys_only=True,
+                        start_cursor=cursor)
+            futures = next_futures
+        keys = set(query_keys[0])
+        for q_keys in query_keys[1:]:
+            keys.intersection_update(q_keys)
+        keys, next_page_token = self._slice_page(sorted(keys), request)
+        return [entity for entity in get_multi(keys) if entity], \
+            next_page_token
 
     @staticmethod
-    def _format_filters(filters, filter_type='conference'):
+    def _get_page_size(request):
         """
-        Parse, check validity and format user supplied filters.
+        Return the page size of a request, DEFAULT_PAGE_SIZE if not given and
+        at most MAX_PAGE_SIZE.
 
         Args:
-            filters:
+            request: The request with a pageSize field.
 
         Returns:
-            A tuple with the inequality field, if used, and with the filters
-            formatted.
+            The page size.
 
         Raises:
-            endpoints.BadRequestException: An error if filter contains invalid
-            field or operator.
-            endpoints.BadRequestException: An error if more than one field is
-            using inequality operators.
+            endpoints.BadRequestException: An error if pageSize is not
+            positive.
         """
-        formatted_filters = []
-        inequality_field = None
+        page_size = request.pageSize or DEFAULT_PAGE_SIZE
+        if page_size < 1:
+            raise endpoints.BadRequestException(
+                "Request 'pageSize' must be a positive number.")
+        return min(page_size, MAX_PAGE_SIZE)
 
-        for f in filters:
-            filtr = {field.name: getattr(f, field.name) for field in
-                     f.all_fields()}
+    @staticmethod
+    def _slice_page(results, request):
+        """
+        Slice a page of an in-memory list of results using the request paging
+        fields. The page token holds the offset of the next page.
+        If neither pageSize nor pageToken are given, return all results.
+
+        Args:
+            results: The list of results.
+            request: The request with pageSize and pageToken fields.
 
+        Returns:
+            A tuple with the list of results and the token of the next page.
+            The token is None if there are no more results.
+
+        Raises:
+            endpoints.BadRequestException: An error if pageSize is not
+            positive or pageToken is invalid.
+        """
+        if not request.pageSize and not request.pageToken:
+            return results, None
+
+        page_size = ConferenceApi._get_page_size(request)
+        offset = 0
+        if request.pageToken:
             try:
-                if filter_type == 'conference':
-                    filtr["field"] = FIELDS[filtr["field"]]
-                elif filter_type == 'session':
-                    filtr["field"] = SESSION_FIELDS[filtr["field"]]
-                else:
-                    raise ValueError("'filter_type' with value {} not "
-                                     "supported. Should be 'conference' or "
-                                     "'session'".format(filter_type))
-                filtr["operator"] = OPERATORS[filtr["operator"]]
-            except KeyError:
+                offset = int(base64.urlsafe_b64decode(
+                    request.pageToken.encode('ascii')))
+            except (TypeError, ValueError, UnicodeError):
                 raise endpoints.BadRequestException(
-                    "Filter contains invalid field or operator.")
+                    "Request 'pageToken' is invalid.")
 
-            # Every operation except "=" is an inequality
-            if filtr["operator"] != "=":
-                # check if inequality operation has been used in previous
-                # filters disallow the filter if inequality was performed on
-                # a different field before track the field on which the
-                # inequality operation is performed
-                if inequality_field and inequality_field != filtr["field"]:
-                    raise endpoints.BadRequestException(
-                        "Inequality filter is allowed on only one field.")
-                else:
-                    inequality_field = filtr["field"]
+        next_page_token = None
+        if offset + page_size < len(results):
+            next_page_token = base64.urlsafe_b64encode(
+                str(offset + page_size))
+        return results[offset:offset + page_size], next_page_token
 
-            formatted_filters.append(filtr)
-        return inequality_field, formatted_filters
+    @staticmethod
+    def _fetch_page(query, request, projection=None, fetch_all=True):
+        """
+        Fetch a page of query results using the request paging fields.
+        If neither pageSize nor pageToken are given, fetch all results, or
+        the first page of DEFAULT_PAGE_SIZE results if fetch_all is False.
 
-    @endpoints.method(ConferenceQueryForms, ConferenceForms,
-                      path='queryConferences', http_method='POST',
-                      name='queryConferences')
+        Args:
+            query: The query object to fetch results from.
+            request: The request with pageSize and pageToken fields.
+            projection: The properties to project the query on, None to
+            fetch full entities. See _fetch_projected.
+            fetch_all: False to always fetch a page, for unbounded queries.
+
+        Returns:
+            A tuple with the list of results and the websafe token of the next
+            page. The token is None if there are no more results.
+
+        Raises:
+            endpoints.BadRequestException: An error if pageSize is not
+            positive or pageToken is invalid.
+        """
+        if fetch_all and not request.pageSize and not request.pageToken:
+            return ConferenceApi._fetch_projected(query, query.fetch,
+                                                  projection), None
+
+        page_size = ConferenceApi._get_page_size(request)
+
+        cursor = None
+        if request.pageToken:
+            try:
+                cursor = ndb.Cursor(urlsafe=request.pageToken)
+            except datastore_errors.BadValueError:
+                raise endpoints.BadRequestException(
+                    "Request 'pageToken' is invalid.")
+
+        results, next_cursor, more = ConferenceApi._fetch_projected(
+            query, functools.partial(query.fetch_page, page_size,
+                                     start_cursor=cursor), projection)
+        next_page_token = None
+        if more and next_cursor:
+            next_page_token = next_cursor.urlsafe()
+        return results, next_page_token
+
+    # - - - Sparse fieldsets - - - - - - - - - - - - - - - - - - -
+
+    @staticmethod
+    def _get_fields(request, form_class):
+        """
+        Return the form fields requested by the sparse fields parameter,
+        always with the required ones.
+
+        Args:
+            request: The request with a fields field.
+            form_class: The form message class of the response items.
+
+        Returns:
+            A frozenset of field names, None for all fields.
+
+        Raises:
+            endpoints.BadRequestException: An error if a field is not in
+            form_class.
+        """
+        if not request.fields:
+            return None
+        unknown = set(request.fields).difference(
+            field.name for field in form_class.all_fields())
+        if unknown:
+            raise endpoints.BadRequestException(
+                "Request 'fields' has unknown fields: {}".format(
+                    ', '.join(sorted(unknown))))
+        return frozenset(request.fields).union(
+            field.name for field in form_class.all_fields()
+            if field.required)
+
+    @staticmethod
+    def _get_projection(model, fields, field_properties):
+        """
+        Return the properties of a projection query loading the requested
+        form fields. Projections need indexed properties, and repeated
+        properties would return an entity per value.
+
+        Args:
+            model: The model class of the query kind.
+            fields: A frozenset of form field names, None for all fields.
+            field_properties: A dict of the model properties of the form
+            fields not copied from the property with the same name, None if
+            the field needs the full entity.
+
+        Returns:
+            A sorted list of property names, None if full entities must be
+            loaded.
+        """
+        if fields is None:
+            return None
+        projection = set()
+        for name in fields:
+            properties = field_properties.get(name, (name,))
+            if properties is None:
+                return None
+            for prop_name in properties:
+                prop = model._properties.get(prop_name)
+                if prop is None or prop._repeated or not prop._indexed:
+                    return None
+                projection.add(prop_name)
+        return sorted(projection) or None
+
+    @staticmethod
+    def _get_query_shape(query, projection):
+        """
+        Return the shape of a query: its kind, ancestor, filtered properties
+        and operators, sort orders and projection, without filter values.
+
+        Args:
+            query: The query object.
+            projection: The list of projected property names.
+
+        Returns:
+            A hashable tuple.
+        """
+        def filter_shape(node):
+            if isinstance(node, ndb.FilterNode):
+                # name and operator, without the value
+                return node.__getnewargs__()[:2]
+            if isinstance(node, (ndb.ConjunctionNode, ndb.DisjunctionNode)):
+                return (type(node).__name__,
+                        tuple(sorted(filter_shape(n) for n in node)))
+            return repr(node)
+
+        return (query.kind, query.ancestor is not None,
+                filter_shape(query.filters) if query.filters else None,
+                repr(query.orders), tuple(projection))
+
+    @staticmethod
+    def _fetch_projected(query, fetch, projection):
+        """
+        Fetch query results projected on properties, falling back to full
+        entities when the projection is not allowed, e.g. a missing composite
+        index or a projected property with an equality filter. Shapes whose
+        projection failed are remembered for the life of the instance, so
+        they fetch full entities right away instead of paying a failed RPC
+        every time.
+
+        Args:
+            query: The query object.
+            fetch: The query fetch function, e.g. query.fetch_page with its
+            arguments bound.
+            projection: The list of property names, None to fetch full
+            entities.
+
+        Returns:
+            The result of fetch.
+        """
+        if projection:
+            shape = ConferenceApi._get_query_shape(query, projection)
+            if shape not in _unprojectable_shapes:
+                try:
+                    return fetch(projection=projection)
+                except (datastore_errors.NeedIndexError,
+                        datastore_errors.BadRequestError):
+                    _unprojectable_shapes.add(shape)
+        return fetch()
+
+    @staticmethod
+    def _format_filters(filters, filter_type='conference'):
+        """
+        Parse, check validity and format user supplied filters.
+
+        Args:
+            filters: The list of query form filters.
+            filter_type: 'conference' or 'session'.
+
+        Returns:
+            A tuple with the list of fields using inequalities, in the order
+            they appear, and with the filters formatted.
+
+        Raises:
+            endpoints.BadRequestException: An error if filter contains invalid
+            field, operator or value.
+        """
+        formatted_filters = []
+        inequality_fields = []
+
+        for f in filters:
+            filtr = {field.name: getattr(f, field.name) for field in
+                     f.all_fields()}
+
+            try:
+                if filter_type == 'conference':
+                    filtr["field"] = FIELDS[filtr["field"]]
+                elif filter_type == 'session':
+                    filtr["field"] = SESSION_FIELDS[filtr["field"]]
+                else:
+                    raise ValueError("'filter_type' with value {} not "
+                                     "supported. Should be 'conference' or "
+                                     "'session'".format(filter_type))
+                filtr["operator"] = OPERATORS[filtr["operator"]]
+            except KeyError:
+                raise endpoints.BadRequestException(
+                    "Filter contains invalid field or operator.")
+
+            if filtr["field"] in FILTER_CONVERTERS:
+                try:
+                    filtr["value"] = FILTER_CONVERTERS[filtr["field"]](
+                        filtr["value"])
+                except (TypeError, ValueError):
+                    raise endpoints.BadRequestException(
+                        "Filter contains invalid value for field {}.".format(
+                            filtr["field"]))
+
+            # Every operation except "=" is an inequality; track the fields
+            # on which inequality operations are performed
+            if filtr["operator"] != "=" and \
+                    filtr["field"] not in inequality_fields:
+                inequality_fields.append(filtr["field"])
+
+            formatted_filters.append(filtr)
+        return inequality_fields, formatted_filters
+
+    @endpoints.method(ConferenceQueryForms, ConferenceForms,
+                      path='queryConferences', http_method='POST',
+                      name='queryConferences')
     def query_conferences(self, request):
         """
         API endpoint to query and return all conferences in the Datastore.
@@ -436,13 +1326,15 @@ class ConferenceApi(remote.Service):
         Returns:
             A set of ConferenceForms per conference.
         """
-        conferences = self._get_query(request)
+        fields = self._get_fields(request, ConferenceForm)
+        conferences, next_page_token = self._run_conference_query(
+            request, self._get_projection(
+                Conference, fields, CONFERENCE_FIELD_PROPERTIES))
 
         # return individual ConferenceForm object per Conference
-        return ConferenceForms(
-            items=[self._copy_conference_to_form(conf, "")
-                   for conf in conferences]
-        )
+        forms = self._copy_conferences_to_forms(conferences, fields=fields)
+        forms.nextPageToken = next_page_token
+        return forms
 
     @endpoints.method(message_types.VoidMessage, ConferenceForms,
                       path='getConferencesCreated', http_method='POST',
@@ -462,24 +1354,15 @@ class ConferenceApi(remote.Service):
             endpoints.UnauthorizedException: An error if current user is not
             logged in.
         """
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException("Authorization required.")
-
-        # Make profile key
-        p_key = ndb.Key(Profile, get_user_id(user))
-        # Create ancestor query for this user
-        conferences = Conference.query(ancestor=p_key)
         # Get user profile and display name
-        profile = p_key.get()
+        profile = self._get_profile_from_user()
         display_name = getattr(profile, 'displayName')
+        # Create ancestor query for this user
+        conferences = Conference.query(ancestor=profile.key)
         # Return set of ConferenceForms per Conference
-        return ConferenceForms(
-            items=[self._copy_conference_to_form(conf, display_name)
-                   for conf in conferences]
-        )
+        return self._copy_conferences_to_forms(conferences, display_name)
 
-    @endpoints.method(message_types.VoidMessage, ConferenceForms,
+    @endpoints.method(CONDITIONAL_GET_REQUEST, ConferenceForms,
                       path='conferences/attending',
                       http_method='GET', name='getConferencesToAttend')
     def get_conferences_to_attend(self, request):
@@ -490,12 +1373,23 @@ class ConferenceApi(remote.Service):
             request: The request sent to this API endpoint.
 
         Returns:
-            ConferenceForms of conferences user has registered.
-        """
-        # get user profile
+            ConferenceForms of conferences user has registered, or only the
+            ETag with notModified set if the client ETag matches.
+        """
+        # check the ETag before any Datastore call, from the versions of the
+        # user registrations, of all Conferences and of all seat shards
+        p_key = self._get_profile_key()
+        etag = self._make_etag(*self._get_counters([
+            MEMCACHE_REGISTRATIONS_VERSION_PREFIX + p_key.urlsafe(),
+            MEMCACHE_GENERATION_PREFIX + Conference._get_kind(),
+            MEMCACHE_GENERATION_PREFIX + SeatShard._get_kind()]))
+        if self._check_not_modified(request, etag):
+            return ConferenceForms(etag=etag, notModified=True)
+
+        # get user profile, migrating its legacy registrations
         profile = self._get_profile_from_user()
-        # get conferenceKeysToAttend from profile.
-        ckta = profile.conferenceKeysToAttend
+        # get the conferences of the user registrations, keys only
+        ckta = self._get_registered_conference_keys(profile.key)
         # to make a ndb key from websafe key you can use:
         # ndb.Key(urlsafe=my_websafe_key_string)
         array_of_keys = [ndb.Key(urlsafe=ck) for ck in ckta]
@@ -503,11 +1397,11 @@ class ConferenceApi(remote.Service):
         conferences = get_multi(array_of_keys)
 
         # return set of ConferenceForm objects per Conference
-        return ConferenceForms(items=[self._copy_conference_to_form(conf, "")
-                                      for conf in conferences]
-                               )
+        forms = self._copy_conferences_to_forms(conferences)
+        forms.etag = etag
+        return forms
 
-    @endpoints.method(CONF_GET_REQUEST, ConferenceForm,
+    @endpoints.method(CONF_CONDITIONAL_GET_REQUEST, ConferenceForm,
                       path='conference/{websafeConferenceKey}',
                       http_method='GET', name='getConference')
     def get_conference(self, request):
@@ -518,21 +1412,27 @@ class ConferenceApi(remote.Service):
             request: The request sent to this API endpoint.
 
         Returns:
-            A ConferenceForm whti the requested conference.
+            A ConferenceForm whti the requested conference, or only the ETag
+            with notModified set if the client ETag matches.
 
         Raises:
             endpoints.NotFoundException: An error if conference not found
         """
         # get Conference object from request; bail if not found
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        conf, display_name = self._get_conference_view(
+            request.websafeConferenceKey)
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: {}'.format(
                     request.websafeConferenceKey))
-        prof = conf.key.parent().get()
+        seats = self._get_sharded_seats([conf]).get(conf.key.urlsafe())
+        etag = self._make_etag(conf.version, display_name, seats)
+        if self._check_not_modified(request, etag):
+            return ConferenceForm(etag=etag, notModified=True)
         # return ConferenceForm
-        return self._copy_conference_to_form(conf,
-                                             getattr(prof, 'displayName'))
+        form = self._copy_conference_to_form(conf, display_name, seats)
+        form.etag = etag
+        return form
 
     @endpoints.method(ConferenceDateRangeForm, ConferenceForms,
                       path='conference/range', http_method='POST',
@@ -565,10 +1465,12 @@ class ConferenceApi(remote.Service):
         conferences = conferences.filter(Conference.startDate < end_date)
         # order by conference start date
         conferences.order(Conference.startDate)
+        fields = self._get_fields(request, ConferenceForm)
+        conferences = self._fetch_projected(
+            conferences, conferences.fetch, self._get_projection(
+                Conference, fields, CONFERENCE_FIELD_PROPERTIES))
         # return set of ConferenceForm objects per Conference
-        return ConferenceForms(items=[self._copy_conference_to_form(conf, "")
-                                      for conf in conferences]
-                               )
+        return self._copy_conferences_to_forms(conferences, fields=fields)
 
     @endpoints.method(ConferenceAvailableForm, ConferenceForms,
                       path='conference/available', http_method='POST',
@@ -602,9 +1504,11 @@ class ConferenceApi(remote.Service):
         # sort conferences by name
         conferences = conferences.order(Conference.seatsAvailable)
         conferences = conferences.order(Conference.name)
-        return ConferenceForms(items=[self._copy_conference_to_form(conf, "")
-                                      for conf in conferences]
-                               )
+        fields = self._get_fields(request, ConferenceForm)
+        conferences = self._fetch_projected(
+            conferences, conferences.fetch, self._get_projection(
+                Conference, fields, CONFERENCE_FIELD_PROPERTIES))
+        return self._copy_conferences_to_forms(conferences, fields=fields)
 
     @endpoints.method(message_types.VoidMessage, ConferenceForms,
                       path='filterPlayground', http_method='GET',
@@ -634,17 +1538,490 @@ class ConferenceApi(remote.Service):
         q = q.filter(Conference.month == 6)
 
         # Return set of ConferenceForms per Conference
-        return ConferenceForms(
-            items=[self._copy_conference_to_form(conf, "")
-                   for conf in q]
-        )
+        return self._copy_conferences_to_forms(q)
 
-    # - - - Registration - - - - - - - - - - - - - - - - - - - -
+    # - - - Conference search - - - - - - - - - - - - - - - - - -
+
+    @staticmethod
+    def _search_words(text):
+        """
+        Split text into lowercase words for the conference search index.
+
+        Args:
+            text: The text to split.
+
+        Returns:
+            A list of words.
+        """
+        return re.findall(r'\w+', (text or '').lower(), re.UNICODE)
 
+    @staticmethod
+    def _make_conference_document(conf):
+        """
+        Make the search Document of a Conference, with its name, description
+        and topics and a field with the prefixes of all their words.
+
+        Args:
+            conf: The Conference object.
+
+        Returns:
+            A search.Document with the conference websafe key as id.
+        """
+        topics = ' '.join(conf.topics)
+        words = ConferenceApi._search_words(
+            ' '.join([conf.name, conf.description or '', topics]))
+        min_length, max_length = SEARCH_PREFIX_LENGTHS
+        prefixes = {word[:i] for word in words
+                    for i in range(min_length, min(len(word), max_length) + 1)}
+        return search.Document(doc_id=conf.key.urlsafe(), fields=[
+            search.TextField(name='name', value=conf.name),
+            search.TextField(name='description',
+                             value=conf.description or ''),
+            search.TextField(name='topics', value=topics),
+            search.TextField(name='prefixes', value=u' '.join(prefixes)),
+        ])
+
+    @staticmethod
+    def _index_conferences(conferences):
+        """
+        Add or update Conferences in the conference search index.
+
+        Args:
+            conferences: A list of Conference objects.
+        """
+        if conferences:
+            search.Index(name=CONFERENCE_SEARCH_INDEX).put(
+                [ConferenceApi._make_conference_document(conf)
+                 for conf in conferences])
+
+    @staticmethod
+    def _update_conference_document(wsck):
+        """
+        Update the search document of a Conference after its name,
+        description or topics changed, or delete it if the conference was
+        deleted. Used by the index conferences task queue, enqueued by
+        Conference put and delete hooks.
+
+        Args:
+            wsck: The websafe key of the conference.
+        """
+        conf = ndb.Key(urlsafe=wsck).get()
+        if conf:
+            ConferenceApi._index_conferences([conf])
+        else:
+            search.Index(name=CONFERENCE_SEARCH_INDEX).delete(wsck)
+
+    @staticmethod
+    def _index_all_conferences(cursor=None):
+        """
+        Add a batch of Conferences to the search index, enqueueing a task for
+        the next batch. Used by the index conferences task queue to backfill
+        conferences created before the search index.
+
+        Args:
+            cursor: The websafe cursor of the batch, None for the first one.
+
+        Returns:
+            The number of conferences indexed in the batch.
+        """
+        confs, next_cursor, more = Conference.query().fetch_page(
+            CONFERENCE_INDEX_BATCH_SIZE,
+            start_cursor=ndb.Cursor(urlsafe=cursor) if cursor else None)
+        ConferenceApi._index_conferences(confs)
+        if more and next_cursor:
+            taskqueue.add(params={'cursor': next_cursor.urlsafe()},
+                          url='/tasks/index_conferences')
+        return len(confs)
+
+    @endpoints.method(ConferenceSearchForm, ConferenceForms,
+                      path='conference/search', http_method='POST',
+                      name='searchConferences')
+    def search_conferences(self, request):
+        """
+        Search conferences by words, or word prefixes, in their name,
+        description and topics. Results are ranked by how well they match.
+
+        Args:
+            request: The ConferenceSearchForm request sent to this API
+            endpoint.
+
+        Returns:
+            ConferenceForms for a page of matching conferences, with the token
+            of the next page.
+
+        Raises:
+            endpoints.BadRequestException: An error if pageSize is not
+            positive or pageToken is invalid.
+        """
+        min_length, max_length = SEARCH_PREFIX_LENGTHS
+        # every word must match a whole word or a word prefix
+        word_queries = []
+        for word in self._search_words(request.query):
+            terms = [u'{}:{}'.format(field, word)
+                     for field in ('name', 'description', 'topics')]
+            if len(word) >= min_length:
+                terms.append(u'prefixes:{}'.format(word[:max_length]))
+            word_queries.append(u'({})'.format(u' OR '.join(terms)))
+        if not word_queries:
+            return ConferenceForms(items=[])
+
+        try:
+            cursor = search.Cursor(web_safe_string=request.pageToken)
+        except ValueError:
+            raise endpoints.BadRequestException(
+                "Request 'pageToken' is invalid.")
+        results = search.Index(name=CONFERENCE_SEARCH_INDEX).search(
+            search.Query(u' '.join(word_queries), options=search.QueryOptions(
+                limit=self._get_page_size(request),
+                cursor=cursor,
+                ids_only=True,
+                sort_options=search.SortOptions(
+                    match_scorer=search.MatchScorer()))))
+
+        # fetch matching conferences at once, in ranking order
+        conferences = get_multi([ndb.Key(urlsafe=doc.doc_id)
+                                 for doc in results.results])
+        forms = self._copy_conferences_to_forms(conferences)
+        if results.cursor:
+            forms.nextPageToken = results.cursor.web_safe_string
+        return forms
+
+    # - - - Seat shards - - - - - - - - - - - - - - - - - - - -
+
+    @staticmethod
+    def _seat_shard_keys(conf):
+        """
+        Return the keys of the seat shards of a Conference.
+
+        Args:
+            conf: The Conference object.
+
+        Returns:
+            A list with a SeatShard key per conference shard.
+        """
+        wsck = conf.key.urlsafe()
+        return [ndb.Key(SeatShard, '{}:{}'.format(wsck, i))
+                for i in range(conf.seatShards)]
+
+    @staticmethod
+    def _make_seat_shards(conf):
+        """
+        Split the seats available of a new Conference over its seat shards.
+
+        Args:
+            conf: The Conference object.
+
+        Returns:
+            A list of SeatShard objects to put, empty if the conference seats
+            are not sharded.
+        """
+        wsck = conf.key.urlsafe()
+        shard_keys = ConferenceApi._seat_shard_keys(conf)
+        shards = []
+        for i, shard_key in enumerate(shard_keys):
+            # first shards take the remainder of the division
+            seats = conf.seatsAvailable // len(shard_keys)
+            if i < conf.seatsAvailable % len(shard_keys):
+                seats += 1
+            shards.append(SeatShard(key=shard_key, conferenceKey=wsck,
+                                    seatsAvailable=seats))
+        return shards
+
+    @staticmethod
+    def _get_sharded_seats(conferences, use_cache=True):
+        """
+        Sum the seat shards of sharded conferences. Sums are read from
+        memcache and only missing ones are computed from Datastore, with all
+        shards fetched at once.
+
+        Args:
+            conferences: A list of Conference objects.
+            use_cache (bool): False to always compute sums from Datastore.
+
+        Returns:
+            A dict of seats available by conference websafe key, only for
+            conferences with sharded seats.
+        """
+        wscks = [conf.key.urlsafe() for conf in conferences
+                 if conf.seatShards]
+        if not wscks:
+            return {}
+        seats = {}
+        if use_cache:
+            seats = memcache.get_multi(wscks,
+                                       key_prefix=MEMCACHE_SEATS_PREFIX)
+        missing = [conf for conf in conferences if conf.seatShards and
+                   conf.key.urlsafe() not in seats]
+        if missing:
+            shard_keys = [
+                shard_key for conf in missing
+                for shard_key in ConferenceApi._seat_shard_keys(conf)]
+            computed = {conf.key.urlsafe(): 0 for conf in missing}
+            for shard in get_multi(shard_keys):
+                if shard:
+                    computed[shard.conferenceKey] += shard.seatsAvailable
+            # cached sums may miss concurrent registrations, so expire them
+            memcache.set_multi(computed, time=60,
+                               key_prefix=MEMCACHE_SEATS_PREFIX)
+            seats.update(computed)
+        return seats
+
+    @staticmethod
+    def _sync_seat_shards():
+        """
+        Write the sum of the seat shards back to the seatsAvailable field of
+        sharded conferences, so queries on it stay accurate. Used by memcache
+        cron job.
+
+        Returns:
+            The number of conferences updated.
+        """
+        confs = Conference.query(Conference.seatShards > 0).fetch()
+        seats = ConferenceApi._get_sharded_seats(confs, use_cache=False)
+        updated = []
+        for conf in confs:
+            if conf.seatsAvailable != seats[conf.key.urlsafe()]:
+                conf.seatsAvailable = seats[conf.key.urlsafe()]
+                updated.append(conf)
+        with batch_counters():
+            ndb.put_multi(updated)
+        ConferenceApi._invalidate_conference_views(
+            [conf.key.urlsafe() for conf in updated])
+        return len(updated)
+
+    @staticmethod
     @ndb.transactional(xg=True)
+    def _seat_shard_registration(p_key, wsck, shard_key, reg=True,
+                                 promote=False):
+        """
+        Register or unregister user for a sharded conference, taking or
+        giving back a seat of a single shard.
+
+        Args:
+            p_key: The key of the user Profile.
+            wsck: The websafe key of the conference.
+            shard_key: The key of the SeatShard to use.
+            reg (bool): True to register and False to unregister.
+            promote (bool): True to register the user from the waitlist.
+
+        Returns:
+            True if success, False if user was not registered when
+            unregistering or is no longer waiting when promoted, and None if
+            the shard has no seats left.
+
+        Raises:
+            ConflictException: If user already registered for the conference.
+        """
+        reg_key = ConferenceApi._registration_key(p_key, wsck)
+        registration, entry, shard = get_multi(
+            [reg_key, ConferenceApi._waitlist_key(p_key, wsck), shard_key])
+
+        # register
+        if reg:
+            if promote and (registration or not entry):
+                return ConferenceApi._skip_waitlist_entry(entry)
+            # check if user already registered otherwise add
+            if registration:
+                raise ConflictException(
+                    "You have already registered for this conference")
+
+            # check if seats avail in this shard
+            if shard.seatsAvailable <= 0:
+                return None
+
+            # register user, take away one seat
+            shard.seatsAvailable -= 1
+            ndb.put_multi([Registration(key=reg_key,
+                                        conferenceKey=ndb.Key(urlsafe=wsck)),
+                           shard])
+            if entry:
+                entry.key.delete()
+
+        # unregister
+        else:
+            # check if user already registered
+            if not registration:
+                return False
+
+            # unregister user, add back one seat
+            shard.seatsAvailable += 1
+            shard.put()
+            reg_key.delete()
+            ConferenceApi._enqueue_waitlist_promotion(wsck)
+
+        return True
+
+    @staticmethod
+    def _sharded_conference_registration(p_key, conf, reg=True,
+                                         promote=False):
+        """
+        Register or unregister user for a conference with sharded seats.
+        Shards are tried in random order, so concurrent registrations are
+        spread over different entity groups.
+
+        Args:
+            p_key: The key of the user Profile.
+            conf: The Conference object.
+            reg (bool): True to register and False to unregister.
+            promote (bool): True to register the user from the waitlist.
+
+        Returns:
+            A tuple with True if success or False if not, and the seats
+            available after the registration. Seats are None if unknown.
+
+        Raises:
+            ConflictException: If user already registered for the conference.
+            ConflictException: If no seats available for the conference.
+        """
+        wsck = conf.key.urlsafe()
+        shards = [shard for shard in
+                  get_multi(ConferenceApi._seat_shard_keys(conf)) if shard]
+        # only try shards that seem to have seats when registering, each
+        # transaction checks it again
+        shard_keys = [shard.key for shard in shards
+                      if not reg or shard.seatsAvailable > 0]
+        random.shuffle(shard_keys)
+        for shard_key in shard_keys:
+            retval = ConferenceApi._seat_shard_registration(
+                p_key, wsck, shard_key, reg, promote)
+            if retval is not None:
+                break
+        else:
+            # without shards there is no seat to give back
+            if not reg:
+                return False, None
+            raise ConflictException(
+                "There are no seats available.")
+
+        # keep cached seats sum in sync, missing entries are recomputed
+        seats = None
+        if retval and reg:
+            seats = memcache.decr(MEMCACHE_SEATS_PREFIX + wsck)
+        elif retval:
+            seats = memcache.incr(MEMCACHE_SEATS_PREFIX + wsck)
+        return retval, seats
+
+    # - - - Registration - - - - - - - - - - - - - - - - - - - -
+
+    @staticmethod
+    def _registration_key(p_key, wsck):
+        """
+        Return the key of the Registration of a user for a conference.
+
+        Args:
+            p_key: The key of the user Profile.
+            wsck: The websafe key of the conference.
+
+        Returns:
+            A Registration key.
+        """
+        return ndb.Key(Registration, wsck, parent=p_key)
+
+    @staticmethod
+    def _get_registered_conference_keys(p_key):
+        """
+        Return the conferences a user is registered for, with a keys-only
+        ancestor query on the user Registrations.
+
+        Args:
+            p_key: The key of the user Profile.
+
+        Returns:
+            A list of conference websafe keys.
+        """
+        return [reg_key.id() for reg_key in
+                Registration.query(ancestor=p_key).fetch(keys_only=True)]
+
+    @staticmethod
+    @ndb.transactional
+    def _migrate_profile_registrations(p_key):
+        """
+        Move the legacy conferenceKeysToAttend of a Profile to Registration
+        entities. Registrations are in the Profile entity group, so the move
+        is a single group transaction. Seats were already taken.
+
+        Args:
+            p_key: The key of the Profile.
+
+        Returns:
+            The updated Profile object.
+        """
+        prof = p_key.get()
+        if not prof.conferenceKeysToAttend:
+            return prof
+        registrations = [
+            Registration(key=ConferenceApi._registration_key(p_key, wsck),
+                         conferenceKey=ndb.Key(urlsafe=wsck))
+            for wsck in set(prof.conferenceKeysToAttend)]
+        prof.conferenceKeysToAttend = []
+        ndb.put_multi(registrations + [prof])
+        return prof
+
+    @staticmethod
+    def _migrate_registrations(cursor=None):
+        """
+        Migrate the legacy registrations of a batch of Profiles, enqueueing a
+        task for the next batch. Used by the migrate registrations task
+        queue.
+
+        Args:
+            cursor: The websafe cursor of the batch, None for the first one.
+
+        Returns:
+            The number of profiles migrated in the batch.
+        """
+        profiles, next_cursor, more = Profile.query().fetch_page(
+            REGISTRATION_MIGRATION_BATCH_SIZE,
+            start_cursor=ndb.Cursor(urlsafe=cursor) if cursor else None)
+        migrated = [prof.key for prof in profiles
+                    if prof.conferenceKeysToAttend]
+        for p_key in migrated:
+            ConferenceApi._migrate_profile_registrations(p_key)
+        if more and next_cursor:
+            taskqueue.add(params={'cursor': next_cursor.urlsafe()},
+                          url='/tasks/migrate_registrations')
+        return len(migrated)
+
+    @staticmethod
+    def _register(p_key, conf, reg=True, promote=False):
+        """
+        Register or unregister a user for a conference, keeping cached
+        conference views and the nearly sold out announcement in sync.
+
+        Args:
+            p_key: The key of the user Profile.
+            conf: The Conference object.
+            reg (bool): True to register and False to unregister.
+            promote (bool): True to register the user from the waitlist.
+
+        Returns:
+            True if success or False if not.
+
+        Raises:
+            endpoints.NotFoundException: An error if conference not found.
+            ConflictException: If user already registered for the conference.
+            ConflictException: If no seats available for the conference.
+        """
+        wsck = conf.key.urlsafe()
+        if conf.seatShards:
+            retval, seats = ConferenceApi._sharded_conference_registration(
+                p_key, conf, reg, promote)
+        else:
+            retval, seats = ConferenceApi._conference_seat_registration(
+                p_key, wsck, reg, promote)
+            # cached conference has the old seatsAvailable
+            if retval:
+                ConferenceApi._invalidate_conference_views([wsck])
+        if retval and seats is not None:
+            ConferenceApi._update_nearly_sold_out(wsck, conf.name, seats)
+        return retval
+
     def _conference_registration(self, request, reg=True):
         """
-        Register or unregister user for selected conference.
+        Register or unregister user for selected conference. Unregistering
+        a user on the conference waitlist removes them from it. While the
+        conference has a waitlist, only its first user can register, so
+        freed seats go to waiting users in joined order.
 
         Args:
             request: The request sent to this API endpoint.
@@ -657,21 +2034,71 @@ class ConferenceApi(remote.Service):
             endpoints.NotFoundException: An error if conference not found.
             ConflictException: If user already registered for the conference.
             ConflictException: If no seats available for the conference.
+            ConflictException: If other users are waiting for a seat.
         """
-        prof = self._get_profile_from_user()  # get user Profile
-
         # check if conf exists given websafeConfKey
         # get conference; check that it exists
         wsck = request.websafeConferenceKey
-        conf = ndb.Key(urlsafe=wsck).get()
+        conf, _ = self._get_conference_view(wsck)
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+        # attendees are listed with their Profile, so make sure it exists and
+        # its legacy registrations are migrated
+        self._get_profile_from_user()
+        p_key = self._get_profile_key()
+
+        if reg:
+            head = self._get_waitlist_head(conf.key)
+            if head and head != p_key:
+                raise ConflictException(
+                    "Users on the waitlist are registered first, join the "
+                    "waitlist instead.")
+        retval = self._register(p_key, conf, reg)
+        if not retval and not reg:
+            retval = self._leave_waitlist(p_key, wsck)
+        return BooleanMessage(data=retval)
+
+    @staticmethod
+    @ndb.transactional(xg=True)
+    def _conference_seat_registration(p_key, wsck, reg=True, promote=False):
+        """
+        Register or unregister user for a conference without sharded seats,
+        updating the Conference seatsAvailable in the same transaction.
+
+        Args:
+            p_key: The key of the user Profile.
+            wsck: The websafe key of the conference.
+            reg (bool): True to register and False to unregister.
+            promote (bool): True to register the user from the waitlist.
+
+        Returns:
+            A tuple with True if success or False if not, and the seats
+            available after the registration. False when promoted if the
+            user is no longer waiting.
+
+        Raises:
+            endpoints.NotFoundException: An error if conference not found.
+            ConflictException: If user already registered for the conference.
+            ConflictException: If no seats available for the conference.
+        """
+        reg_key = ConferenceApi._registration_key(p_key, wsck)
+
+        # get conference; check that it exists
+        c_key = ndb.Key(urlsafe=wsck)
+        registration, entry, conf = get_multi(
+            [reg_key, ConferenceApi._waitlist_key(p_key, wsck), c_key])
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % wsck)
 
         # register
         if reg:
+            if promote and (registration or not entry):
+                return (ConferenceApi._skip_waitlist_entry(entry),
+                        conf.seatsAvailable)
             # check if user already registered otherwise add
-            if wsck in prof.conferenceKeysToAttend:
+            if registration:
                 raise ConflictException(
                     "You have already registered for this conference")
 
@@ -681,26 +2108,28 @@ class ConferenceApi(remote.Service):
                     "There are no seats available.")
 
             # register user, take away one seat
-            prof.conferenceKeysToAttend.append(wsck)
             conf.seatsAvailable -= 1
+            ndb.put_multi([Registration(key=reg_key, conferenceKey=c_key),
+                           conf])
+            if entry:
+                entry.key.delete()
             retval = True
 
         # unregister
         else:
             # check if user already registered
-            if wsck in prof.conferenceKeysToAttend:
+            if registration:
 
                 # unregister user, add back one seat
-                prof.conferenceKeysToAttend.remove(wsck)
                 conf.seatsAvailable += 1
+                conf.put()
+                reg_key.delete()
+                ConferenceApi._enqueue_waitlist_promotion(wsck)
                 retval = True
             else:
                 retval = False
 
-        # write things back to the datastore & return
-        prof.put()
-        conf.put()
-        return BooleanMessage(data=retval)
+        return retval, conf.seatsAvailable
 
     @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
                       path='conference/{websafeConferenceKey}',
@@ -727,89 +2156,438 @@ class ConferenceApi(remote.Service):
         Args:
             request: The request sent to this API endpoint.
 
-        Returns:
-            A BooleanMessage of the final status of the transaction.
+        Returns:
+            A BooleanMessage of the final status of the transaction.
+        """
+        return self._conference_registration(request, reg=False)
+
+    @endpoints.method(CONF_ATTENDEES_GET_REQUEST, AttendeeForms,
+                      path='conference/{websafeConferenceKey}/attendees',
+                      http_method='GET', name='getConferenceAttendees')
+    def get_conference_attendees(self, request):
+        """
+        Return a page of the attendees of a conference, for its organizer.
+
+        Args:
+            request: The CONF_ATTENDEES_GET_REQUEST request sent to this API
+            endpoint.
+
+        Returns:
+            AttendeeForms with an AttendeeForm per attendee Profile and the
+            token of the next page.
+
+        Raises:
+            endpoints.NotFoundException: An error if conference not found.
+            endpoints.UnauthorizedException: An error if the current user is
+            not the conference organizer.
+        """
+        conf, _ = self._get_conference_view(request.websafeConferenceKey)
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: {}'.format(
+                    request.websafeConferenceKey))
+        user, user_id = self._get_current_user()
+        if conf.organizerUserId != user_id:
+            raise endpoints.UnauthorizedException(
+                "Only the conference organizer can list attendees.")
+
+        # page through the registration keys, whose parents are the profiles
+        q = Registration.query(
+            Registration.conferenceKey == conf.key,
+            default_options=ndb.QueryOptions(keys_only=True))
+        reg_keys, next_page_token = self._fetch_page(q, request,
+                                                     fetch_all=False)
+        profiles = get_multi([reg_key.parent() for reg_key in reg_keys])
+        return AttendeeForms(
+            items=[ATTENDEE_MAPPER.to_form(prof) for prof in profiles
+                   if prof],
+            nextPageToken=next_page_token)
+
+    # - - - Waitlist - - - - - - - - - - - - - - - - - - - - - -
+
+    @staticmethod
+    def _waitlist_key(p_key, wsck):
+        """
+        Return the key of the WaitlistEntry of a user for a conference.
+
+        Args:
+            p_key: The key of the user Profile.
+            wsck: The websafe key of the conference.
+
+        Returns:
+            A WaitlistEntry key.
+        """
+        return ndb.Key(WaitlistEntry, wsck, parent=p_key)
+
+    @staticmethod
+    def _skip_waitlist_entry(entry):
+        """
+        Skip a user who is no longer waiting when promoting the waitlist,
+        removing the entry of a user who registered meanwhile.
+
+        Args:
+            entry: The WaitlistEntry object, None if the user left.
+
+        Returns:
+            False, as the user is not registered from the waitlist.
+        """
+        if entry:
+            entry.key.delete()
+        return False
+
+    @staticmethod
+    def _enqueue_waitlist_promotion(wsck):
+        """
+        Enqueue a task promoting the next user of a conference waitlist. In a
+        transaction, the task is only added if the freed seat is committed.
+
+        Args:
+            wsck: The websafe key of the conference.
+        """
+        taskqueue.add(params={'websafeConferenceKey': wsck},
+                      url='/tasks/promote_waitlist',
+                      transactional=ndb.in_transaction())
+
+    @staticmethod
+    @ndb.transactional
+    def _add_waitlist_entry(p_key, c_key):
+        """
+        Add a user to a conference waitlist.
+
+        Args:
+            p_key: The key of the user Profile.
+            c_key: The key of the Conference.
+
+        Returns:
+            True if success.
+
+        Raises:
+            ConflictException: If user already registered for the conference
+            or already on its waitlist.
+        """
+        wsck = c_key.urlsafe()
+        wait_key = ConferenceApi._waitlist_key(p_key, wsck)
+        registration, entry = get_multi(
+            [ConferenceApi._registration_key(p_key, wsck), wait_key])
+        if registration:
+            raise ConflictException(
+                "You have already registered for this conference")
+        if entry:
+            raise ConflictException(
+                "You are already on the waitlist of this conference")
+        WaitlistEntry(key=wait_key, conferenceKey=c_key).put()
+        return True
+
+    @staticmethod
+    def _leave_waitlist(p_key, wsck):
+        """
+        Remove a user from a conference waitlist.
+
+        Args:
+            p_key: The key of the user Profile.
+            wsck: The websafe key of the conference.
+
+        Returns:
+            True if the user was on the waitlist, False if not.
+        """
+        wait_key = ConferenceApi._waitlist_key(p_key, wsck)
+        if not wait_key.get():
+            return False
+        wait_key.delete()
+        return True
+
+    @staticmethod
+    def _get_waitlist_head(c_key):
+        """
+        Return the first user of a conference waitlist.
+
+        Args:
+            c_key: The key of the Conference.
+
+        Returns:
+            The Profile key of the user who joined first, None if nobody is
+            waiting.
+        """
+        entry_key = WaitlistEntry.query(
+            WaitlistEntry.conferenceKey == c_key).order(
+            WaitlistEntry.joined).get(keys_only=True)
+        return entry_key.parent() if entry_key else None
+
+    @staticmethod
+    def _promote_waitlist(wsck):
+        """
+        Register the first user of a conference waitlist, in joined order,
+        skipping users who left it or registered meanwhile. Used by the
+        promote waitlist task queue, enqueued when a seat is freed.
+
+        Args:
+            wsck: The websafe key of the conference.
+
+        Returns:
+            The Profile key of the promoted user, None if nobody was.
+        """
+        conf, _ = ConferenceApi._get_conference_view(wsck)
+        if not conf:
+            return None
+        q = WaitlistEntry.query(
+            WaitlistEntry.conferenceKey == conf.key).order(
+            WaitlistEntry.joined)
+        for entry_key in q.iter(keys_only=True,
+                                batch_size=WAITLIST_PROMOTION_BATCH_SIZE):
+            try:
+                if ConferenceApi._register(entry_key.parent(), conf,
+                                           promote=True):
+                    return entry_key.parent()
+            except ConflictException:
+                # the freed seat was taken meanwhile
+                return None
+        return None
+
+    @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
+                      path='conference/{websafeConferenceKey}/waitlist',
+                      http_method='POST', name='joinWaitlist')
+    def join_waitlist(self, request):
+        """
+        Join the waitlist of a sold out conference. Users on the waitlist are
+        registered in the order they joined as seats are freed, and leave it
+        with unregisterFromConference.
+
+        Args:
+            request: The request sent to this API endpoint.
+
+        Returns:
+            A BooleanMessage of the final status of the transaction.
+
+        Raises:
+            endpoints.NotFoundException: An error if conference not found.
+            ConflictException: If the conference has seats available.
+            ConflictException: If user already registered for the conference
+            or already on its waitlist.
+        """
+        wsck = request.websafeConferenceKey
+        conf, _ = self._get_conference_view(wsck)
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+        seats = conf.seatsAvailable
+        if conf.seatShards:
+            seats = self._get_sharded_seats([conf]).get(wsck)
+        if seats > 0:
+            raise ConflictException(
+                "There are seats available, register instead.")
+        # waiting users are registered with their Profile
+        self._get_profile_from_user()
+        return BooleanMessage(data=self._add_waitlist_entry(
+            self._get_profile_key(), conf.key))
+
+    # - - - Announcements - - - - - - - - - - - - - - - - - - - -
+
+    @staticmethod
+    def _format_announcement(nearly_sold_out):
+        """
+        Format the announcement of nearly sold out conferences.
+
+        Args:
+            nearly_sold_out: A dict of conference names by websafe key.
+
+        Returns:
+            A string with the announcement. Empty string if no conference is
+            nearly sold out.
+        """
+        if not nearly_sold_out:
+            return ""
+        return '%s %s' % (
+            'Last chance to attend! The following conferences '
+            'are nearly sold out:',
+            ', '.join(sorted(nearly_sold_out.values())))
+
+    @staticmethod
+    def _set_nearly_sold_out_cache(nearly_sold_out):
+        """
+        Set nearly sold out conferences and their announcement in memcache.
+
+        Args:
+            nearly_sold_out: A dict of conference names by websafe key.
+
+        Returns:
+            A string with the announcement.
+        """
+        announcement = ConferenceApi._format_announcement(nearly_sold_out)
+        memcache.set_multi({
+            MEMCACHE_NEARLY_SOLD_OUT_KEY: nearly_sold_out,
+            MEMCACHE_ANNOUNCEMENTS_KEY: announcement,
+        })
+        return announcement
+
+    @staticmethod
+    def _get_nearly_sold_out():
+        """
+        Return nearly sold out conferences from memcache, falling back to
+        the Datastore Announcement.
+
+        Returns:
+            A dict of conference names by websafe key.
+        """
+        nearly_sold_out = memcache.get(MEMCACHE_NEARLY_SOLD_OUT_KEY)
+        if nearly_sold_out is None:
+            announcement = ndb.Key(Announcement, 'nearly-sold-out').get()
+            nearly_sold_out = getattr(announcement, 'nearlySoldOut',
+                                      None) or {}
+            ConferenceApi._set_nearly_sold_out_cache(nearly_sold_out)
+        return nearly_sold_out
+
+    @staticmethod
+    @ndb.transactional
+    def _set_nearly_sold_out(wsck, name, nearly):
+        """
+        Add or remove a conference from the Datastore nearly sold out
+        conferences.
+
+        Args:
+            wsck: The websafe key of the conference.
+            name: The name of the conference.
+            nearly (bool): True to add and False to remove.
+
+        Returns:
+            A dict of conference names by websafe key.
+        """
+        a_key = ndb.Key(Announcement, 'nearly-sold-out')
+        announcement = a_key.get() or Announcement(key=a_key)
+        nearly_sold_out = announcement.nearlySoldOut or {}
+        if nearly:
+            nearly_sold_out[wsck] = name
+        else:
+            nearly_sold_out.pop(wsck, None)
+        announcement.nearlySoldOut = nearly_sold_out
+        announcement.put()
+        return nearly_sold_out
+
+    @staticmethod
+    def _update_nearly_sold_out(wsck, name, seats):
         """
-        return self._conference_registration(request, reg=False)
+        Update nearly sold out conferences and announcement after a
+        registration, writing only when seats cross the threshold.
 
-    # - - - Announcements - - - - - - - - - - - - - - - - - - - -
+        Args:
+            wsck: The websafe key of the conference.
+            name: The name of the conference.
+            seats: The seats available after the registration.
+        """
+        nearly = 0 < seats <= NEARLY_SOLD_OUT_SEATS
+        if (wsck in ConferenceApi._get_nearly_sold_out()) == nearly:
+            return
+        nearly_sold_out = ConferenceApi._set_nearly_sold_out(wsck, name,
+                                                             nearly)
+        ConferenceApi._set_nearly_sold_out_cache(nearly_sold_out)
 
     @staticmethod
     def _cache_announcement():
         """
-        Create Announcement & assign to memcache; used by memcache cron job &
-        putAnnouncement().
+        Rebuild nearly sold out conferences & Announcement from a query and
+        assign to memcache; used by memcache cron job to repair what
+        registrations maintain.
 
         Returns:
             A string with the announcement. Empty string if no conference found
             or string with conferences almost sold out.
         """
         confs = Conference.query(ndb.AND(
-            Conference.seatsAvailable <= 5,
+            Conference.seatsAvailable <= NEARLY_SOLD_OUT_SEATS,
             Conference.seatsAvailable > 0)
         ).fetch(projection=[Conference.name])
 
-        if confs:
-            # If there are almost sold out conferences,
-            # format announcement and set it in memcache
-            announcement = '%s %s' % (
-                'Last chance to attend! The following conferences '
-                'are nearly sold out:',
-                ', '.join(conf.name for conf in confs))
-            memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
-        else:
-            # If there are no sold out conferences,
-            # delete the memcache announcements entry
-            announcement = ""
-            memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
-
-        return announcement
+        nearly_sold_out = {conf.key.urlsafe(): conf.name for conf in confs}
+        Announcement(key=ndb.Key(Announcement, 'nearly-sold-out'),
+                     nearlySoldOut=nearly_sold_out).put()
+        return ConferenceApi._set_nearly_sold_out_cache(nearly_sold_out)
 
     @endpoints.method(message_types.VoidMessage, StringMessage,
                       path='conference/announcement/get',
                       http_method='GET', name='getAnnouncement')
     def get_announcement(self, request):
         """Return Announcement from memcache."""
-        # return an existing announcement from Memcache or an empty string.
+        # return an existing announcement from Memcache, or format it from
+        # nearly sold out conferences if evicted
         announcement = memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY)
-        if not announcement:
-            announcement = ""
+        if announcement is None:
+            announcement = self._format_announcement(
+                self._get_nearly_sold_out())
         return StringMessage(data=announcement)
 
     # - - - Sessions - - - - - - - - - - - - - - - - - - - -
 
     @staticmethod
-    def _copy_session_to_form(session):
+    def _copy_session_to_form(session, speaker=None, fields=None):
         """
         Copy relevant fields from Session to SessionForm.
 
         Args:
             session: The Session object.
+            speaker: The Speaker object of the session, already fetched from
+            Datastore. None if session has no speaker.
+            fields: A frozenset of the SessionForm fields to copy, None for
+            all fields. See _get_fields.
 
         Returns:
             A SessionForm with relevant Session fields.
         """
-        ss = SessionForm()
-        for field in ss.all_fields():
-            if hasattr(session, field.name):
-                # convert Date to date string; just copy others
-                if field.name == 'date':
-                    setattr(ss, field.name, str(getattr(session, field.name)))
-                elif field.name == 'startTime':
-                    setattr(ss, field.name, str(getattr(session, field.name)))
-                elif field.name == 'speakerKey':
-                    speaker = ndb.Key(urlsafe=getattr(session,
-                                                      field.name)).get()
-                    if speaker:
-                        setattr(ss, field.name, speaker.key.urlsafe())
-                        setattr(ss, 'speakerName', speaker.name)
-                else:
-                    setattr(ss, field.name, getattr(session, field.name))
-            elif field.name == "websafeKey":
-                setattr(ss, field.name, session.key.urlsafe())
-        ss.check_initialized()
+        ss = SESSION_MAPPER.to_form(session, fields,
+                                    websafeKey=session.key.urlsafe())
+        if speaker:
+            if fields is None or 'speakerKey' in fields:
+                ss.speakerKey = speaker.key.urlsafe()
+            if fields is None or 'speakerName' in fields:
+                ss.speakerName = speaker.name
+        SESSION_MAPPER.check_initialized(ss, fields)
         return ss
 
+    def _copy_sessions_to_forms(self, sessions, fields=None):
+        """
+        Copy a set of Sessions to SessionForms, fetching all their speakers
+        from Datastore in a single batch.
+
+        Args:
+            sessions: An iterable of Session objects (or a Session query).
+            None items, e.g. from get_multi of deleted keys, are skipped.
+            fields: A frozenset of the SessionForm fields to copy, None for
+            all fields.
+
+        Returns:
+            A SessionForms object with a SessionForm per Session.
+        """
+        sessions = [sess for sess in sessions if sess]
+        # collect distinct speaker websafe keys of the result set
+        sp_wsks = []
+        if fields is None or fields & {'speakerKey', 'speakerName'}:
+            sp_wsks = list({sess.speakerKey for sess in sessions
+                            if sess.speakerKey})
+        # fetch all speakers at once and map them by websafe key
+        speakers = dict(zip(sp_wsks, get_multi(
+            [ndb.Key(urlsafe=wsk) for wsk in sp_wsks])))
+        return SessionForms(
+            items=[self._copy_session_to_form(
+                sess, speakers.get(sess.speakerKey) if speakers else None,
+                fields) for sess in sessions]
+        )
+
+    def _fetch_session_forms(self, query, request):
+        """
+        Fetch all results of a Session query as SessionForms, projected on
+        the requested sparse fields.
+
+        Args:
+            query: The Session query object.
+            request: The request with a fields field.
+
+        Returns:
+            A SessionForms object with a SessionForm per Session.
+        """
+        fields = self._get_fields(request, SessionForm)
+        sessions = self._fetch_projected(
+            query, query.fetch, self._get_projection(
+                Session, fields, SESSION_FIELD_PROPERTIES))
+        return self._copy_sessions_to_forms(sessions, fields)
+
     def _create_session_object(self, request):
         """
         Add a Session to the Datastore with the SESSION_ADD_REQUEST request.
@@ -834,32 +2612,17 @@ class ConferenceApi(remote.Service):
                 "Session 'name' field required")
 
         # get Conference object from request; bail if not found
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        conf, _ = self._get_conference_view(request.websafeConferenceKey)
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: {}'.format(
                     request.websafeConferenceKey))
-        owner_prof = conf.key.parent().get()
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException("Authorization required.")
-        user_id = get_user_id(user)
-        if owner_prof.mainEmail != user_id:
+        user, user_id = self._get_current_user()
+        if conf.organizerUserId != user_id:
             raise endpoints.UnauthorizedException(
                 "Only the conference organizer can create sessions.")
 
-        # copy SessionForm/ProtoRPC Message into dict
-        data = {field.name: getattr(request, field.name) for field in
-                request.all_fields()}
-
-        # convert dates from strings to Date objects and startTime to Time
-        # objects
-        if data['date']:
-            data['date'] = datetime.strptime(data['date'][:10],
-                                             "%Y-%m-%d").date()
-        if data['startTime']:
-            data['startTime'] = datetime.strptime(data['startTime'],
-                                                  "%H:%M").time()
+        data = self._session_data(request)
 
         c_key = ndb.Key(urlsafe=request.websafeConferenceKey)
         # allocate new Session ID with Conference key as parent
@@ -870,29 +2633,62 @@ class ConferenceApi(remote.Service):
         data['key'] = s_key
         request.conferenceKey = request.websafeConferenceKey
         data['conferenceKey'] = request.conferenceKey
-        del data['websafeConferenceKey']
-        del data['websafeKey']
-        del data['speakerName']
+        # denormalize conference city to query sessions by location
+        data['city'] = conf.city
+
+        speaker = None
+        if data['speakerKey']:
+            speaker = ndb.Key(urlsafe=data['speakerKey']).get()
 
         # create Session & return (modified) SessionForm
         sess = Session(**data)
-        sess.put()
-
-        # check featured speaker if session have speaker
-        speaker = ndb.Key(urlsafe=sess.speakerKey).get()
         if speaker:
-            taskqueue.add(params={'speakerKey': sess.speakerKey,
-                                  'sessionKey': sess.key.urlsafe()},
-                          url='/tasks/check_featured_speaker'
-                          )
-        return self._copy_session_to_form(sess)
+            # index session by speaker in the same transaction
+            self._put_speaker_session(sess)
+            # check featured speaker if session have speaker
+            self._enqueue_featured_speakers_task(request.websafeConferenceKey)
+        else:
+            sess.put()
+        return self._copy_session_to_form(sess, speaker)
+
+    @staticmethod
+    def _session_data(request):
+        """
+        Copy a SessionForm into a dict of Session fields, converting date
+        and startTime.
+
+        Args:
+            request: The SessionForm, or a request with its fields.
+
+        Returns:
+            A dict of Session fields, without key, conferenceKey and city.
+
+        Raises:
+            ValueError: An error if date is not in the format YYYY-mm-dd or
+            startTime is not in the format HH:MM.
+        """
+        # copy SessionForm/ProtoRPC Message into dict
+        data = SESSION_MAPPER.to_dict(request)
+        del data['websafeKey']
+        del data['speakerName']
+
+        # convert dates from strings to Date objects and startTime to Time
+        # objects
+        if data['date']:
+            data['date'] = datetime.strptime(data['date'][:10],
+                                             "%Y-%m-%d").date()
+        if data['startTime']:
+            data['startTime'] = datetime.strptime(data['startTime'],
+                                                  "%H:%M").time()
+        return data
 
     @endpoints.method(SESSION_ADD_REQUEST, SessionForm,
                       path='conference/{websafeConferenceKey}/addsession',
                       http_method='POST', name='createSession')
     def create_session(self, request):
         """
-        Create a new session to the Conference.
+        Create a new session to the Conference. Retries with the same
+        idempotencyKey get the first response back.
 
         Args:
             request: The SESSION_ADD_REQUEST request sent to this API endpoint.
@@ -900,9 +2696,10 @@ class ConferenceApi(remote.Service):
         Returns:
             A SessionForm updated after storing in Datastore.
         """
-        return self._create_session_object(request)
+        return self._idempotent(request, SessionForm,
+                                self._create_session_object)
 
-    @endpoints.method(CONF_GET_REQUEST, SessionForms,
+    @endpoints.method(CONF_SESSIONS_GET_REQUEST, SessionForms,
                       path='conference/{websafeConferenceKey}/sessions',
                       http_method='GET', name='getConferenceSessions')
     def get_conference_sessions(self, request):
@@ -910,26 +2707,37 @@ class ConferenceApi(remote.Service):
         Get all Conference Sessions.
 
         Args:
-            request: The CONF_GET_REQUEST request sent to this API endpoint.
+            request: The CONF_SESSIONS_GET_REQUEST request sent to this API
+                endpoint.
 
         Returns:
-            A SessionForms object with all the sessions of the Conference.
+            A SessionForms object with all the sessions of the Conference, or
+            only the ETag with notModified set if the client ETag matches.
 
         Raises:
             endpoints.NotFoundException: An error if no conference found with
             websafeConferenceKey.
         """
         # get Conference object from request; bail if not found
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        conf, _ = self._get_conference_view(request.websafeConferenceKey)
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: {}'.format(
                     request.websafeConferenceKey))
-        conf_sessions = Session.query(ancestor=conf.key)
-        return SessionForms(
-            items=[self._copy_session_to_form(sess)
-                   for sess in conf_sessions]
-        )
+        fields = self._get_fields(request, SessionForm)
+        # check the ETag before querying the sessions
+        etag = self._get_schedule_etag(conf)
+        if fields:
+            etag = self._make_etag(etag, sorted(fields))
+        if self._check_not_modified(request, etag):
+            return SessionForms(etag=etag, notModified=True)
+        query = Session.query(ancestor=conf.key)
+        conf_sessions = self._fetch_projected(
+            query, query.fetch, self._get_projection(
+                Session, fields, SESSION_FIELD_PROPERTIES))
+        forms = self._copy_sessions_to_forms(conf_sessions, fields)
+        forms.etag = etag
+        return forms
 
     @endpoints.method(
         SESSION_BY_TYPE_REQUEST, SessionForms,
@@ -951,17 +2759,14 @@ class ConferenceApi(remote.Service):
             websafeConferenceKey.
         """
         # get Conference object from request; bail if not found
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        conf, _ = self._get_conference_view(request.websafeConferenceKey)
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: {}'.format(
                     request.websafeConferenceKey))
         q = Session.query(ancestor=conf.key)
         q = q.filter(Session.typeOfSession == request.typeOfSession)
-        return SessionForms(
-            items=[self._copy_session_to_form(sess)
-                   for sess in q]
-        )
+        return self._fetch_session_forms(q, request)
 
     @endpoints.method(SESSION_SPEAKER_GET_REQUEST, SessionForms,
                       path='sessions/{websafeSpeakerKey}',
@@ -990,10 +2795,7 @@ class ConferenceApi(remote.Service):
                     request.websafeSpeakerKey))
         q = Session.query()
         q = q.filter(Session.speakerKey == speaker.key.urlsafe())
-        return SessionForms(
-            items=[self._copy_session_to_form(sess)
-                   for sess in q]
-        )
+        return self._fetch_session_forms(q, request)
 
     @endpoints.method(SpecificQueryForm, SessionForms,
                       path='sessions/duration', http_method='POST',
@@ -1035,8 +2837,7 @@ class ConferenceApi(remote.Service):
                                                int(dur_filter["value"]))
         q = q.filter(formatted_query).order(Session.duration)
         q = q.order(Session.name)
-        return SessionForms(items=[self._copy_session_to_form(sess)
-                                   for sess in q])
+        return self._fetch_session_forms(q, request)
 
     @endpoints.method(LocationQueryForm, SessionForms,
                       path='sessions/location', http_method='POST',
@@ -1057,16 +2858,52 @@ class ConferenceApi(remote.Service):
             endpoints.BadRequestException: An error if request have invalid
             operator.
         """
-        city = request.city
-        conferences = Conference.query(Conference.city == city)
-        c_keys = [c.key.urlsafe() for c in conferences]
-        # use empty string if no conferences in request city is found
-        if len(c_keys) == 0:
-            c_keys = ['']
-        # query all sessions with conferenceKeys taking place in request.city
-        q = Session.query(Session.conferenceKey.IN(c_keys))
-        return SessionForms(items=[self._copy_session_to_form(sess)
-                                   for sess in q])
+        # query all sessions taking place in request.city
+        q = Session.query(Session.city == request.city)
+        return self._fetch_session_forms(q, request)
+
+    @staticmethod
+    def _sync_session_cities(wsck=None, cursor=None):
+        """
+        Copy the conference city to a batch of Sessions, enqueueing a task
+        for the next batch. Used by the sync session city task queue, both to
+        backfill all sessions and to update the sessions of a conference
+        after its city changes.
+
+        Args:
+            wsck: The websafe key of the conference whose sessions to update.
+            None to update the sessions of all conferences.
+            cursor: The websafe cursor of the batch, None for the first one.
+
+        Returns:
+            The number of sessions updated in the batch.
+        """
+        q = Session.query()
+        if wsck:
+            q = Session.query(ancestor=ndb.Key(urlsafe=wsck))
+        sessions, next_cursor, more = q.fetch_page(
+            SESSION_CITY_BATCH_SIZE,
+            start_cursor=ndb.Cursor(urlsafe=cursor) if cursor else None)
+
+        # fetch all conferences of the batch at once
+        c_keys = list({sess.key.parent() for sess in sessions})
+        cities = {conf.key: conf.city
+                  for conf in get_multi(c_keys) if conf}
+        updated = []
+        for sess in sessions:
+            city = cities.get(sess.key.parent())
+            if sess.city != city:
+                sess.city = city
+                updated.append(sess)
+        with batch_counters():
+            ndb.put_multi(updated)
+
+        if more and next_cursor:
+            params = {'cursor': next_cursor.urlsafe()}
+            if wsck:
+                params['websafeConferenceKey'] = wsck
+            taskqueue.add(params=params, url='/tasks/sync_session_city')
+        return len(updated)
 
     @staticmethod
     def _copy_speaker_to_form(speaker):
@@ -1079,13 +2916,8 @@ class ConferenceApi(remote.Service):
         Returns:
             A SpeakerForm with relevant Speaker fields.
         """
-        sp = SpeakerForm()
-        for field in sp.all_fields():
-            if hasattr(speaker, field.name):
-                setattr(sp, field.name, getattr(speaker, field.name))
-            elif field.name == "websafeKey":
-                setattr(sp, field.name, speaker.key.urlsafe())
-        sp.check_initialized()
+        sp = SPEAKER_MAPPER.to_form(speaker, websafeKey=speaker.key.urlsafe())
+        SPEAKER_MAPPER.check_initialized(sp)
         return sp
 
     def _create_speaker_object(self, request):
@@ -1102,48 +2934,236 @@ class ConferenceApi(remote.Service):
             endpoints.UnauthorizedException: An error if the user is not logged
             in.
         """
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required')
-        user_id = get_user_id(user)
+        user, user_id = self._get_current_user()
 
         if not request.name:
             raise endpoints.BadRequestException(
                 "Speaker 'name' field required")
 
+        # return the speaker claiming the email before allocating an ID,
+        # concurrent creates are still settled by the claim transaction
+        email = self._normalize_email(request.email)
+        if email:
+            claim = ndb.Key(SpeakerEmail, email).get()
+            speaker = claim and claim.speakerKey.get()
+            if speaker:
+                return self._copy_speaker_to_form(speaker)
+
         # copy SpeakerForm/ProtoRPC Message into dict
-        data = {field.name: getattr(request, field.name) for field in
-                request.all_fields()}
+        data = SPEAKER_MAPPER.to_dict(request)
         del data['websafeKey']
         p_key = ndb.Key(Profile, user_id)
         sp_id = Speaker.allocate_ids(size=1, parent=p_key)[0]
         sp_key = ndb.Key(Speaker, sp_id, parent=p_key)
         data['key'] = sp_key
         data['creatorUserId'] = request.creatorUserId = user_id
-        # Get speaker from Datastore
-        speaker = sp_key.get()
 
-        # Create speaker if speaker is not stored
-        if not speaker:
-            speaker = Speaker(**data)
-            speaker.put()
+        # Create speaker unless a speaker with the same email is stored
+        speaker = self._put_speakers([Speaker(**data)])[0]
 
         return self._copy_speaker_to_form(speaker)
 
-    @endpoints.method(SpeakerForm, SpeakerForm,
+    @staticmethod
+    def _normalize_email(email):
+        """
+        Return an email normalized for deduplication, None if empty.
+
+        Args:
+            email: The email address.
+
+        Returns:
+            The stripped and lowercase email, or None.
+        """
+        return (email or '').strip().lower() or None
+
+    @staticmethod
+    def _speaker_words(speaker):
+        """
+        Return the words of the name and email of a Speaker.
+
+        Args:
+            speaker: The Speaker object.
+
+        Returns:
+            A list of lowercase words.
+        """
+        return ConferenceApi._search_words(
+            u'{} {}'.format(speaker.name, speaker.email or ''))
+
+    @staticmethod
+    @ndb.transactional(xg=True)
+    def _claim_speaker_emails(speakers):
+        """
+        Put Speakers along with the SpeakerEmail entities claiming their
+        normalized emails, except those whose email is claimed by another
+        speaker.
+
+        Args:
+            speakers: A list of Speaker objects with keys and distinct
+            normalized emails, at most SPEAKER_EMAIL_BATCH_SIZE.
+
+        Returns:
+            A list with the key of each speaker, or of the speaker that
+            claimed its email first.
+        """
+        e_keys = [ndb.Key(SpeakerEmail,
+                          ConferenceApi._normalize_email(speaker.email))
+                  for speaker in speakers]
+        to_put = []
+        sp_keys = []
+        for speaker, e_key, claim in zip(speakers, e_keys,
+                                         get_multi(e_keys)):
+            if claim and claim.speakerKey != speaker.key:
+                sp_keys.append(claim.speakerKey)
+                continue
+            to_put.append(speaker)
+            if not claim:
+                to_put.append(SpeakerEmail(key=e_key, speakerKey=speaker.key))
+            sp_keys.append(speaker.key)
+        ndb.put_multi(to_put)
+        return sp_keys
+
+    @staticmethod
+    def _put_speakers(speakers):
+        """
+        Put Speakers with their autocomplete prefixes, deduplicated by
+        normalized email: a speaker whose email is already claimed by
+        another speaker is not put, and the other speaker is returned
+        instead.
+
+        Args:
+            speakers: A list of Speaker objects with keys.
+
+        Returns:
+            A list with the stored Speaker of each speaker.
+        """
+        min_length, max_length = SPEAKER_PREFIX_LENGTHS
+        results = list(speakers)
+        # indexes of the speakers by normalized email, in order
+        emails = {}
+        claimants = []
+        for i, speaker in enumerate(speakers):
+            speaker.prefixes = sorted({
+                word[:j] for word in ConferenceApi._speaker_words(speaker)
+                for j in range(min_length, min(len(word), max_length) + 1)})
+            email = ConferenceApi._normalize_email(speaker.email)
+            if email:
+                if email not in emails:
+                    claimants.append(speaker)
+                emails.setdefault(email, []).append(i)
+        with batch_counters():
+            ndb.put_multi([speaker for speaker in speakers if not
+                           ConferenceApi._normalize_email(speaker.email)])
+
+        for start in range(0, len(claimants), SPEAKER_EMAIL_BATCH_SIZE):
+            batch = claimants[start:start + SPEAKER_EMAIL_BATCH_SIZE]
+            sp_keys = ConferenceApi._claim_speaker_emails(batch)
+            stored = {speaker.key: speaker for speaker in batch}
+            stored.update((speaker.key, speaker) for speaker in get_multi(
+                [sp_key for sp_key in sp_keys if sp_key not in stored])
+                if speaker)
+            for speaker, sp_key in zip(batch, sp_keys):
+                for i in emails[ConferenceApi._normalize_email(
+                        speaker.email)]:
+                    results[i] = stored[sp_key]
+        return results
+
+    @staticmethod
+    def _index_all_speakers(cursor=None):
+        """
+        Add the autocomplete prefixes and claim the emails of a batch of
+        Speakers, enqueueing a task for the next batch. Used by the index
+        speakers task queue to backfill speakers created before them.
+        Speakers duplicating the email of an earlier one are left out of
+        autocomplete.
+
+        Args:
+            cursor: The websafe cursor of the batch, None for the first one.
+
+        Returns:
+            The number of speakers in the batch.
+        """
+        speakers, next_cursor, more = Speaker.query().fetch_page(
+            SPEAKER_INDEX_BATCH_SIZE,
+            start_cursor=ndb.Cursor(urlsafe=cursor) if cursor else None)
+        ConferenceApi._put_speakers(speakers)
+        if more and next_cursor:
+            taskqueue.add(params={'cursor': next_cursor.urlsafe()},
+                          url='/tasks/index_speakers')
+        return len(speakers)
+
+    @endpoints.method(SPEAKER_CREATE_REQUEST, SpeakerForm,
                       path='speaker', http_method='POST',
                       name='createSpeaker')
     def create_speaker(self, request):
         """
-        Create a Speaker and store it to Datastore.
+        Create a Speaker and store it to Datastore. Retries with the same
+        idempotencyKey get the first response back.
 
         Args:
-            request: The SpeakerForm request sent to this API endpoint.
+            request: The SPEAKER_CREATE_REQUEST request sent to this API
+            endpoint.
 
         Returns:
             A SpeakerForm object updated after store in Datastore.
         """
-        return self._create_speaker_object(request)
+        return self._idempotent(request, SpeakerForm,
+                                self._create_speaker_object)
+
+    @endpoints.method(SPEAKER_SEARCH_REQUEST, SpeakerForms,
+                      path='speakers/search', http_method='GET',
+                      name='searchSpeakers')
+    def search_speakers(self, request):
+        """
+        Return Speakers whose name or email words start with every word of
+        the query, sorted by name, for autocomplete. Results are cached in
+        memcache until a Speaker is stored.
+
+        Args:
+            request: The SPEAKER_SEARCH_REQUEST request sent to this API
+            endpoint.
+
+        Returns:
+            SpeakerForms with up to pageSize matching speakers.
+
+        Raises:
+            endpoints.BadRequestException: An error if pageSize is not
+            positive.
+        """
+        words = sorted(set(self._search_words(request.query)))
+        if not words:
+            return SpeakerForms(items=[])
+        limit = self._get_page_size(request)
+        generation = self._get_counter(
+            MEMCACHE_GENERATION_PREFIX + Speaker._get_kind())
+        cache_key = MEMCACHE_SPEAKER_SEARCH_PREFIX + hashlib.md5(repr((
+            generation, words, limit))).hexdigest()
+        cached = memcache.get(cache_key)
+        self._record_cache_access('speaker', cached is not None)
+        if cached is not None:
+            return protojson.decode_message(SpeakerForms, cached)
+
+        # words longer than the indexed prefixes are matched in memory, so
+        # pages are fetched until limit speakers match
+        max_length = SPEAKER_PREFIX_LENGTHS[1]
+        q = Speaker.query(*[Speaker.prefixes == word[:max_length]
+                            for word in words]).order(Speaker.name)
+        speakers = []
+        cursor, more, scanned = None, True, 0
+        while more and len(speakers) < limit and \
+                scanned < SPEAKER_SEARCH_MAX_SCAN:
+            batch, cursor, more = q.fetch_page(limit, start_cursor=cursor)
+            scanned += len(batch)
+            speakers.extend(
+                speaker for speaker in batch
+                if all(any(sw.startswith(word)
+                           for sw in self._speaker_words(speaker))
+                       for word in words))
+        forms = SpeakerForms(items=[self._copy_speaker_to_form(speaker)
+                                    for speaker in speakers[:limit]])
+        memcache.set(cache_key, protojson.encode_message(forms),
+                     time=QUERY_CACHE_TTL)
+        return forms
 
     # - - - Sessions Wishlist - - - - - - - - - - - - - - - - - - -
 
@@ -1171,7 +3191,8 @@ class ConferenceApi(remote.Service):
             raise endpoints.NotFoundException(
                 'No Session found with key: %s' % wssk)
         # check if user is registered in the session's conference
-        if session.conferenceKey not in prof.conferenceKeysToAttend:
+        if not self._registration_key(prof.key,
+                                      session.conferenceKey).get():
             raise ConflictException(
                 "You are not registered in this Session's Conference")
         if add:
@@ -1225,7 +3246,7 @@ class ConferenceApi(remote.Service):
         """
         return self._add_to_wishlist(request, add=False)
 
-    @endpoints.method(message_types.VoidMessage, SessionForms,
+    @endpoints.method(CONDITIONAL_GET_REQUEST, SessionForms,
                       path='wishlist', http_method='GET',
                       name='getSessionsInWishlist')
     def get_sessions_in_wishlist(self, request):
@@ -1233,11 +3254,21 @@ class ConferenceApi(remote.Service):
         Get all sessions in user wishlist.
 
         Args:
-            request: message_type.VoidMessage empty request.
+            request: CONDITIONAL_GET_REQUEST request.
 
         Returns:
-            SessionForms: A list of SessionForm for every session.
-        """
+            SessionForms: A list of SessionForm for every session, or only
+            the ETag with notModified set if the client ETag matches.
+        """
+        # check the ETag before any Datastore call, from the versions of the
+        # user profile and of all Sessions
+        p_key = self._get_profile_key()
+        etag = self._make_etag(*self._get_counters([
+            MEMCACHE_PROFILE_VERSION_PREFIX + p_key.urlsafe(),
+            MEMCACHE_GENERATION_PREFIX + Session._get_kind()]))
+        if self._check_not_modified(request, etag):
+            return SessionForms(etag=etag, notModified=True)
+
         prof = self._get_profile_from_user()
         wlk = prof.sessionsWishlist
         # get array of keys from websafe keys
@@ -1245,56 +3276,34 @@ class ConferenceApi(remote.Service):
         # fetch sessions from datastore.
         sessions = get_multi(array_of_keys)
         # return set of SessionForm objects per Session
-        return SessionForms(items=[self._copy_session_to_form(sess)
-                                   for sess in sessions])
+        forms = self._copy_sessions_to_forms(sessions)
+        forms.etag = etag
+        return forms
 
     def _get_session_query(self, request):
         """
-        Return formatted query from the submitted filters.
+        Return formatted queries from the submitted filters.
 
         Args:
             request: The request sent to this API endpoint.
 
         Returns:
-            A query object after applying the filters.
+            A list of query objects after applying the filters. See
+            _build_queries.
 
         Raises:
             endpoints.NotFoundException: An error if no conference found with
             websafeConferenceKey
         """
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        conf, _ = self._get_conference_view(request.websafeConferenceKey)
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: {}'.format(
                     request.websafeConferenceKey))
-        q = Session.query(ancestor=conf.key)
-        inequality_filter, filters = self._format_filters(
+        inequality_fields, filters = self._format_filters(
             request.filters, filter_type='session')
-
-        # If exists, sort on inequality filter first
-        if not inequality_filter:
-            q = q.order(Session.name)
-        else:
-            q = q.order(ndb.GenericProperty(inequality_filter))
-            q = q.order(Session.name)
-
-        for filtr in filters:
-            if filtr["field"] == "duration":
-                filtr["value"] = int(filtr["value"])
-            elif filtr["field"] == "startTime":
-                # To compare just the time, used the same date stored in Data-
-                # store
-                filtr["value"] = datetime.strptime(
-                    "1970-01-01 {}".format(str(filtr["value"])),
-                    "%Y-%m-%d %H:%M")
-            elif filtr["field"] == 'date':
-                filtr["value"] = datetime.strptime(filtr["value"],
-                                                   "%Y-%m-%d")
-            formatted_query = ndb.query.FilterNode(filtr["field"],
-                                                   filtr["operator"],
-                                                   filtr["value"])
-            q = q.filter(formatted_query)
-        return q
+        return self._build_queries(Session.query(ancestor=conf.key), Session,
+                                   inequality_fields, filters)
 
     @endpoints.method(CONF_SESSION_REQUEST, SessionForms,
                       path='conference/{websafeConferenceKey}/query-sessions',
@@ -1309,13 +3318,15 @@ class ConferenceApi(remote.Service):
         Returns:
             SessionForms: A list of SessionForm for every session in query.
         """
-        sessions = self._get_session_query(request)
+        fields = self._get_fields(request, SessionForm)
+        sessions, next_page_token = self._run_queries(
+            self._get_session_query(request), request, self._get_projection(
+                Session, fields, SESSION_FIELD_PROPERTIES))
 
         # return individual SessionForm object per Session
-        return SessionForms(
-            items=[self._copy_session_to_form(sess)
-                   for sess in sessions]
-        )
+        forms = self._copy_sessions_to_forms(sessions, fields)
+        forms.nextPageToken = next_page_token
+        return forms
 
     @endpoints.method(
         CONF_GET_REQUEST, SessionForms,
@@ -1333,58 +3344,111 @@ class ConferenceApi(remote.Service):
         Returns:
             SessionForms: A list of SessionForm for every session in query.
         """
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        conf, _ = self._get_conference_view(request.websafeConferenceKey)
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: {}'.format(
                     request.websafeConferenceKey))
-        q = Session.query(ancestor=conf.key)
-        # 1st query with inequality in typeOfSession field
-        q1 = q.filter(Session.typeOfSession != 'Workshop')
-        q1k = [i.key for i in q1]
-        # 2nd query with inequality in startTime field
-        q2 = q.filter(
-            Session.startTime > datetime.strptime("19:00", "%H:%M").time())
-        q2k = [i.key for i in q2]
-        itsq = list(set(q1k).intersection(set(q2k)))
-        print itsq
-        sessions = ndb.get_multi(itsq)
+        # inequalities in typeOfSession and startTime fields
+        inequality_fields, filters = self._format_filters([
+            SessionQueryForm(field='TYPE', operator='NE', value='Workshop'),
+            SessionQueryForm(field='START_TIME', operator='GT',
+                             value='19:00'),
+        ], filter_type='session')
+        queries = self._build_queries(Session.query(ancestor=conf.key),
+                                      Session, inequality_fields, filters)
+        # no paging fields, so all sessions are returned
+        sessions, _ = self._run_queries(queries, SessionQueryForms())
         # return individual SessionForm object per Session
-        return SessionForms(
-            items=[self._copy_session_to_form(sess)
-                   for sess in sessions]
-        )
+        return self._copy_sessions_to_forms(sessions)
 
     # - - - Featured Speaker - - - - - - - - - - - - - - - - - - - -
 
     @staticmethod
-    def _check_speaker(speaker_key, session_key):
+    def _get_speaker_index(c_key):
         """
-        Check speaker and assign to memcache if speaker has more than one
-        session in the same confernence. Used by memcache task queue.
+        Return the SpeakerIndex of a Conference, building it from the
+        conference sessions if it does not exist yet.
+
+        Args:
+            c_key: The Conference key.
 
         Returns:
-            A string with the featured speaker. Empty string if speaker has no
-            other session in this conference.
+            A SpeakerIndex object.
+        """
+        si_key = ndb.Key(SpeakerIndex, 'speakers', parent=c_key)
+        index = si_key.get()
+        if not index:
+            sessions = {}
+            for sess in Session.query(ancestor=c_key):
+                if sess.speakerKey:
+                    sessions.setdefault(sess.speakerKey, []).append(sess.name)
+            index = SpeakerIndex(key=si_key, sessions=sessions)
+        return index
+
+    @staticmethod
+    @ndb.transactional
+    def _put_speaker_session(sess):
         """
-        speaker = ndb.Key(urlsafe=speaker_key).get()
-        session = ndb.Key(urlsafe=session_key).get()
-        conf = session.key.parent().get()
-        # get all conference sessions
-        q = Session.query(ancestor=conf.key)
-        # get all conference sessions by the speaker
-        speaker_sessions = q.filter(
-            Session.speakerKey == speaker.key.urlsafe()).fetch(2)
-        # if more than one session returned, add to memcache
-        if len(speaker_sessions) > 1:
-            featured_speaker = "{0} by {1}".format(session.name, speaker.name)
-            memcache.set(MEMCACHE_FEATURED_SPEAKER, featured_speaker)
-        else:
-            # delete the memcache featured speaker entry
-            featured_speaker = ""
-            memcache.delete(MEMCACHE_FEATURED_SPEAKER)
+        Put a Session with speaker and add it to the conference SpeakerIndex.
+        Both belong to the Conference entity group.
+
+        Args:
+            sess: The Session object, with key and speakerKey.
+        """
+        index = ConferenceApi._get_speaker_index(sess.key.parent())
+        index.sessions.setdefault(sess.speakerKey, []).append(sess.name)
+        ndb.put_multi([sess, index])
+
+    @staticmethod
+    def _enqueue_featured_speakers_task(wsck):
+        """
+        Enqueue the featured speakers task of a conference. Tasks enqueued
+        within FEATURED_SPEAKER_TASK_DELAY seconds share the same name, so
+        only the first one is added.
+
+        Args:
+            wsck: The websafe key of the conference.
+        """
+        try:
+            taskqueue.add(
+                name='featured-speakers-{}-{}'.format(
+                    wsck, int(time.time() // FEATURED_SPEAKER_TASK_DELAY)),
+                params={'websafeConferenceKey': wsck},
+                countdown=FEATURED_SPEAKER_TASK_DELAY,
+                url='/tasks/check_featured_speaker'
+            )
+        except (taskqueue.TaskAlreadyExistsError,
+                taskqueue.TombstonedTaskError):
+            pass
+
+    @staticmethod
+    def _cache_featured_speakers(wsck):
+        """
+        Assign to memcache the speakers with more than one session in a
+        conference, read from the conference SpeakerIndex. Used by memcache
+        task queue.
 
-        return featured_speaker
+        Args:
+            wsck: The websafe key of the conference.
+
+        Returns:
+            A string with the featured speakers. Empty string if no speaker
+            has more than one session in this conference.
+        """
+        index = ConferenceApi._get_speaker_index(ndb.Key(urlsafe=wsck))
+        sp_wsks = [sp_wsk for sp_wsk, names in index.sessions.items()
+                   if len(names) > 1]
+        speakers = get_multi([ndb.Key(urlsafe=sp_wsk) for sp_wsk in sp_wsks])
+        featured_speakers = '; '.join(sorted(
+            '{0}: {1}'.format(speaker.name, ', '.join(index.sessions[sp_wsk]))
+            for sp_wsk, speaker in zip(sp_wsks, speakers) if speaker))
+        memcache.set(MEMCACHE_FEATURED_SPEAKERS_PREFIX + wsck,
+                     featured_speakers)
+        if featured_speakers:
+            # keep latest featured speakers for getFeaturedSpeaker
+            memcache.set(MEMCACHE_FEATURED_SPEAKER, featured_speakers)
+        return featured_speakers
 
     @endpoints.method(message_types.VoidMessage, StringMessage,
                       path='conference/featured-speaker/get',
@@ -1406,5 +3470,429 @@ class ConferenceApi(remote.Service):
             featured_speakers = ""
         return StringMessage(data=featured_speakers)
 
+    @endpoints.method(
+        CONF_GET_REQUEST, StringMessage,
+        path='conference/{websafeConferenceKey}/featured-speakers',
+        http_method='GET', name='getConferenceFeaturedSpeakers')
+    def get_conference_featured_speakers(self, request):
+        """
+        Return featured speakers of a conference from memcache.
+
+        Args:
+            request: The CONF_GET_REQUEST request sent to this API endpoint.
+
+        Returns:
+            A StringMessage with the featured speakers and their sessions.
+            Empty string if no speaker has more than one session in this
+            conference.
+        """
+        wsck = request.websafeConferenceKey
+        featured_speakers = memcache.get(
+            MEMCACHE_FEATURED_SPEAKERS_PREFIX + wsck)
+        if featured_speakers is None:
+            featured_speakers = self._cache_featured_speakers(wsck)
+        return StringMessage(data=featured_speakers)
+
+    # - - - Schedule export - - - - - - - - - - - - - - - - - - -
+
+    @staticmethod
+    def _get_schedule_etag(conf, page_token=None):
+        """
+        Return the ETag of a page of the conference sessions, hashed from
+        the sessions version without querying them. Speakers are not updated
+        once created, so the sessions identify the schedule.
+
+        Args:
+            conf: The Conference object.
+            page_token: The websafe cursor of the page, None for the first.
+
+        Returns:
+            A string with the ETag.
+        """
+        return ConferenceApi._make_etag(
+            conf.key.urlsafe(), ConferenceApi._get_sessions_version(conf.key),
+            page_token)
+
+    def _get_schedule_page(self, conf, cursor=None):
+        """
+        Return the SessionForms of a page of up to EXPORT_MAX_SESSIONS
+        conference sessions, fetching sessions EXPORT_PAGE_SIZE at a time
+        and the speakers of each batch at once.
+
+        Args:
+            conf: The Conference object.
+            cursor: The ndb.Cursor of the page, None for the first one.
+
+        Returns:
+            A tuple with the list of SessionForms and the websafe cursor of
+            the next page, None if there are no more sessions.
+        """
+        forms, more = [], True
+        while more and len(forms) < EXPORT_MAX_SESSIONS:
+            sessions, cursor, more = Session.query(
+                ancestor=conf.key).fetch_page(EXPORT_PAGE_SIZE,
+                                              start_cursor=cursor)
+            forms.extend(self._copy_sessions_to_forms(sessions).items)
+        return forms, cursor.urlsafe() if more and cursor else None
+
+    @staticmethod
+    def _ics_text(text):
+        """Escape text for an iCalendar property value."""
+        return (text or u'').replace('\\', '\\\\').replace(
+            ';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+    @staticmethod
+    def _ics_line(name, value):
+        """
+        Format an iCalendar content line, folded at 75 octets.
+
+        Returns:
+            A UTF-8 string with the folded line and its CRLF.
+        """
+        line = u'{}:{}'.format(name, value).encode('utf-8')
+        folded = []
+        while len(line) > 75:
+            # don't split UTF-8 multi-byte characters
+            cut = 75 if not folded else 74
+            while ord(line[cut]) & 0xC0 == 0x80:
+                cut -= 1
+            folded.append(line[:cut])
+            line = line[cut:]
+        folded.append(line)
+        return '\r\n '.join(folded) + '\r\n'
+
+    def _export_schedule(self, conf, forms, export_format):
+        """
+        Export sessions of a conference, as iCalendar events or
+        newline-delimited JSON SessionForms.
+
+        Args:
+            conf: The Conference object.
+            forms: The list of SessionForms to export.
+            export_format: 'ics' or 'ndjson'.
+
+        Yields:
+            UTF-8 strings with the export, a session at a time.
+        """
+        if export_format == 'ndjson':
+            for form in forms:
+                yield protojson.encode_message(form) + '\n'
+            return
+
+        ics = self._ics_line
+        yield ''.join([
+            ics('BEGIN', 'VCALENDAR'),
+            ics('VERSION', '2.0'),
+            ics('PRODID', '-//udacity-fsnd-p4-conference-app//Schedule//EN'),
+            ics('X-WR-CALNAME', self._ics_text(conf.name)),
+        ])
+        for form in forms:
+            # sessions without date can't be calendar events
+            if not form.date or form.date == 'None':
+                continue
+            start = form.date.replace('-', '')
+            if form.startTime and form.startTime != 'None':
+                start += 'T' + form.startTime.replace(':', '')[:6]
+                dtstart = ics('DTSTART', start)
+            else:
+                dtstart = ics('DTSTART;VALUE=DATE', start)
+            description = []
+            if form.speakerName:
+                description.append(u'Speaker: ' + form.speakerName)
+            if form.highlights:
+                description.append(u'Highlights: ' +
+                                   u', '.join(form.highlights))
+            event = [
+                ics('BEGIN', 'VEVENT'),
+                ics('UID', form.websafeKey + '@conference-app'),
+                # stamp with session start so exports don't change over time
+                ics('DTSTAMP', (start if 'T' in start else
+                                start + 'T000000') + 'Z'),
+                dtstart,
+                ics('SUMMARY', self._ics_text(form.name)),
+            ]
+            if form.duration:
+                event.append(ics('DURATION', 'PT{}M'.format(form.duration)))
+            if description:
+                event.append(ics('DESCRIPTION',
+                                 self._ics_text(u'\n'.join(description))))
+            if conf.city:
+                event.append(ics('LOCATION', self._ics_text(conf.city)))
+            event.append(ics('END', 'VEVENT'))
+            yield ''.join(event)
+        yield ics('END', 'VCALENDAR')
+
+    # - - - Schedule import - - - - - - - - - - - - - - - - - - -
+
+    @staticmethod
+    def _read_import_rows(data, data_format):
+        """
+        Read rows of schedule import data one at a time.
+
+        Args:
+            data: The import data, JSON lines or CSV with a header line.
+            data_format: 'jsonl' or 'csv'.
+
+        Yields:
+            A tuple with the line number and the row dict. The row is None if
+            the line is not valid.
+        """
+        if data_format == 'csv':
+            reader = csv.DictReader(StringIO(data.encode('utf-8')))
+            for row in reader:
+                yield reader.line_num, {
+                    name: value.decode('utf-8')
+                    for name, value in row.items() if name and value}
+        else:
+            for line_no, line in enumerate(data.splitlines(), 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield line_no, row if isinstance(row, dict) else None
+
+    @staticmethod
+    def _row_to_form(row, form_class):
+        """
+        Copy an import row into a form message, converting integer fields
+        and splitting repeated fields given as strings by ';'.
+
+        Args:
+            row: The row dict.
+            form_class: The form message class.
+
+        Returns:
+            A form_class object.
+
+        Raises:
+            ValueError: An error if a value is not valid for its field.
+        """
+        form = form_class()
+        for field in form_class.all_fields():
+            value = row.get(field.name)
+            if value in (None, '', []):
+                continue
+            if field.repeated and isinstance(value, basestring):
+                value = [v.strip() for v in value.split(';') if v.strip()]
+            try:
+                if isinstance(field, messages.IntegerField):
+                    value = [int(v) for v in value] if field.repeated \
+                        else int(value)
+                setattr(form, field.name, value)
+            except (TypeError, messages.ValidationError):
+                raise ValueError("invalid value for field '{}'".format(
+                    field.name))
+        return form
+
+    def _parse_schedule_import(self, request):
+        """
+        Parse and validate all rows of a schedule import. Rows have a 'type'
+        of 'conference' (at most one), 'speaker' (with an optional 'ref' to
+        be used in session speakerKey) or 'session'.
+
+        Args:
+            request: The ScheduleImportForm request.
+
+        Returns:
+            A tuple with the ConferenceForm and its Conference data dict (None
+            if no conference row), a list of (ref, Speaker data dict) and a
+            list of Session data dicts.
+
+        Raises:
+            endpoints.BadRequestException: An error if the data is longer than
+            IMPORT_MAX_DATA_LENGTH or any row is invalid.
+        """
+        if len(request.data) > IMPORT_MAX_DATA_LENGTH:
+            raise endpoints.BadRequestException(
+                'Import rejected. Data is longer than {} characters, split '
+                'it into several imports.'.format(IMPORT_MAX_DATA_LENGTH))
+        conf_form, conf_data = None, None
+        speakers, sessions, errors = [], [], []
+        speaker_refs = set()
+        for line_no, row in self._read_import_rows(request.data,
+                                                   request.dataFormat):
+            try:
+                if row is None:
+                    raise ValueError("invalid row")
+                row_type = row.get('type')
+                if row_type == 'conference':
+                    if conf_form:
+                        raise ValueError("only one conference allowed")
+                    conf_form = self._row_to_form(row, ConferenceForm)
+                    conf_data = self._conference_data(conf_form)
+                elif row_type == 'speaker':
+                    form = self._row_to_form(row, SpeakerForm)
+                    if not form.name:
+                        raise ValueError("Speaker 'name' field required")
+                    if row.get('ref'):
+                        speaker_refs.add(row['ref'])
+                    data = SPEAKER_MAPPER.to_dict(form)
+                    del data['websafeKey']
+                    speakers.append((row.get('ref'), data))
+                elif row_type == 'session':
+                    form = self._row_to_form(row, SessionForm)
+                    if not form.name:
+                        raise ValueError("Session 'name' field required")
+                    sessions.append(self._session_data(form))
+                else:
+                    raise ValueError("unknown row type")
+            except (ValueError, endpoints.BadRequestException) as e:
+                errors.append('Line {}: {}'.format(line_no, e))
+                if len(errors) >= IMPORT_MAX_ERRORS:
+                    break
+
+        # check speakers not in the import exist, fetching them at once
+        sp_wsks = sorted({data['speakerKey'] for data in sessions
+                          if data['speakerKey'] and
+                          data['speakerKey'] not in speaker_refs})
+        missing, sp_keys = [], {}
+        for sp_wsk in sp_wsks:
+            try:
+                sp_key = ndb.Key(urlsafe=sp_wsk)
+            except (TypeError, ProtocolBufferDecodeError):
+                sp_key = None
+            if sp_key and sp_key.kind() == Speaker._get_kind():
+                sp_keys[sp_wsk] = sp_key
+            else:
+                missing.append(sp_wsk)
+        missing.extend(sp_wsk for sp_wsk, speaker in zip(
+            sp_keys.keys(), get_multi(sp_keys.values())) if not speaker)
+        errors.extend('No speaker found with key or ref: {}'.format(sp_wsk)
+                      for sp_wsk in missing)
+
+        if errors:
+            raise endpoints.BadRequestException(
+                'Import rejected. {}'.format('; '.join(
+                    errors[:IMPORT_MAX_ERRORS])))
+        return conf_form, conf_data, speakers, sessions
+
+    @staticmethod
+    @ndb.transactional
+    def _index_speaker_sessions(c_key, sessions):
+        """
+        Add stored Sessions with speaker to the conference SpeakerIndex.
+
+        Args:
+            c_key: The Conference key.
+            sessions: A list of stored Session objects of the conference.
+        """
+        index = ndb.Key(SpeakerIndex, 'speakers', parent=c_key).get()
+        if not index:
+            # an index built from the query already has the sessions
+            ConferenceApi._get_speaker_index(c_key).put()
+            return
+        for sess in sessions:
+            if sess.speakerKey:
+                index.sessions.setdefault(sess.speakerKey, []).append(
+                    sess.name)
+        index.put()
+
+    @endpoints.method(ScheduleImportForm, ScheduleImportResultForm,
+                      path='conference/import', http_method='POST',
+                      name='importSchedule')
+    def import_schedule(self, request):
+        """
+        Bulk import a Conference with its Speakers and Sessions, or Speakers
+        and Sessions into an existing Conference of the current user. All
+        rows are validated before anything is written; IDs are allocated in
+        ranges, entities are written in batches and tasks are added at once
+        at the end.
+
+        Args:
+            request: The ScheduleImportForm request sent to this API endpoint.
+
+        Returns:
+            A ScheduleImportResultForm with the conference and the number of
+            speakers and sessions imported.
+
+        Raises:
+            endpoints.BadRequestException: An error if any row is invalid, or
+            if there is no conference row nor websafeConferenceKey.
+            endpoints.NotFoundException: An error if no conference found with
+            websafeConferenceKey.
+            endpoints.UnauthorizedException: An error if the user is not the
+            conference organizer.
+        """
+        user, user_id = self._get_current_user()
+        conf_form, conf_data, speakers, sessions = \
+            self._parse_schedule_import(request)
+        p_key = ndb.Key(Profile, user_id)
+        to_put = []
+        tasks = []
+
+        if conf_data:
+            c_id = Conference.allocate_ids(size=1, parent=p_key)[0]
+            conf_data['key'] = ndb.Key(Conference, c_id, parent=p_key)
+            conf_data['organizerUserId'] = conf_form.organizerUserId = user_id
+            conf = Conference(**conf_data)
+            to_put.append(conf)
+            to_put.extend(self._make_seat_shards(conf))
+        elif request.websafeConferenceKey:
+            conf, _ = self._get_conference_view(request.websafeConferenceKey)
+            if not conf:
+                raise endpoints.NotFoundException(
+                    'No conference found with key: {}'.format(
+                        request.websafeConferenceKey))
+            if conf.organizerUserId != user_id:
+                raise endpoints.UnauthorizedException(
+                    "Only the conference organizer can import sessions.")
+        else:
+            raise endpoints.BadRequestException(
+                "Import requires a conference row or 'websafeConferenceKey'")
+        wsck = conf.key.urlsafe()
+
+        # allocate Speaker and Session IDs in one range each
+        speaker_wsks = {}
+        if speakers:
+            first, last = Speaker.allocate_ids(size=len(speakers),
+                                               parent=p_key)
+            new_speakers = []
+            for sp_id, (ref, data) in zip(range(first, last + 1), speakers):
+                data['key'] = ndb.Key(Speaker, sp_id, parent=p_key)
+                data['creatorUserId'] = user_id
+                new_speakers.append(Speaker(**data))
+            # speakers with the email of a stored speaker are not created
+            stored = self._put_speakers(new_speakers)
+            for (ref, _), speaker in zip(speakers, stored):
+                if ref:
+                    speaker_wsks[ref] = speaker.key.urlsafe()
+        new_sessions = []
+        if sessions:
+            first, last = Session.allocate_ids(size=len(sessions),
+                                               parent=conf.key)
+            for s_id, data in zip(range(first, last + 1), sessions):
+                data['key'] = ndb.Key(Session, s_id, parent=conf.key)
+                data['conferenceKey'] = wsck
+                data['city'] = conf.city
+                data['speakerKey'] = speaker_wsks.get(data['speakerKey'],
+                                                      data['speakerKey'])
+                new_sessions.append(Session(**data))
+        to_put.extend(new_sessions)
+
+        # bump the version counters once for the whole import
+        with batch_counters():
+            for i in range(0, len(to_put), IMPORT_BATCH_SIZE):
+                ndb.put_multi(to_put[i:i + IMPORT_BATCH_SIZE])
+        if conf_data:
+            # send email to organizer confirming
+            self._enqueue_confirmation_email(user.email(), repr(conf_form))
+
+        speaker_sessions = [sess for sess in new_sessions if sess.speakerKey]
+        if speaker_sessions:
+            self._index_speaker_sessions(conf.key, speaker_sessions)
+            tasks.append(taskqueue.Task(
+                params={'websafeConferenceKey': wsck},
+                url='/tasks/check_featured_speaker'))
+        if tasks:
+            taskqueue.Queue().add(tasks)
+
+        return ScheduleImportResultForm(
+            conference=self._copy_conference_to_form(conf, None),
+            speakers=len(speakers),
+            sessions=len(sessions)
+        )
+
 # registers API
-api = endpoints.api_server([ConferenceApi])
+api = RequestStatsMiddleware(endpoints.api_server([ConferenceApi]))
@@ -0,0 +1,597 @@
+# -*- coding: utf-8 -*-
+"""
+ * Project: udacity-fsnd-p4-conference-app
+ * File: benchmark
+ * Benchmark of the ConferenceApi endpoints over the App Engine testbed.
+
+Builds a deterministic synthetic dataset with the datastore, memcache,
+taskqueue, search and mail stubs, calls every ConferenceApi endpoint directly
+and reports wall time and API calls (datastore, memcache, taskqueue and
+search RPCs) per call.
+
+Wall times depend on the machine and the stubs, so compare runs on the
+same machine; RPC counts per call are stable across runs of a dataset.
+
+Usage:
+    APPENGINE_SDK=~/google-cloud-sdk/platform/google_appengine \\
+        python benchmark.py [--conferences 50] [--cold] [--verbose]
+"""
+import argparse
+import collections
+import json
+import os
+import random
+import sys
+import time
+import datetime
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+SDK_PATH = os.path.expanduser(os.environ.get(
+    'APPENGINE_SDK', '~/google-cloud-sdk/platform/google_appengine'))
+
+# the SDK libraries must be on sys.path before importing the app
+sys.path.insert(0, SDK_PATH)
+import dev_appserver  # noqa: E402
+dev_appserver.fix_sys_path()
+sys.path.insert(0, APP_DIR)
+
+import endpoints  # noqa: E402
+from google.appengine.api import memcache  # noqa: E402
+from google.appengine.datastore import datastore_stub_util  # noqa: E402
+from google.appengine.ext import ndb  # noqa: E402
+from google.appengine.ext import testbed  # noqa: E402
+from protorpc import message_types  # noqa: E402
+from protorpc import remote  # noqa: E402
+
+import api  # noqa: E402
+from api import ConferenceApi  # noqa: E402
+from instrumentation import install_hooks, start_request, \
+    end_request  # noqa: E402
+from mailer import LocalMailBackend, drain_mail_queue, \
+    enqueue_mail  # noqa: E402
+from models import ConferenceForm, ConferenceQueryForm, \
+    ConferenceQueryForms, ConferenceDateRangeForm, ConferenceAvailableForm, \
+    ConferenceSearchForm, ProfileMiniForm, SessionQueryForm, \
+    SpecificQueryForm, LocationQueryForm, ScheduleImportForm, \
+    Conference, Session, Speaker, SessionForm  # noqa
+
+AUTH_DOMAIN = 'example.com'
+CITIES = ['London', 'Paris', 'Chicago', 'Tokyo', 'Berlin', 'Lisbon']
+TOPICS = ['Medical Innovations', 'Programming Languages', 'Web Technologies',
+          'Movie Making', 'Health and Nutrition', 'Cloud Computing']
+SESSION_TYPES = ['Lecture', 'Keynote', 'Workshop']
+START_DATE = datetime.date(2017, 1, 1)
+
+# services reported as columns, by apiproxy service name
+SERVICES = (('datastore', 'datastore_v3'), ('memcache', 'memcache'),
+            ('taskqueue', 'taskqueue'), ('search', 'search'))
+
+Dataset = collections.namedtuple('Dataset', [
+    'users', 'conferences', 'organizers', 'speakers', 'sessions',
+    'attending', 'wishlist', 'sold_out'])
+
+
+def setup_testbed():
+    """Activate the testbed with the service stubs used by the app."""
+    tb = testbed.Testbed()
+    tb.activate()
+    # make queries see all writes, as they would after a few seconds
+    policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(probability=1)
+    tb.init_datastore_v3_stub(consistency_policy=policy)
+    tb.init_memcache_stub()
+    tb.init_taskqueue_stub(root_path=APP_DIR)
+    tb.init_search_stub()
+    tb.init_mail_stub()
+    tb.init_app_identity_stub()
+    tb.init_urlfetch_stub()
+    tb.init_user_stub()
+    return tb
+
+
+def call(method, request, email):
+    """
+    Call a ConferenceApi endpoint as a new request of a user, waiting for
+    pending asynchronous RPCs like the request handler does.
+
+    Args:
+        method: The ConferenceApi method name.
+        request: The request message.
+        email: The email of the logged in user.
+
+    Returns:
+        The response message.
+    """
+    os.environ['ENDPOINTS_AUTH_EMAIL'] = email
+    os.environ['ENDPOINTS_AUTH_DOMAIN'] = AUTH_DOMAIN
+    ndb.get_context().clear_cache()
+    service = ConferenceApi()
+    service.initialize_request_state(remote.HttpRequestState(headers={}))
+    try:
+        return getattr(service, method)(request)
+    finally:
+        ndb.eventloop.run()
+
+
+def build_dataset(args):
+    """
+    Create profiles, speakers, conferences, sessions, registrations and
+    wishlists through the endpoints, deterministically from args.seed.
+
+    Returns:
+        A Dataset.
+    """
+    rng = random.Random(args.seed)
+    users = ['user{}@{}'.format(i, AUTH_DOMAIN) for i in range(args.profiles)]
+    for i, email in enumerate(users):
+        call('save_profile', ProfileMiniForm(displayName='User {}'.format(i)),
+             email)
+
+    speaker_rc = api.SPEAKER_CREATE_REQUEST.combined_message_class
+    conf_rc = api.CONF_CREATE_REQUEST.combined_message_class
+    speakers = [call('create_speaker', speaker_rc(
+        name='Speaker {}'.format(i),
+        email='speaker{}@{}'.format(i, AUTH_DOMAIN),
+        institution=rng.choice(CITIES) + ' University'),
+        rng.choice(users)).websafeKey for i in range(args.speakers)]
+
+    conferences, organizers, sessions = [], {}, {}
+    for i in range(args.conferences):
+        organizer = users[i % len(users)]
+        start = START_DATE + datetime.timedelta(days=rng.randint(0, 364))
+        conf = call('create_conference', conf_rc(
+            name='Conference {}'.format(i),
+            description='Conference {} about {}'.format(
+                i, ' and '.join(rng.sample(TOPICS, 2))),
+            topics=rng.sample(TOPICS, 2),
+            city=rng.choice(CITIES),
+            startDate=start.isoformat(),
+            endDate=(start + datetime.timedelta(days=2)).isoformat(),
+            maxAttendees=rng.choice([10, 50, 200, 1000]),
+            seatShards=4 if i % 4 == 3 else 0), organizer)
+        wsck = conf.websafeKey
+        conferences.append(wsck)
+        organizers[wsck] = organizer
+        sessions[wsck] = [call('create_session', (
+            api.SESSION_ADD_REQUEST.combined_message_class(
+                websafeConferenceKey=wsck,
+                name='Session {} of conference {}'.format(j, i),
+                speakerKey=rng.choice(speakers) if speakers else None,
+                highlights=rng.sample(TOPICS, 1),
+                duration=rng.choice([30, 45, 60, 90]),
+                typeOfSession=rng.choice(SESSION_TYPES),
+                date=(start + datetime.timedelta(days=j % 3)).isoformat(),
+                startTime='{:02d}:00'.format(9 + j % 9))),
+            organizer).websafeKey for j in range(args.sessions)]
+
+    attending, wishlist = {}, {}
+    for email in users:
+        attending[email] = rng.sample(
+            conferences, min(args.registrations, len(conferences)))
+        for wsck in attending[email]:
+            call('register_for_conference',
+                 api.CONF_GET_REQUEST.combined_message_class(
+                     websafeConferenceKey=wsck), email)
+        candidates = [wssk for wsck in attending[email]
+                      for wssk in sessions[wsck]]
+        wishlist[email] = rng.sample(
+            candidates, min(args.wishlist, len(candidates)))
+        for wssk in wishlist[email]:
+            call('add_session_to_wishlist',
+                 api.SESSION_GET_REQUEST.combined_message_class(
+                     websafeSessionKey=wssk), email)
+
+    # a sold out conference, out of the queried conferences, to join its
+    # waitlist
+    sold_out = call('create_conference', conf_rc(
+        name='Sold out conference', city=CITIES[0],
+        startDate=START_DATE.isoformat(), maxAttendees=1),
+        users[0]).websafeKey
+    call('register_for_conference',
+         api.CONF_GET_REQUEST.combined_message_class(
+             websafeConferenceKey=sold_out), users[-1])
+
+    # search documents are updated by tasks, which the testbed does not run
+    ConferenceApi._index_conferences(Conference.query().fetch())
+    return Dataset(users, conferences, organizers, speakers, sessions,
+                   attending, wishlist, sold_out)
+
+
+def make_cases(data):
+    """
+    Return the benchmark cases, as (label, method name, user email, request
+    factory) tuples. Cases run in order, so a case undoing the previous one
+    keeps the dataset stable across repeats.
+    """
+    user = data.users[0]
+    attended = data.attending[user][0]
+    free = [c for c in data.conferences if c not in data.attending[user]]
+    free = free[0] if free else None
+    organizer = data.organizers[attended]
+    sessions = [s for s in data.sessions[attended]
+                if s not in data.wishlist[user]]
+    session = sessions[0] if sessions else None
+    speaker = data.speakers[0] if data.speakers else None
+    conf_rc = api.CONF_GET_REQUEST.combined_message_class
+    cond_rc = api.CONF_CONDITIONAL_GET_REQUEST.combined_message_class
+    cond_get_rc = api.CONDITIONAL_GET_REQUEST.combined_message_class
+    sessions_rc = api.CONF_SESSIONS_GET_REQUEST.combined_message_class
+    session_rc = api.SESSION_GET_REQUEST.combined_message_class
+    etags = {}
+
+    def conditional(method, request_class, **kwargs):
+        # send back the ETag of the previous full response
+        def factory():
+            return request_class(ifNoneMatch=etags.get(method), **kwargs)
+        return factory
+
+    def import_data():
+        rows = [{'type': 'conference', 'name': 'Imported conference',
+                 'city': 'London', 'startDate': '2017-06-01'},
+                {'type': 'speaker', 'ref': 'sp', 'name': 'Imported speaker'}]
+        rows.extend({'type': 'session', 'speakerKey': 'sp', 'duration': 60,
+                     'name': 'Imported session {}'.format(i)}
+                    for i in range(10))
+        return ScheduleImportForm(
+            data='\n'.join(json.dumps(row) for row in rows))
+
+    cases = [
+        ('getProfile', 'get_profile', user, message_types.VoidMessage),
+        ('saveProfile', 'save_profile', user,
+         lambda: ProfileMiniForm(displayName='User 0')),
+        ('createConference', 'create_conference', user,
+         lambda: api.CONF_CREATE_REQUEST.combined_message_class(
+             name='Benchmark conference', city='Paris',
+             startDate='2017-03-01', maxAttendees=100)),
+        ('queryConferences', 'query_conferences', user,
+         lambda: ConferenceQueryForms(filters=[
+             ConferenceQueryForm(field='CITY', operator='EQ',
+                                 value='London'),
+             ConferenceQueryForm(field='MAX_ATTENDEES', operator='GT',
+                                 value='20')])),
+        ('queryConferences (fields)', 'query_conferences', user,
+         lambda: ConferenceQueryForms(
+             filters=[ConferenceQueryForm(field='MAX_ATTENDEES',
+                                          operator='GT', value='20')],
+             fields=['name', 'city', 'startDate', 'websafeKey'])),
+        ('queryConferences (2 inequalities)', 'query_conferences', user,
+         lambda: ConferenceQueryForms(filters=[
+             ConferenceQueryForm(field='MONTH', operator='GT', value='3'),
+             ConferenceQueryForm(field='MAX_ATTENDEES', operator='GT',
+                                 value='20')])),
+        ('getConferencesCreated', 'get_conferences_created', organizer,
+         message_types.VoidMessage),
+        ('getConferencesToAttend', 'get_conferences_to_attend', user,
+         cond_get_rc),
+        ('getConferencesToAttend (304)', 'get_conferences_to_attend', user,
+         conditional('get_conferences_to_attend', cond_get_rc)),
+        ('getConference', 'get_conference', user,
+         lambda: cond_rc(websafeConferenceKey=attended)),
+        ('getConference (304)', 'get_conference', user,
+         conditional('get_conference', cond_rc,
+                     websafeConferenceKey=attended)),
+        ('getConferencesByDateRange', 'get_conferences_by_date_range', user,
+         lambda: ConferenceDateRangeForm(startDate='2017-03-01',
+                                         endDate='2017-06-30')),
+        ('getConferencesAvailableByMonth',
+         'get_conferences_available_by_month', user,
+         lambda: ConferenceAvailableForm(month=5)),
+        ('filterPlayground', 'filter_playground', user,
+         message_types.VoidMessage),
+        ('searchConferences', 'search_conferences', user,
+         lambda: ConferenceSearchForm(query='prog')),
+        ('registerForConference', 'register_for_conference', user,
+         lambda: conf_rc(websafeConferenceKey=free)),
+        ('unregisterFromConference', 'unregister_from_conference', user,
+         lambda: conf_rc(websafeConferenceKey=free)),
+        ('joinWaitlist', 'join_waitlist', user,
+         lambda: conf_rc(websafeConferenceKey=data.sold_out)),
+        ('unregisterFromConference (waitlist)', 'unregister_from_conference',
+         user, lambda: conf_rc(websafeConferenceKey=data.sold_out)),
+        ('getConferenceAttendees', 'get_conference_attendees', organizer,
+         lambda: api.CONF_ATTENDEES_GET_REQUEST.combined_message_class(
+             websafeConferenceKey=attended, pageSize=20)),
+        ('getAnnouncement', 'get_announcement', user,
+         message_types.VoidMessage),
+        ('createSession', 'create_session', organizer,
+         lambda: api.SESSION_ADD_REQUEST.combined_message_class(
+             websafeConferenceKey=attended, name='Benchmark session',
+             speakerKey=speaker, duration=60, typeOfSession='Lecture',
+             date='2017-01-01', startTime='10:00')),
+        ('getConferenceSessions', 'get_conference_sessions', user,
+         lambda: sessions_rc(websafeConferenceKey=attended)),
+        ('getConferenceSessions (304)', 'get_conference_sessions', user,
+         conditional('get_conference_sessions', sessions_rc,
+                     websafeConferenceKey=attended)),
+        ('getConferenceSessions (fields)', 'get_conference_sessions', user,
+         lambda: sessions_rc(websafeConferenceKey=attended,
+                             fields=['name', 'date', 'startTime'])),
+        ('getConferenceSessionsByType', 'get_conference_sessions_by_type',
+         user, lambda: api.SESSION_BY_TYPE_REQUEST.combined_message_class(
+             websafeConferenceKey=attended, typeOfSession='Lecture')),
+        ('getSessionsBySpeaker', 'get_sessions_by_speaker', user,
+         lambda: api.SESSION_SPEAKER_GET_REQUEST.combined_message_class(
+             websafeSpeakerKey=speaker)),
+        ('getSessionsByDuration', 'get_sessions_by_duration', user,
+         lambda: SpecificQueryForm(operator='LTEQ', value='45')),
+        ('getSessionsByLocation', 'get_sessions_by_location', user,
+         lambda: LocationQueryForm(city='London')),
+        ('createSpeaker', 'create_speaker', user,
+         lambda: api.SPEAKER_CREATE_REQUEST.combined_message_class(
+             name='Benchmark speaker')),
+        ('searchSpeakers', 'search_speakers', organizer,
+         lambda: api.SPEAKER_SEARCH_REQUEST.combined_message_class(
+             query='speaker 1')),
+        # replays the response of the first repeat
+        ('createSpeaker (idempotent)', 'create_speaker', user,
+         lambda: api.SPEAKER_CREATE_REQUEST.combined_message_class(
+             name='Benchmark speaker', idempotencyKey='benchmark')),
+        ('addSessionToWishlist', 'add_session_to_wishlist', user,
+         lambda: session_rc(websafeSessionKey=session)),
+        ('deleteSessionInWishlist', 'delete_session_in_wishlist', user,
+         lambda: session_rc(websafeSessionKey=session)),
+        ('getSessionsInWishlist', 'get_sessions_in_wishlist', user,
+         cond_get_rc),
+        ('getSessionsInWishlist (304)', 'get_sessions_in_wishlist', user,
+         conditional('get_sessions_in_wishlist', cond_get_rc)),
+        ('queryConferenceSessions', 'query_conference_sessions', user,
+         lambda: api.CONF_SESSION_REQUEST.combined_message_class(
+             websafeConferenceKey=attended, filters=[
+                 SessionQueryForm(field='TYPE', operator='EQ',
+                                  value='Lecture')])),
+        ('queryConferenceSessionsProblem', 'query_conference_session_problem',
+         user, lambda: conf_rc(websafeConferenceKey=attended)),
+        ('getFeaturedSpeaker', 'get_featured_speaker', user,
+         message_types.VoidMessage),
+        ('getConferenceFeaturedSpeakers', 'get_conference_featured_speakers',
+         user, lambda: conf_rc(websafeConferenceKey=attended)),
+        ('importSchedule', 'import_schedule', user, import_data),
+    ]
+    return cases, etags
+
+
+def run(args):
+    tb = setup_testbed()
+    install_hooks()
+    try:
+        started = time.time()
+        data = build_dataset(args)
+        print('Dataset built in {:.1f}s: {} profiles, {} conferences, '
+              '{} speakers, {} sessions\n'.format(
+                  time.time() - started, len(data.users),
+                  len(data.conferences), len(data.speakers),
+                  sum(len(s) for s in data.sessions.values())))
+
+        cases, etags = make_cases(data)
+        not_covered = set(ConferenceApi.all_remote_methods()) - {
+            method for _, method, _, _ in cases}
+        stats = collections.OrderedDict(
+            (label, {'times': [], 'calls': collections.Counter(),
+                     'errors': collections.Counter()})
+            for label, _, _, _ in cases)
+        for _ in range(args.repeat):
+            for label, method, email, factory in cases:
+                request = factory()
+                if args.cold:
+                    memcache.flush_all()
+                start_request(label)
+                try:
+                    response = call(method, request, email)
+                    if getattr(response, 'etag', None):
+                        etags[method] = response.etag
+                except (endpoints.ServiceException, remote.ApplicationError) \
+                        as e:
+                    stats[label]['errors'][type(e).__name__] += 1
+                request_stats = end_request()
+                stats[label]['times'].append(request_stats.elapsed_ms)
+                for key, (count, _) in request_stats.calls.items():
+                    stats[label]['calls'][key] += count
+    finally:
+        tb.deactivate()
+
+    report(stats, args)
+    if not_covered:
+        print('\nNot benchmarked: {}'.format(', '.join(sorted(not_covered))))
+    if args.max_datastore_rpcs is not None:
+        over = [label for label, s in stats.items() if
+                float(sum(n for (service, _), n in s['calls'].items()
+                          if service == 'datastore_v3')) /
+                len(s['times']) > args.max_datastore_rpcs]
+        if over:
+            print('\nOver {} datastore RPCs per call: {}'.format(
+                args.max_datastore_rpcs, ', '.join(over)))
+            return 1
+    return 0
+
+
+def report(stats, args):
+    """Print wall time and API calls per call of every case."""
+    header = '{:<36} {:>8} {:>8}'.format('endpoint', 'ms/call', 'max ms')
+    header += ''.join(' {:>9}'.format(name) for name, _ in SERVICES)
+    print(header)
+    print('-' * len(header))
+    for label, s in stats.items():
+        n = len(s['times'])
+        line = '{:<36} {:>8.2f} {:>8.2f}'.format(
+            label, sum(s['times']) / n, max(s['times']))
+        for _, service in SERVICES:
+            line += ' {:>9.1f}'.format(float(sum(
+                count for (svc, _), count in s['calls'].items()
+                if svc == service)) / n)
+        if s['errors']:
+            line += '  ' + ', '.join('{} x{}'.format(e, count)
+                                     for e, count in s['errors'].items())
+        print(line)
+        if args.verbose:
+            for (service, method), count in sorted(s['calls'].items()):
+                print('    {:<40} {:>9.1f}'.format(
+                    '{}.{}'.format(service, method), float(count) / n))
+
+
+def _reflective_conference_to_form(conf, displayName):
+    # ConferenceApi._copy_conference_to_form before precompiled mappers
+    cf = ConferenceForm()
+    for field in cf.all_fields():
+        if hasattr(conf, field.name):
+            if field.name.endswith('Date'):
+                setattr(cf, field.name, str(getattr(conf, field.name)))
+            else:
+                setattr(cf, field.name, getattr(conf, field.name))
+        elif field.name == "websafeKey":
+            setattr(cf, field.name, conf.key.urlsafe())
+    if displayName:
+        setattr(cf, 'organizerDisplayName', displayName)
+    cf.check_initialized()
+    return cf
+
+
+def _reflective_session_to_form(session, speaker):
+    # ConferenceApi._copy_session_to_form before precompiled mappers
+    ss = SessionForm()
+    for field in ss.all_fields():
+        if hasattr(session, field.name):
+            if field.name == 'date':
+                setattr(ss, field.name, str(getattr(session, field.name)))
+            elif field.name == 'startTime':
+                setattr(ss, field.name, str(getattr(session, field.name)))
+            elif field.name == 'speakerKey':
+                if speaker:
+                    setattr(ss, field.name, speaker.key.urlsafe())
+                    setattr(ss, 'speakerName', speaker.name)
+            else:
+                setattr(ss, field.name, getattr(session, field.name))
+        elif field.name == "websafeKey":
+            setattr(ss, field.name, session.key.urlsafe())
+    ss.check_initialized()
+    return ss
+
+
+def run_mappers(args):
+    """
+    Microbenchmark copying args.mappers entities to forms with reflection
+    over all_fields() and with the precompiled mappers.
+    """
+    tb = setup_testbed()
+    try:
+        rng = random.Random(args.seed)
+        speaker = Speaker(key=ndb.Key(Speaker, 1), name='Speaker')
+        conferences, sessions = [], []
+        for i in range(args.mappers):
+            start = START_DATE + datetime.timedelta(days=rng.randint(0, 364))
+            conferences.append(Conference(
+                key=ndb.Key(Conference, i + 1), name='Conference {}'.format(i),
+                description='Conference {}'.format(i),
+                topics=rng.sample(TOPICS, 2), city=rng.choice(CITIES),
+                startDate=start, endDate=start + datetime.timedelta(days=2),
+                month=start.month, maxAttendees=100, seatsAvailable=50))
+            sessions.append(Session(
+                key=ndb.Key(Session, i + 1), name='Session {}'.format(i),
+                conferenceKey='conference', speakerKey='speaker',
+                highlights=rng.sample(TOPICS, 1), duration=60,
+                typeOfSession=rng.choice(SESSION_TYPES), date=start,
+                startTime=datetime.time(9 + i % 9)))
+
+        cases = [
+            ('conference to form',
+             lambda: [_reflective_conference_to_form(c, 'User')
+                      for c in conferences],
+             lambda: [ConferenceApi._copy_conference_to_form(c, 'User')
+                      for c in conferences]),
+            ('session to form',
+             lambda: [_reflective_session_to_form(sess, speaker)
+                      for sess in sessions],
+             lambda: [ConferenceApi._copy_session_to_form(sess, speaker)
+                      for sess in sessions]),
+            ('form to dict',
+             lambda: [{field.name: getattr(form, field.name)
+                       for field in form.all_fields()} for form in forms],
+             lambda: [api.SESSION_MAPPER.to_dict(form) for form in forms]),
+        ]
+        forms = [ConferenceApi._copy_session_to_form(sess, speaker)
+                 for sess in sessions]
+        print('{:<24} {:>14} {:>14} {:>8}'.format(
+            '{} rows'.format(args.mappers), 'reflective ms', 'mapper ms',
+            'speedup'))
+        for label, reflective, mapper in cases:
+            times = []
+            for copy in (reflective, mapper):
+                # best of repeats, to leave out collections and warm up
+                best = None
+                for _ in range(args.repeat):
+                    started = time.time()
+                    copy()
+                    elapsed = 1000 * (time.time() - started)
+                    best = elapsed if best is None else min(best, elapsed)
+                times.append(best)
+            print('{:<24} {:>14.2f} {:>14.2f} {:>7.1f}x'.format(
+                label, times[0], times[1], times[0] / times[1]))
+    finally:
+        tb.deactivate()
+    return 0
+
+
+def run_mail(args):
+    """
+    Benchmark queueing args.mail emails and sending them in batches from
+    the mail pull queue with the local mail backend.
+    """
+    tb = setup_testbed()
+    install_hooks()
+    try:
+        start_request('enqueue')
+        for i in range(args.mail):
+            enqueue_mail('user{}@{}'.format(i, AUTH_DOMAIN), 'Benchmark',
+                         'Benchmark email {}'.format(i))
+        enqueued = end_request()
+        start_request('drain')
+        backend = drain_mail_queue(LocalMailBackend())
+        drained = end_request()
+        print('{:<10} {:>10} {:>10}'.format(
+            '{} emails'.format(args.mail), 'ms', 'taskqueue'))
+        for label, stats in (('enqueue', enqueued), ('drain', drained)):
+            print('{:<10} {:>10.1f} {:>10}'.format(
+                label, stats.elapsed_ms, stats.count('taskqueue')))
+        print(json.dumps(backend.as_dict(), sort_keys=True))
+    finally:
+        tb.deactivate()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark ConferenceApi endpoints over the App Engine '
+                    'testbed stubs.')
+    parser.add_argument('--profiles', type=int, default=20)
+    parser.add_argument('--conferences', type=int, default=20)
+    parser.add_argument('--speakers', type=int, default=10)
+    parser.add_argument('--sessions', type=int, default=5,
+                        help='sessions per conference')
+    parser.add_argument('--registrations', type=int, default=3,
+                        help='conferences attended per profile')
+    parser.add_argument('--wishlist', type=int, default=3,
+                        help='sessions in the wishlist per profile')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='calls per endpoint')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cold', action='store_true',
+                        help='flush memcache before every call')
+    parser.add_argument('--verbose', action='store_true',
+                        help='print the calls per API method')
+    parser.add_argument('--max-datastore-rpcs', type=float, default=None,
+                        help='fail if any endpoint makes more datastore RPCs '
+                             'per call, to catch N+1 regressions')
+    parser.add_argument('--mappers', type=int, default=0, metavar='ROWS',
+                        help='only run the form mappers microbenchmark, '
+                             'copying ROWS entities')
+    parser.add_argument('--mail', type=int, default=0, metavar='EMAILS',
+                        help='only run the batched email benchmark, '
+                             'sending EMAILS emails')
+    args = parser.parse_args()
+    if args.mappers:
+        return run_mappers(args)
+    if args.mail:
+        return run_mail(args)
+    return run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+ * Project: udacity-fsnd-p4-conference-app
+ * File: index_advisor
+ * Composite index advisor for the ConferenceApi queries.
+
+Enumerates the query shapes ConferenceApi._build_queries can produce for
+queryConferences and queryConferenceSessions filters, plus the fixed queries
+of other endpoints, and proposes a minimal index.yaml relying on zigzag merge
+joins: one index per equality property sharing the sort suffix, instead of
+one index per combination of equality properties. Reports how many shapes
+each index set serves and the estimated index writes per entity put.
+
+Usage:
+    python index_advisor.py [--index index.yaml] [--output proposed.yaml]
+                            [--check]
+"""
+import argparse
+import ast
+import collections
+import itertools
+import os
+import sys
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+Query = collections.namedtuple('Query', [
+    'source', 'kind', 'ancestor', 'equalities', 'inequality', 'orders',
+    'projection'])
+Index = collections.namedtuple('Index', ['kind', 'ancestor', 'properties'])
+
+# queries of other endpoints, which do not come from user filters
+FIXED_QUERIES = [
+    Query('getConferencesAvailableByMonth', 'Conference', False, ('month',),
+          'seatsAvailable', ('seatsAvailable', 'name'), ()),
+    Query('getConferencesByDateRange', 'Conference', False, (), 'startDate',
+          (), ()),
+    Query('filterPlayground', 'Conference', False,
+          ('city', 'topics', 'month'), None, ('name',), ()),
+    Query('nearly sold out announcement', 'Conference', False, (),
+          'seatsAvailable', (), ('name',)),
+    Query('sync seat shards', 'Conference', False, (), 'seatShards', (), ()),
+    Query('getSessionsByDuration', 'Session', False, (), 'duration',
+          ('duration', 'name'), ()),
+    Query('getConferenceSessionsByType', 'Session', True,
+          ('typeOfSession',), None, (), ()),
+    Query('getSessionsBySpeaker', 'Session', False, ('speakerKey',), None,
+          (), ()),
+    Query('getSessionsByLocation', 'Session', False, ('city',), None, (),
+          ()),
+    Query('promote waitlist', 'WaitlistEntry', False, ('conferenceKey',),
+          None, ('joined',), ()),
+    Query('searchSpeakers', 'Speaker', False, ('prefixes',), None,
+          ('name',), ()),
+]
+
+# (kind, ancestor, query form fields dict name, source) of filter queries
+FILTER_QUERIES = [
+    ('Conference', False, 'FIELDS', 'queryConferences'),
+    ('Session', True, 'SESSION_FIELDS', 'queryConferenceSessions'),
+]
+
+
+def read_dicts(path, names):
+    """Read module level dict literals from a Python file, without importing
+    it (and the App Engine SDK)."""
+    values = {}
+    for node in ast.parse(open(path).read()).body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and \
+                getattr(node.targets[0], 'id', None) in names:
+            values[node.targets[0].id] = ast.literal_eval(node.value)
+    return values
+
+
+def read_properties(path):
+    """
+    Read the indexed properties of the ndb models of a Python file.
+
+    Returns:
+        A dict by kind of a dict of property name to True if repeated.
+    """
+    kinds = {}
+    for node in ast.parse(open(path).read()).body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        props = {}
+        for stmt in node.body:
+            if not (isinstance(stmt, ast.Assign) and
+                    isinstance(stmt.value, ast.Call) and
+                    getattr(stmt.value.func, 'attr', '').endswith(
+                        'Property')):
+                continue
+            kwargs = {kw.arg: kw.value for kw in stmt.value.keywords}
+            if 'indexed' in kwargs and not ast.literal_eval(
+                    kwargs['indexed']):
+                continue
+            if stmt.value.func.attr in ('TextProperty', 'BlobProperty',
+                                        'JsonProperty'):
+                continue
+            props[stmt.targets[0].id] = 'repeated' in kwargs and \
+                ast.literal_eval(kwargs['repeated'])
+        if props:
+            kinds[node.name] = props
+    return kinds
+
+
+def read_indexes(path):
+    """Read the composite indexes of an index.yaml file."""
+    indexes, current = [], None
+    for line in open(path):
+        line = line.split('#', 1)[0].strip()
+        if line.startswith('- kind:'):
+            if current:
+                indexes.append(Index(*current))
+            current = [line.split(':', 1)[1].strip(), False, ()]
+        elif line.startswith('ancestor:') and current:
+            current[1] = line.split(':', 1)[1].strip() in ('yes', 'true')
+        elif line.startswith('- name:') and current:
+            current[2] += (line.split(':', 1)[1].strip(),)
+    if current:
+        indexes.append(Index(*current))
+    return indexes
+
+
+def build_queries(source, kind, ancestor, equalities, inequalities,
+                  separate_equalities=False):
+    """
+    Return the queries ConferenceApi._build_queries builds for filters on
+    equality and inequality fields.
+
+    Args:
+        separate_equalities: True to model keys-only queries on a single
+            inequality field each, intersected with an equality filters only
+            query, instead of repeating the equality filters in each one.
+    """
+    if len(inequalities) <= 1:
+        orders = tuple(inequalities) + ('name',)
+        return [Query(source, kind, ancestor, tuple(equalities),
+                      inequalities[0] if inequalities else None, orders, ())]
+    if separate_equalities:
+        queries = [Query(source, kind, ancestor, (), field, (), ())
+                   for field in inequalities]
+        if equalities:
+            queries.append(Query(source, kind, ancestor, tuple(equalities),
+                                 None, (), ()))
+        return queries
+    # a keys-only query per inequality field, with the equality filters
+    return [Query(source, kind, ancestor, tuple(equalities), field, (), ())
+            for field in inequalities]
+
+
+def enumerate_queries(fields, separate_equalities=False):
+    """Return the queries of all filter shapes, every field being unused,
+    filtered by equality or by inequality."""
+    queries = []
+    for kind, ancestor, fields_name, source in FILTER_QUERIES:
+        names = sorted(fields[fields_name].values())
+        for shape in itertools.product((None, '=', '<'), repeat=len(names)):
+            equalities = [n for n, op in zip(names, shape) if op == '=']
+            inequalities = [n for n, op in zip(names, shape) if op == '<']
+            queries.extend(build_queries(source, kind, ancestor, equalities,
+                                         inequalities, separate_equalities))
+    return queries + FIXED_QUERIES
+
+
+def required_indexes(query, merge):
+    """
+    Return the composite indexes a query needs.
+
+    Args:
+        query: The Query.
+        merge: True to rely on zigzag merge joins, with an index per equality
+            property, False for a single index with all of them.
+
+    Returns:
+        A set of Index, empty if built-in indexes serve the query.
+    """
+    suffix = list(query.orders) or (
+        [query.inequality] if query.inequality else [])
+    suffix += [p for p in query.projection
+               if p not in suffix and p not in query.equalities]
+    # only equality and ancestor filters, merged over built-in indexes
+    if not suffix:
+        return set()
+    # a single property inequality or sort order
+    if not query.equalities and not query.ancestor and len(suffix) == 1:
+        return set()
+    if not query.equalities:
+        return {Index(query.kind, query.ancestor, tuple(suffix))}
+    if merge:
+        return {Index(query.kind, query.ancestor, (p,) + tuple(suffix))
+                for p in sorted(set(query.equalities))}
+    return {Index(query.kind, query.ancestor,
+                  tuple(sorted(set(query.equalities))) + tuple(suffix))}
+
+
+def serves(indexes, query):
+    """Return True if the index set serves the query, with a single index
+    or merge joins."""
+    return required_indexes(query, merge=True) <= indexes or \
+        required_indexes(query, merge=False) <= indexes
+
+
+def index_rows(index, properties, repeated_values):
+    """Return the entries an entity writes to a composite index, one per
+    combination of values of its repeated properties."""
+    rows = 1
+    for name in index.properties:
+        if properties.get(name):
+            rows *= repeated_values
+    return rows
+
+
+def write_costs(kind, indexes, properties, repeated_values, updated=None):
+    """
+    Estimate the index writes of a put of an entity of a kind.
+
+    Args:
+        kind: The entity kind.
+        indexes: The composite indexes.
+        properties: A dict of indexed property name to True if repeated.
+        repeated_values: The number of values of repeated properties.
+        updated: The property changed by an update, None for an insert.
+
+    Returns:
+        A tuple with the composite index writes and the total writes,
+        counting the entity, the ascending and descending built-in indexes
+        and deleting the previous entries on updates.
+    """
+    kind_indexes = [index for index in indexes if index.kind == kind]
+    if updated is None:
+        composite = sum(index_rows(index, properties, repeated_values)
+                        for index in kind_indexes)
+        builtin = sum(2 * (repeated_values if repeated else 1)
+                      for repeated in properties.values())
+        return composite, 1 + builtin + composite
+    composite = sum(2 * index_rows(index, properties, repeated_values)
+                    for index in kind_indexes
+                    if updated in index.properties)
+    return composite, 1 + 4 + composite
+
+
+def format_index_yaml(indexes):
+    lines = ['indexes:', '',
+             '# Proposed by index_advisor.py: composite indexes for all',
+             '# ConferenceApi query shapes, relying on zigzag merge joins.',
+             '']
+    for index in sorted(indexes):
+        lines.append('- kind: {}'.format(index.kind))
+        if index.ancestor:
+            lines.append('  ancestor: yes')
+        lines.append('  properties:')
+        lines.extend('  - name: {}'.format(p) for p in index.properties)
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Propose a minimal index.yaml for the ConferenceApi '
+                    'query shapes.')
+    parser.add_argument('--index', default=os.path.join(APP_DIR, 'index.yaml'),
+                        help='current index.yaml')
+    parser.add_argument('--output',
+                        help='write the proposed index.yaml to this file')
+    parser.add_argument('--repeated-values', type=int, default=2,
+                        help='values per repeated property, e.g. topics')
+    parser.add_argument('--check', action='store_true',
+                        help='exit with an error if the current index.yaml '
+                             'differs from the proposed one')
+    args = parser.parse_args()
+
+    fields = read_dicts(os.path.join(APP_DIR, 'api.py'),
+                        ('FIELDS', 'SESSION_FIELDS'))
+    properties = read_properties(os.path.join(APP_DIR, 'models.py'))
+    queries = enumerate_queries(fields)
+    current = set(read_indexes(args.index))
+    exact = set().union(*[required_indexes(q, merge=False)
+                          for q in queries])
+    proposed = set().union(*[required_indexes(q, merge=True)
+                             for q in queries])
+    # shapes served by a smaller set if multiple inequality queries did not
+    # repeat the equality filters
+    separate_queries = enumerate_queries(fields, separate_equalities=True)
+    separate = set().union(*[required_indexes(q, merge=True)
+                             for q in separate_queries])
+
+    for kind in ('Conference', 'Session'):
+        kind_queries = [q for q in queries if q.kind == kind]
+        print('{}: {} queries'.format(kind, len(kind_queries)))
+        header = '  {:<24} {:>8} {:>8} {:>10} {:>10} {:>12}'.format(
+            'index set', 'indexes', 'shapes', 'composite', 'writes',
+            'writes')
+        print(header)
+        print('  {:<24} {:>8} {:>8} {:>10} {:>10} {:>12}'.format(
+            '', '', 'served', 'rows/put', 'per put',
+            'per seat' if kind == 'Conference' else ''))
+        for label, indexes, shapes in (
+                ('current index.yaml', current, queries),
+                ('one index per shape', exact, queries),
+                ('proposed merge joins', proposed, queries),
+                ('+ separate equalities', separate, separate_queries)):
+            shapes = [q for q in shapes if q.kind == kind]
+            served = '{}/{}'.format(
+                sum(1 for q in shapes if serves(indexes, q)), len(shapes))
+            composite, writes = write_costs(kind, indexes, properties[kind],
+                                            args.repeated_values)
+            line = '  {:<24} {:>8} {:>8} {:>10} {:>10}'.format(
+                label, sum(1 for i in indexes if i.kind == kind), served,
+                composite, writes)
+            if kind == 'Conference':
+                # registrations update seatsAvailable
+                line += ' {:>12}'.format(write_costs(
+                    kind, indexes, properties[kind], args.repeated_values,
+                    updated='seatsAvailable')[1])
+            print(line)
+        unserved = sorted({q.source for q in kind_queries
+                           if not serves(current, q)})
+        if unserved:
+            print('  current index.yaml misses shapes of: {}'.format(
+                ', '.join(unserved)))
+        print('')
+
+    print('Indexes to drop: {}, to add: {}'.format(
+        len(current - proposed), len(proposed - current)))
+    if args.check:
+        for label, indexes in (('drop', current - proposed),
+                               ('add', proposed - current)):
+            for index in sorted(indexes):
+                print('  {} {}{}: {}'.format(
+                    label, index.kind, ' (ancestor)' if index.ancestor else '',
+                    ', '.join(index.properties)))
+        return 1 if current != proposed else 0
+    yaml = format_index_yaml(proposed)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(yaml)
+        print('Proposed index.yaml written to {}'.format(args.output))
+    else:
+        print('')
+        print(yaml)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+ * Project: udacity-fsnd-p4-conference-app
+ * File: instrumentation
+ * Per-request RPC accounting and slow request log.
+"""
+import collections
+import json
+import logging
+import threading
+import time
+
+from google.appengine.api import apiproxy_stub_map
+from settings import SLOW_REQUEST_THRESHOLD_MS
+
+_local = threading.local()
+
+
+class RequestStats(object):
+    """
+    RequestStats -- Number and duration of the API calls (datastore,
+    memcache, taskqueue, urlfetch...) made by a request, by service and
+    method.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self.ended = None
+        # (service, call) -> [count, total ms]
+        self.calls = collections.defaultdict(lambda: [0, 0.0])
+        self._pending = {}
+
+    def rpc_started(self, service, call, rpc):
+        self.calls[(service, call)][0] += 1
+        self._pending[id(rpc)] = time.time()
+
+    def rpc_ended(self, service, call, rpc):
+        started = self._pending.pop(id(rpc), None)
+        if started is not None:
+            self.calls[(service, call)][1] += 1000 * (time.time() - started)
+
+    def count(self, service):
+        """Return the number of calls made to an API service."""
+        return sum(count for (svc, _), (count, _) in self.calls.items()
+                   if svc == service)
+
+    @property
+    def elapsed_ms(self):
+        return 1000 * ((self.ended or time.time()) - self.started)
+
+    def as_dict(self):
+        return {
+            'request': self.name,
+            'ms': round(self.elapsed_ms, 1),
+            'rpcs': {'{}.{}'.format(service, call): {
+                'count': count, 'ms': round(ms, 1)}
+                for (service, call), (count, ms) in self.calls.items()},
+        }
+
+
+def start_request(name):
+    """
+    Start recording the API calls of the current thread request.
+
+    Args:
+        name: The name of the request, e.g. its path.
+
+    Returns:
+        The RequestStats of the request.
+    """
+    _local.stats = RequestStats(name)
+    return _local.stats
+
+
+def end_request():
+    """Stop recording and return the RequestStats of the current request."""
+    stats = getattr(_local, 'stats', None)
+    _local.stats = None
+    if stats:
+        stats.ended = time.time()
+    return stats
+
+
+def _pre_call_hook(service, call, request, response, rpc):
+    stats = getattr(_local, 'stats', None)
+    if stats:
+        stats.rpc_started(service, call, rpc)
+
+
+def _post_call_hook(service, call, request, response, rpc, error):
+    stats = getattr(_local, 'stats', None)
+    if stats:
+        stats.rpc_ended(service, call, rpc)
+
+
+def install_hooks():
+    """Install the apiproxy hooks recording API calls, once per process."""
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Append(
+        'request_stats', _pre_call_hook)
+    apiproxy_stub_map.apiproxy.GetPostCallHooks().Append(
+        'request_stats', _post_call_hook)
+
+
+class RequestStatsMiddleware(object):
+    """
+    RequestStatsMiddleware -- WSGI middleware recording the API calls of
+    every request, logging those slower than a threshold with the calls
+    breakdown as JSON.
+    """
+
+    def __init__(self, app, threshold_ms=SLOW_REQUEST_THRESHOLD_MS):
+        self.app = app
+        self.threshold_ms = threshold_ms
+        install_hooks()
+
+    def __call__(self, environ, start_response):
+        start_request('{} {}'.format(environ.get('REQUEST_METHOD'),
+                                     environ.get('PATH_INFO')))
+        status = []
+
+        def _start_response(response_status, headers, exc_info=None):
+            status.append(response_status)
+            return start_response(response_status, headers, exc_info)
+
+        try:
+            # consume the body so API calls made by iterating it are
+            # accounted too
+            result = self.app(environ, _start_response)
+            try:
+                return list(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        finally:
+            stats = end_request()
+            if stats.elapsed_ms >= self.threshold_ms:
+                log = stats.as_dict()
+                log['status'] = status[0] if status else None
+                logging.warning('Slow request: %s', json.dumps(log,
+                                                               sort_keys=True))
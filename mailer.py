@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+ * Project: udacity-fsnd-p4-conference-app
+ * File: mailer
+ * Batched email delivery through a pull queue and pluggable mail backends.
+"""
+import json
+import logging
+import time
+
+from google.appengine.api import app_identity
+from google.appengine.api import mail
+from google.appengine.api import taskqueue
+from settings import MAIL_BACKEND
+
+MAIL_QUEUE = 'mail'
+MAIL_BATCH_SIZE = 100
+MAIL_LEASE_SECONDS = 60
+# emails failing more times are dropped
+MAIL_MAX_RETRIES = 5
+
+
+class MailBackend(object):
+    """
+    MailBackend -- Sends batches of emails, recording how many were sent or
+    failed and the time spent sending them. Subclasses implement _send.
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.batches = 0
+        self.elapsed = 0.0
+
+    def _send(self, message):
+        """
+        Send an email.
+
+        Args:
+            message: A dict with sender, to, subject and body.
+        """
+        raise NotImplementedError
+
+    def send_batch(self, messages):
+        """
+        Send a batch of emails. An email failing does not stop the batch.
+
+        Args:
+            messages: A list of dicts with sender, to, subject and body.
+
+        Returns:
+            A list with True for each email sent and False for each failed.
+        """
+        started = time.time()
+        results = []
+        for message in messages:
+            try:
+                self._send(message)
+                results.append(True)
+            except Exception:
+                logging.exception('Failed to send email to %s',
+                                  message.get('to'))
+                results.append(False)
+        self.elapsed += time.time() - started
+        self.batches += 1
+        self.sent += results.count(True)
+        self.failed += results.count(False)
+        return results
+
+    @property
+    def throughput(self):
+        """Emails sent per second spent sending."""
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'backend': self.__class__.__name__,
+            'sent': self.sent,
+            'failed': self.failed,
+            'batches': self.batches,
+            'ms': round(1000 * self.elapsed, 1),
+            'perSecond': round(self.throughput, 1),
+        }
+
+
+class AppEngineMailBackend(MailBackend):
+    """AppEngineMailBackend -- Sends emails with the App Engine Mail API"""
+
+    def _send(self, message):
+        mail.send_mail(message['sender'], message['to'], message['subject'],
+                       message['body'])
+
+
+class LocalMailBackend(MailBackend):
+    """
+    LocalMailBackend -- Keeps emails in an outbox instead of sending them,
+    for tests, benchmarks and local development
+    """
+
+    def __init__(self):
+        super(LocalMailBackend, self).__init__()
+        self.outbox = []
+
+    def _send(self, message):
+        self.outbox.append(message)
+
+
+MAIL_BACKENDS = {
+    'appengine': AppEngineMailBackend,
+    'local': LocalMailBackend,
+}
+
+
+def get_mail_backend():
+    """Return a new instance of the mail backend set in settings."""
+    return MAIL_BACKENDS[MAIL_BACKEND]()
+
+
+def enqueue_mail(to, subject, body, sender=None):
+    """
+    Add an email to the mail pull queue, to be sent in a batch by
+    drain_mail_queue.
+
+    Args:
+        to: The recipient email address.
+        subject: The email subject.
+        body: The email plain text body.
+        sender: The sender email address, the app noreply address if None.
+    """
+    payload = json.dumps({
+        'sender': sender or 'noreply@{}.appspotmail.com'.format(
+            app_identity.get_application_id()),
+        'to': to,
+        'subject': subject,
+        'body': body,
+    })
+    taskqueue.Queue(MAIL_QUEUE).add(
+        taskqueue.Task(payload=payload, method='PULL'))
+
+
+def drain_mail_queue(backend=None, batch_size=MAIL_BATCH_SIZE,
+                     deadline=None):
+    """
+    Lease batches of emails from the mail pull queue and send them, until
+    the queue is empty or the deadline passes. Tasks of sent emails are
+    deleted, and failed ones are leased again once their lease expires.
+
+    Args:
+        backend: The MailBackend, the one set in settings if None.
+        batch_size: The number of emails leased at once.
+        deadline: The time.time() to stop at, None to drain the queue.
+
+    Returns:
+        The MailBackend, with the throughput metrics of the run.
+    """
+    backend = backend or get_mail_backend()
+    queue = taskqueue.Queue(MAIL_QUEUE)
+    while deadline is None or time.time() < deadline:
+        tasks = queue.lease_tasks(MAIL_LEASE_SECONDS, batch_size)
+        if not tasks:
+            break
+        done = [task for task in tasks if task.retry_count > MAIL_MAX_RETRIES]
+        for task in done:
+            logging.error('Dropping email task %s after %d retries',
+                          task.name, task.retry_count)
+        pending = [task for task in tasks
+                   if task.retry_count <= MAIL_MAX_RETRIES]
+        results = backend.send_batch(
+            [json.loads(task.payload) for task in pending])
+        done.extend(task for task, sent in zip(pending, results) if sent)
+        if done:
+            queue.delete_tasks(done)
+    if backend.batches:
+        logging.info('Mail queue drained: %s',
+                     json.dumps(backend.as_dict(), sort_keys=True))
+    return backend
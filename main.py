@@ -7,42 +7,174 @@
  * Date: 3/23/16
  * Time: 12:15 AM
 """
+import json
+import time
+
 import webapp2
-from google.appengine.api import app_identity
-from google.appengine.api import mail
+from google.appengine.api import datastore_errors
+from google.appengine.ext import ndb
+from google.net.proto.ProtocolBuffer import ProtocolBufferDecodeError
 from api import ConferenceApi
+from instrumentation import RequestStatsMiddleware
+from mailer import drain_mail_queue
+
+# stop draining the mail queue before the next cron run
+MAIL_DRAIN_SECONDS = 50
+
+EXPORT_CONTENT_TYPES = {
+    'ics': 'text/calendar; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
 
 
 class SetAnnouncementHandler(webapp2.RequestHandler):
     def get(self):
         """Set Announcement in Memcache."""
+        # sync sharded seats first so announcement sees up to date seats
+        ConferenceApi._sync_seat_shards()
         announcement = ConferenceApi._cache_announcement()
         self.response.write(announcement)
 
 
+class CacheStatsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Return cache hit and miss counters as JSON."""
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(ConferenceApi._get_cache_stats()))
+
+
+class SendEmailsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Send queued emails in batches."""
+        backend = drain_mail_queue(deadline=time.time() + MAIL_DRAIN_SECONDS)
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(backend.as_dict()))
+
+
 class SendConfirmationEmailHandler(webapp2.RequestHandler):
     def post(self):
-        """Send email confirming Conference creation."""
-        mail.send_mail(
-            'noreply@%s.appspotmail.com' % (
-                app_identity.get_application_id()),     # from
-            self.request.get('email'),                  # to
-            'You created a new Conference!',            # subj
-            'Hi, you have created the following '       # body
-            'conference:\r\n\r\n%s' % self.request.get(
-                'conferenceInfo')
-        )
+        """Queue email confirming Conference creation, from tasks enqueued
+        before emails were sent in batches."""
+        ConferenceApi._enqueue_confirmation_email(
+            self.request.get('email'), self.request.get('conferenceInfo'))
 
 
 class CheckFeaturedSpeakerHandler(webapp2.RedirectHandler):
     def post(self):
-        featured_speaker = ConferenceApi._check_speaker(
-            self.request.get('speakerKey'),
-            self.request.get('sessionKey')
+        """Set featured speakers of a Conference in Memcache."""
+        wsck = self.request.get('websafeConferenceKey')
+        if not wsck:
+            # tasks enqueued before featured speakers were per conference
+            wsck = ndb.Key(
+                urlsafe=self.request.get('sessionKey')).parent().urlsafe()
+        ConferenceApi._cache_featured_speakers(wsck)
+
+
+class SyncSessionCityHandler(webapp2.RequestHandler):
+    def get(self):
+        """Start backfill of the city of all Sessions."""
+        ConferenceApi._sync_session_cities()
+
+    def post(self):
+        """Copy the conference city to a batch of Sessions."""
+        ConferenceApi._sync_session_cities(
+            self.request.get('websafeConferenceKey') or None,
+            self.request.get('cursor') or None
+        )
+
+
+class IndexConferencesHandler(webapp2.RequestHandler):
+    def get(self):
+        """Start indexing all Conferences for search."""
+        ConferenceApi._index_all_conferences()
+
+    def post(self):
+        """Index a Conference, or a batch of Conferences, for search."""
+        wsck = self.request.get('websafeConferenceKey')
+        if wsck:
+            ConferenceApi._update_conference_document(wsck)
+        else:
+            ConferenceApi._index_all_conferences(
+                self.request.get('cursor') or None
+            )
+
+
+class IndexSpeakersHandler(webapp2.RequestHandler):
+    def get(self):
+        """Start indexing all Speakers for autocomplete."""
+        ConferenceApi._index_all_speakers()
+
+    def post(self):
+        """Index a batch of Speakers for autocomplete."""
+        ConferenceApi._index_all_speakers(
+            self.request.get('cursor') or None
+        )
+
+
+class MigrateRegistrationsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Start moving all Profile registrations to Registrations."""
+        ConferenceApi._migrate_registrations()
+
+    def post(self):
+        """Move the registrations of a batch of Profiles."""
+        ConferenceApi._migrate_registrations(
+            self.request.get('cursor') or None
         )
 
-app = webapp2.WSGIApplication([
+
+class PromoteWaitlistHandler(webapp2.RequestHandler):
+    def post(self):
+        """Register the next user of a Conference waitlist."""
+        ConferenceApi._promote_waitlist(
+            self.request.get('websafeConferenceKey'))
+
+
+class ScheduleExportHandler(webapp2.RequestHandler):
+    def get(self, wsck, export_format):
+        """
+        Export a page of the Sessions of a Conference, as iCalendar or
+        NDJSON. The URL of the next page is sent in a Link header.
+        """
+        try:
+            conf, _ = ConferenceApi._get_conference_view(wsck)
+        except (TypeError, ProtocolBufferDecodeError):
+            conf = None
+        if not conf:
+            self.abort(404)
+        page_token = self.request.get('pageToken') or None
+        try:
+            cursor = ndb.Cursor(urlsafe=page_token) if page_token else None
+        except datastore_errors.BadValueError:
+            self.abort(400)
+
+        etag = ConferenceApi._get_schedule_etag(conf, page_token)
+        self.response.headers['ETag'] = '"{}"'.format(etag)
+        if etag in self.request.if_none_match:
+            self.response.status = 304
+            return
+
+        api = ConferenceApi()
+        forms, next_page_token = api._get_schedule_page(conf, cursor)
+        if next_page_token:
+            self.response.headers['Link'] = '<{}?pageToken={}>; rel="next"'\
+                .format(self.request.path, next_page_token)
+        self.response.headers['Content-Type'] = \
+            EXPORT_CONTENT_TYPES[export_format]
+        for chunk in api._export_schedule(conf, forms, export_format):
+            self.response.write(chunk)
+
+
+app = RequestStatsMiddleware(webapp2.WSGIApplication([
     ('/crons/set_announcement', SetAnnouncementHandler),
+    ('/crons/send_emails', SendEmailsHandler),
+    ('/admin/cache_stats', CacheStatsHandler),
     ('/tasks/send_confirmation_email', SendConfirmationEmailHandler),
     ('/tasks/check_featured_speaker', CheckFeaturedSpeakerHandler),
-], debug=True)
+    ('/tasks/sync_session_city', SyncSessionCityHandler),
+    ('/tasks/index_conferences', IndexConferencesHandler),
+    ('/tasks/index_speakers', IndexSpeakersHandler),
+    ('/tasks/migrate_registrations', MigrateRegistrationsHandler),
+    ('/tasks/promote_waitlist', PromoteWaitlistHandler),
+    (r'/conference/([^/]+)/schedule\.(ics|ndjson)', ScheduleExportHandler),
+], debug=True))
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+ * Project: udacity-fsnd-p4-conference-app
+ * File: mappers
+ * Copy between ndb entities and ProtoRPC messages with precompiled plans.
+"""
+import operator
+
+from protorpc import messages
+
+
+def _attrgetter(names):
+    """Return a function getting a tuple of the named attributes."""
+    if len(names) == 1:
+        getter = operator.attrgetter(names[0])
+        return lambda obj: (getter(obj),)
+    return operator.attrgetter(*names)
+
+
+class FormMapper(object):
+    """
+    FormMapper -- Copy entities of an ndb Model to a ProtoRPC Message, and
+    messages back to dicts of fields, with a field plan compiled once instead
+    of reflecting over all_fields() for every row.
+    """
+
+    def __init__(self, model_class, form_class, converters=None, exclude=()):
+        """
+        Compile the field plan of a model and message pair.
+
+        Args:
+            model_class: The ndb Model class.
+            form_class: The ProtoRPC Message class.
+            converters: A dict of message field name to a function converting
+                the entity value to the message value.
+            exclude: Names of message fields not copied from entities.
+        """
+        self.form_class = form_class
+        self._model_class = model_class
+        self._converters = converters or {}
+        form_fields = sorted(form_class.all_fields(),
+                             key=lambda field: field.number)
+        self._entity_fields = [field for field in form_fields
+                               if hasattr(model_class, field.name) and
+                               field.name not in exclude]
+        # plans by the set of copied fields, None for all fields
+        self._plans = {}
+        self.field_names = [field.name for field in form_fields]
+        self._get_form_values = _attrgetter(self.field_names)
+        self._required_fields = [field for field in form_fields
+                                 if field.required]
+        self._has_message_fields = any(
+            isinstance(field, messages.MessageField) for field in form_fields)
+
+    def _compile(self, fields):
+        """
+        Return the entity values getter, the copy plan of a set of fields
+        and whether the forms it copies are always initialized, compiled
+        once per set.
+
+        Args:
+            fields: A frozenset of message field names, None for all fields.
+
+        Returns:
+            A tuple with the getter, a list of (field, converter) and True if
+            every required message field is copied from a required model
+            property.
+        """
+        plan = self._plans.get(fields)
+        if plan is None:
+            copied = [field for field in self._entity_fields
+                      if fields is None or field.name in fields]
+            getter = _attrgetter([field.name for field in copied]) \
+                if copied else lambda entity: ()
+            initialized = not self._has_message_fields and all(
+                field in copied and
+                getattr(self._model_class, field.name)._required
+                for field in self._required_fields)
+            plan = self._plans[fields] = (getter, [
+                (field, self._converters.get(field.name))
+                for field in copied], initialized)
+        return plan
+
+    def to_form(self, entity, fields=None, **extra):
+        """
+        Copy an entity to a new message. Only the copied fields are read
+        from the entity, so it can be the result of a projection query.
+
+        Args:
+            entity: The ndb Model object.
+            fields: A frozenset of the message field names to copy, None for
+                all fields.
+            **extra: Values of message fields not in the model.
+
+        Returns:
+            A form_class object.
+        """
+        get_entity_values, plan, _ = self._compile(fields)
+        form = self.form_class()
+        for (field, convert), value in zip(plan, get_entity_values(entity)):
+            if convert is not None:
+                value = convert(value)
+            if value is not None:
+                # set through the field descriptor, the field name being
+                # known to the message class
+                field.__set__(form, value)
+        for name, value in extra.iteritems():
+            if fields is None or name in fields:
+                setattr(form, name, value)
+        return form
+
+    def check_initialized(self, form, fields=None):
+        """
+        Check that a message copied by to_form has all its required fields
+        set, skipping the check when the plan copies every required field
+        from a required model property.
+
+        Args:
+            form: The form_class object.
+            fields: The fields argument given to to_form.
+
+        Raises:
+            messages.ValidationError: If a required field is missing.
+        """
+        if not self._compile(fields)[2]:
+            form.check_initialized()
+
+    def to_dict(self, form):
+        """
+        Copy all fields of a message (or a request containing them) to a
+        dict.
+
+        Args:
+            form: The form_class object.
+
+        Returns:
+            A dict of field name to value.
+        """
+        return dict(zip(self.field_names, self._get_form_values(form)))
@@ -7,20 +7,138 @@
  * Date: 3/23/16
  * Time: 12:23 AM
 """
+import contextlib
+import functools
+import hashlib
 import httplib
+import json
+import time
+
 import endpoints
 from protorpc import messages
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
 from google.appengine.ext import ndb
 
+MEMCACHE_SESSIONS_VERSION_PREFIX = "SESSIONS VERSION "
+MEMCACHE_GENERATION_PREFIX = "GENERATION "
+MEMCACHE_PROFILE_VERSION_PREFIX = "PROFILE VERSION "
+MEMCACHE_REGISTRATIONS_VERSION_PREFIX = "REGISTRATIONS VERSION "
+MEMCACHE_CONFERENCE_PREFIX = "CONFERENCE "
+
+
+def _incr_counters(keys):
+    """
+    Increment memcache version counters in a single RPC. Counters start
+    from the current time so a counter evicted from memcache is not reused.
+
+    Args:
+        keys: The memcache keys of the counters.
+    """
+    if keys:
+        memcache.offset_multi(dict.fromkeys(keys, 1),
+                              initial_value=int(time.time() * 1000))
+
+
+def _flush_counters(ctx):
+    """Increment the counters bumped in a context batch, ending it."""
+    keys = ctx._counter_batch
+    del ctx._counter_batch
+    _incr_counters(keys)
+
+
+def bump_counter(key):
+    """
+    Increment a memcache version counter. In a transaction, the counters
+    bumped by its puts are incremented once, when it commits. Inside a
+    batch_counters block, they are incremented once, when the block ends.
+
+    Args:
+        key: The memcache key of the counter.
+    """
+    ctx = ndb.get_context()
+    batch = getattr(ctx, '_counter_batch', None)
+    if batch is not None:
+        batch.add(key)
+    elif ndb.in_transaction():
+        ctx._counter_batch = {key}
+        ctx.call_on_commit(lambda: _flush_counters(ctx))
+    else:
+        _incr_counters([key])
+
+
+@contextlib.contextmanager
+def batch_counters():
+    """
+    Context manager incrementing the counters bumped by the puts in the
+    block once each, when it ends, instead of once per entity put.
+    """
+    ctx = ndb.get_context()
+    if getattr(ctx, '_counter_batch', None) is not None:
+        # already batched by an enclosing block
+        yield
+        return
+    ctx._counter_batch = set()
+    try:
+        yield
+    finally:
+        _flush_counters(ctx)
+
+
+class VersionedModel(ndb.Model):
+    """
+    VersionedModel -- Model with a version stamp bumped on every put, used
+    to compute ETags
+    """
+    version = ndb.IntegerProperty(default=0, indexed=False)
+
+    def _pre_put_hook(self):
+        self.version = (self.version or 0) + 1
 
-class Profile(ndb.Model):
+
+class Profile(VersionedModel):
     """Profile -- User profile object"""
     displayName = ndb.StringProperty()
     mainEmail = ndb.StringProperty()
     teeShirtSize = ndb.StringProperty(default='NOT_SPECIFIED')
+    # legacy registrations, moved to Registration entities by the migrate
+    # registrations task
     conferenceKeysToAttend = ndb.StringProperty(repeated=True)
     sessionsWishlist = ndb.StringProperty(repeated=True)
 
+    def _post_put_hook(self, future):
+        # invalidate ETags of the profile wishlist
+        bump_counter(MEMCACHE_PROFILE_VERSION_PREFIX + self.key.urlsafe())
+
+
+class Registration(ndb.Model):
+    """
+    Registration -- User registration for a Conference, child of the user
+    Profile with the conference websafe key as id, so registering does not
+    rewrite the Profile and attendees can be queried by conference
+    """
+    conferenceKey = ndb.KeyProperty(kind='Conference', required=True)
+
+    def _post_put_hook(self, future):
+        # invalidate ETags of the user conferences to attend
+        bump_counter(MEMCACHE_REGISTRATIONS_VERSION_PREFIX +
+                     self.key.parent().urlsafe())
+
+    @classmethod
+    def _post_delete_hook(cls, key, future):
+        bump_counter(MEMCACHE_REGISTRATIONS_VERSION_PREFIX +
+                     key.parent().urlsafe())
+
+
+class WaitlistEntry(ndb.Model):
+    """
+    WaitlistEntry -- User waiting for a seat of a sold out Conference, child
+    of the user Profile with the conference websafe key as id. Users are
+    registered in joined order as seats are freed
+    """
+    conferenceKey = ndb.KeyProperty(kind='Conference', required=True)
+    joined = ndb.DateTimeProperty(auto_now_add=True)
+
 
 class ProfileMiniForm(messages.Message):
     """ProfileMiniForm -- update Profile form message"""
@@ -37,6 +155,19 @@ class ProfileForm(messages.Message):
     sessionsWishlist = messages.StringField(6, repeated=True)
 
 
+class AttendeeForm(messages.Message):
+    """AttendeeForm -- Conference attendee outbound form message"""
+    displayName = messages.StringField(1)
+    mainEmail = messages.StringField(2)
+    teeShirtSize = messages.EnumField('TeeShirtSize', 3)
+
+
+class AttendeeForms(messages.Message):
+    """AttendeeForms -- multiple AttendeeForm outbound form message"""
+    items = messages.MessageField(AttendeeForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+
+
 class TeeShirtSize(messages.Enum):
     """TeeShirtSize -- t-shirt size enumeration value"""
     NOT_SPECIFIED = 1
@@ -56,7 +187,7 @@ class TeeShirtSize(messages.Enum):
     XXXL_W = 15
 
 
-class Conference(ndb.Model):
+class Conference(VersionedModel):
     """Conference -- Conference object"""
     name = ndb.StringProperty(required=True)
     description = ndb.StringProperty()
@@ -68,6 +199,70 @@ class Conference(ndb.Model):
     endDate = ndb.DateProperty()
     maxAttendees = ndb.IntegerProperty()
     seatsAvailable = ndb.IntegerProperty()
+    seatShards = ndb.IntegerProperty(default=0)
+    # hash of the searchable fields last sent to the search index
+    searchHash = ndb.StringProperty(indexed=False)
+    # city last copied to the conference sessions
+    sessionsCity = ndb.StringProperty(indexed=False)
+
+    @staticmethod
+    def _enqueue_search_update(key):
+        """
+        Enqueue a task updating the search document of a conference, only
+        added if the transaction, if any, commits.
+
+        Args:
+            key: The Conference key.
+        """
+        taskqueue.add(params={'websafeConferenceKey': key.urlsafe()},
+                      url='/tasks/index_conferences',
+                      transactional=ndb.in_transaction())
+
+    @staticmethod
+    def _enqueue_session_city_sync(key):
+        """
+        Enqueue a task copying the city of a conference to its sessions,
+        only added if the transaction, if any, commits, and delete its
+        cached view, which new sessions copy the city from.
+
+        Args:
+            key: The Conference key.
+        """
+        taskqueue.add(params={'websafeConferenceKey': key.urlsafe()},
+                      url='/tasks/sync_session_city',
+                      transactional=ndb.in_transaction())
+        delete_view = functools.partial(
+            memcache.delete, MEMCACHE_CONFERENCE_PREFIX + key.urlsafe())
+        if ndb.in_transaction():
+            ndb.get_context().call_on_commit(delete_view)
+        else:
+            delete_view()
+
+    def _pre_put_hook(self):
+        super(Conference, self)._pre_put_hook()
+        # str and unicode values hash the same, e.g. before and after a get
+        search_hash = hashlib.md5(json.dumps(
+            [self.name, self.description, self.topics])).hexdigest()
+        # seat updates do not change the search document
+        self._search_changed = search_hash != self.searchHash
+        self.searchHash = search_hash
+        # new conferences have no sessions to update
+        self._city_changed = self.version > 1 and \
+            self.city != self.sessionsCity
+        self.sessionsCity = self.city
+
+    def _post_put_hook(self, future):
+        # invalidate cached Conference query results
+        bump_counter(MEMCACHE_GENERATION_PREFIX + self._get_kind())
+        if self._search_changed:
+            self._enqueue_search_update(self.key)
+        if self._city_changed:
+            self._enqueue_session_city_sync(self.key)
+
+    @classmethod
+    def _post_delete_hook(cls, key, future):
+        bump_counter(MEMCACHE_GENERATION_PREFIX + cls._get_kind())
+        cls._enqueue_search_update(key)
 
 
 class ConferenceForm(messages.Message):
@@ -84,11 +279,50 @@ class ConferenceForm(messages.Message):
     endDate = messages.StringField(10)
     websafeKey = messages.StringField(11)
     organizerDisplayName = messages.StringField(12)
+    seatShards = messages.IntegerField(13, variant=messages.Variant.INT32)
+    etag = messages.StringField(14)
+    notModified = messages.BooleanField(15)
+
+
+class IdempotentResponse(ndb.Model):
+    """
+    IdempotentResponse -- First response of a create request sent with an
+    idempotency key, replayed to retries of the request. Root entity with a
+    hash of the user, endpoint and idempotency key as id
+    """
+    requestHash = ndb.StringProperty(indexed=False)
+    response = ndb.TextProperty()
+    created = ndb.DateTimeProperty(auto_now_add=True, indexed=False)
+
+
+class SeatShard(ndb.Model):
+    """
+    SeatShard -- Shard of the seats available of a Conference. Root entity,
+    so registrations on different shards do not contend on the same entity
+    group.
+    """
+    conferenceKey = ndb.StringProperty(required=True, indexed=False)
+    seatsAvailable = ndb.IntegerProperty(default=0, indexed=False)
+
+    def _post_put_hook(self, future):
+        # invalidate ETags of responses with sharded seats
+        bump_counter(MEMCACHE_GENERATION_PREFIX + self._get_kind())
+
+
+class Announcement(ndb.Model):
+    """
+    Announcement -- Conferences nearly sold out, kept up to date by
+    registrations and repaired by the announcement cron job
+    """
+    nearlySoldOut = ndb.JsonProperty(indexed=False)
 
 
 class ConferenceForms(messages.Message):
     """ConferenceForms -- multiple Conference outbound form message"""
     items = messages.MessageField(ConferenceForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+    etag = messages.StringField(3)
+    notModified = messages.BooleanField(4)
 
 
 class ConferenceQueryForm(messages.Message):
@@ -103,6 +337,16 @@ class ConferenceQueryForms(messages.Message):
     ConferenceQueryForms -- multiple ConferenceQueryForm inbound form message
     """
     filters = messages.MessageField(ConferenceQueryForm, 1, repeated=True)
+    pageSize = messages.IntegerField(2, variant=messages.Variant.INT32)
+    pageToken = messages.StringField(3)
+    fields = messages.StringField(4, repeated=True)
+
+
+class ConferenceSearchForm(messages.Message):
+    """ConferenceSearchForm -- Conference search inbound form message"""
+    query = messages.StringField(1, required=True)
+    pageSize = messages.IntegerField(2, variant=messages.Variant.INT32)
+    pageToken = messages.StringField(3)
 
 
 class ConferenceDateRangeForm(messages.Message):
@@ -111,6 +355,7 @@ class ConferenceDateRangeForm(messages.Message):
     """
     startDate = messages.StringField(1)
     endDate = messages.StringField(2)
+    fields = messages.StringField(3, repeated=True)
 
 
 class ConferenceAvailableForm(messages.Message):
@@ -118,6 +363,7 @@ class ConferenceAvailableForm(messages.Message):
     ConferenceAvailableForm -- ConferenceAvailableForm inbound form message
     """
     month = messages.IntegerField(1)
+    fields = messages.StringField(2, repeated=True)
 
 
 class BooleanMessage(messages.Message):
@@ -141,6 +387,22 @@ class Speaker(ndb.Model):
     email = ndb.StringProperty()
     institution = ndb.StringProperty()
     creatorUserId = ndb.StringProperty()
+    # prefixes of the name and email words, for autocomplete
+    prefixes = ndb.StringProperty(repeated=True)
+
+    def _post_put_hook(self, future):
+        # invalidate cached Speaker search results
+        bump_counter(MEMCACHE_GENERATION_PREFIX + self._get_kind())
+
+
+class SpeakerEmail(ndb.Model):
+    """
+    SpeakerEmail -- Unique index of Speakers by normalized email, root
+    entity with the email as id, claimed in the same transaction as the
+    Speaker is created
+    """
+    speakerKey = ndb.KeyProperty(kind='Speaker', required=True,
+                                 indexed=False)
 
 
 class SpeakerForm(messages.Message):
@@ -152,7 +414,12 @@ class SpeakerForm(messages.Message):
     websafeKey = messages.StringField(5)
 
 
-class Session(ndb.Model):
+class SpeakerForms(messages.Message):
+    """SpeakerForms -- multiple Speaker outbound form message"""
+    items = messages.MessageField(SpeakerForm, 1, repeated=True)
+
+
+class Session(VersionedModel):
     """Session -- Please add a description"""
     name = ndb.StringProperty(required=True)
     conferenceKey = ndb.StringProperty(required=True)
@@ -162,6 +429,21 @@ class Session(ndb.Model):
     typeOfSession = ndb.StringProperty()
     date = ndb.DateProperty()
     startTime = ndb.TimeProperty()
+    city = ndb.StringProperty()
+
+    def _post_put_hook(self, future):
+        # bump the version of the conference sessions, and of all sessions
+        bump_counter(
+            MEMCACHE_SESSIONS_VERSION_PREFIX + self.key.parent().urlsafe())
+        bump_counter(MEMCACHE_GENERATION_PREFIX + self._get_kind())
+
+
+class SpeakerIndex(ndb.Model):
+    """
+    SpeakerIndex -- Session names by speaker websafe key of a Conference,
+    child of the Conference and updated along with its Sessions
+    """
+    sessions = ndb.JsonProperty(indexed=False)
 
 
 class SessionForm(messages.Message):
@@ -181,11 +463,35 @@ class SessionForm(messages.Message):
 class SessionForms(messages.Message):
     """SessionForms -- multiple Session outbound form message"""
     items = messages.MessageField(SessionForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+    etag = messages.StringField(3)
+    notModified = messages.BooleanField(4)
+
+
+class ScheduleImportForm(messages.Message):
+    """
+    ScheduleImportForm -- Conference, Speakers and Sessions bulk import
+    inbound form message
+    """
+    data = messages.StringField(1, required=True)
+    dataFormat = messages.StringField(2, default='jsonl')
+    websafeConferenceKey = messages.StringField(3)
+
+
+class ScheduleImportResultForm(messages.Message):
+    """
+    ScheduleImportResultForm -- Conference, Speakers and Sessions bulk import
+    outbound form message
+    """
+    conference = messages.MessageField(ConferenceForm, 1)
+    speakers = messages.IntegerField(2, variant=messages.Variant.INT32)
+    sessions = messages.IntegerField(3, variant=messages.Variant.INT32)
 
 
 class SessionByTypeForm(messages.Message):
     """SessionByTypeForm -- Session query inbound form message"""
     typeOfSession = messages.StringField(1)
+    fields = messages.StringField(2, repeated=True)
 
 
 class SessionQueryForm(messages.Message):
@@ -200,6 +506,9 @@ class SessionQueryForms(messages.Message):
     SessionQueryForms -- multiple SessionQueryForm inbound form message
     """
     filters = messages.MessageField(SessionQueryForm, 1, repeated=True)
+    pageSize = messages.IntegerField(2, variant=messages.Variant.INT32)
+    pageToken = messages.StringField(3)
+    fields = messages.StringField(4, repeated=True)
 
 
 class SpecificQueryForm(messages.Message):
@@ -208,6 +517,7 @@ class SpecificQueryForm(messages.Message):
     """
     operator = messages.StringField(1)
     value = messages.StringField(2)
+    fields = messages.StringField(3, repeated=True)
 
 
 class LocationQueryForm(messages.Message):
@@ -215,3 +525,4 @@ class LocationQueryForm(messages.Message):
     LocationQueryForm -- Location query inbound form message
     """
     city = messages.StringField(1)
+    fields = messages.StringField(2, repeated=True)
@@ -10,3 +10,14 @@
 # Replace the following lines with client IDs obtained from the APIs
 # Console or Cloud Console.
 WEB_CLIENT_ID = 'your-web-client-id'
+
+# How user ids are resolved: 'email' for the user email, or 'oauth' for the
+# Google account id from the ID token (verified locally) or access token.
+USER_ID_TYPE = 'email'
+
+# Requests slower than this are logged with their API calls breakdown.
+SLOW_REQUEST_THRESHOLD_MS = 1000
+
+# Mail backend sending queued emails: 'appengine' for the Mail API or
+# 'local' to keep them in memory.
+MAIL_BACKEND = 'appengine'
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+"""
+ * Project: udacity-fsnd-p4-conference-app
+ * File: tests
+ * Tests of the conference app over the App Engine testbed.
+
+Usage:
+    APPENGINE_SDK=~/google-cloud-sdk/platform/google_appengine \\
+        python -m unittest discover -s tests -t .
+"""
+import os
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SDK_PATH = os.path.expanduser(os.environ.get(
+    'APPENGINE_SDK', '~/google-cloud-sdk/platform/google_appengine'))
+
+# the SDK libraries must be on sys.path before importing the app
+sys.path.insert(0, SDK_PATH)
+import dev_appserver  # noqa: E402
+dev_appserver.fix_sys_path()
+sys.path.insert(0, APP_DIR)
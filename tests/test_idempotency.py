@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+ * Project: udacity-fsnd-p4-conference-app
+ * File: test_idempotency
+ * Tests of the request hash of idempotent create requests.
+"""
+import unittest
+
+from api import ConferenceApi, CONF_CREATE_REQUEST
+
+
+class RequestHashTest(unittest.TestCase):
+
+    def setUp(self):
+        self.request_class = CONF_CREATE_REQUEST.combined_message_class
+
+    def test_hash_ignores_idempotency_key(self):
+        with_key = self.request_class(name='Hash', city='London',
+                                      idempotencyKey='abc')
+        # the same request with the key sent as a header
+        without_key = self.request_class(name='Hash', city='London')
+        self.assertEqual(ConferenceApi._get_request_hash(with_key),
+                         ConferenceApi._get_request_hash(without_key))
+        # the request itself keeps its key
+        self.assertEqual(with_key.idempotencyKey, 'abc')
+
+    def test_hash_depends_on_fields(self):
+        self.assertNotEqual(
+            ConferenceApi._get_request_hash(self.request_class(name='A')),
+            ConferenceApi._get_request_hash(self.request_class(name='B')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+ * Project: udacity-fsnd-p4-conference-app
+ * File: test_models
+ * Tests of the Conference put hooks.
+"""
+import unittest
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+from tests import APP_DIR
+from models import Conference, Profile, MEMCACHE_CONFERENCE_PREFIX
+
+
+class ConferenceHooksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub(root_path=APP_DIR)
+        self.taskqueue = self.testbed.get_stub(testbed.TASKQUEUE_SERVICE_NAME)
+        ndb.get_context().set_cache_policy(False)
+        self.conf = Conference(
+            key=ndb.Key(Conference, 1, parent=ndb.Key(Profile, 'organizer')),
+            name='Hooks', city='London')
+        self.conf.put()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def _tasks(self, url):
+        return [task.extract_params()
+                for task in self.taskqueue.get_filtered_tasks(url=url)]
+
+    def test_city_change_syncs_sessions(self):
+        wsck = self.conf.key.urlsafe()
+        memcache.set(MEMCACHE_CONFERENCE_PREFIX + wsck, (self.conf, None))
+        # a new conference has no sessions to update
+        self.assertEqual(self._tasks('/tasks/sync_session_city'), [])
+
+        conf = self.conf.key.get()
+        conf.seatsAvailable = 10
+        conf.put()
+        self.assertEqual(self._tasks('/tasks/sync_session_city'), [])
+        self.assertIsNotNone(memcache.get(MEMCACHE_CONFERENCE_PREFIX + wsck))
+
+        conf.city = 'Paris'
+        ndb.transaction(conf.put)
+        self.assertEqual(self._tasks('/tasks/sync_session_city'),
+                         [{'websafeConferenceKey': wsck}])
+        self.assertIsNone(memcache.get(MEMCACHE_CONFERENCE_PREFIX + wsck))
+
+    def test_search_hash_survives_reads(self):
+        # str topics, as set from the conference defaults, are read back as
+        # unicode
+        conf = Conference(key=ndb.Key(Conference, 2), name='Hash',
+                          topics=['Default', 'Topic'])
+        conf.put()
+        conf = conf.key.get()
+        conf.seatsAvailable = 10
+        conf.put()
+        self.assertEqual(
+            [params['websafeConferenceKey'] for params in
+             self._tasks('/tasks/index_conferences')].count(
+                conf.key.urlsafe()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
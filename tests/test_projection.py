@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+ * Project: udacity-fsnd-p4-conference-app
+ * File: test_projection
+ * Tests of the projection fallback of field selected queries.
+"""
+import unittest
+
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+from tests import APP_DIR
+import api
+from api import ConferenceApi
+from models import Conference, ConferenceQueryForms
+
+
+class FetchProjectedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub(root_path=APP_DIR)
+        ndb.get_context().set_cache_policy(False)
+        Conference(name='Projected', city='London').put()
+        api._unprojectable_shapes.clear()
+        self.calls = []
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def _fetch(self, query):
+        """Return a fetch function recording the projections asked for."""
+        def fetch(**kwargs):
+            self.calls.append(kwargs.get('projection'))
+            return query.fetch(**kwargs)
+        return fetch
+
+    def test_projection_allowed(self):
+        query = Conference.query(Conference.city == 'London')
+        results = ConferenceApi._fetch_projected(query, self._fetch(query),
+                                                 ['name'])
+        self.assertEqual([c.name for c in results], ['Projected'])
+        self.assertEqual(self.calls, [['name']])
+        self.assertFalse(api._unprojectable_shapes)
+
+    def test_unprojectable_shape_is_remembered(self):
+        # a projected property can not have an equality filter
+        for city in ('London', 'Paris', 'London'):
+            query = Conference.query(Conference.city == city)
+            ConferenceApi._fetch_projected(query, self._fetch(query),
+                                           ['city', 'name'])
+        # only the first query paid the failed projection
+        self.assertEqual(self.calls, [['city', 'name'], None, None, None])
+        self.assertEqual(len(api._unprojectable_shapes), 1)
+
+    def test_shape_ignores_filter_values(self):
+        shape = ConferenceApi._get_query_shape
+        london = Conference.query(Conference.city == 'London',
+                                  Conference.month == 5)
+        paris = Conference.query(Conference.city == 'Paris',
+                                 Conference.month == 6)
+        self.assertEqual(shape(london, ['name']), shape(paris, ['name']))
+        self.assertNotEqual(shape(london, ['name']),
+                            shape(london, ['name', 'city']))
+        self.assertNotEqual(
+            shape(london, ['name']),
+            shape(Conference.query(Conference.city == 'London'), ['name']))
+
+    def test_query_cache_is_keyed_by_projection(self):
+        request = ConferenceQueryForms()
+        api_ = ConferenceApi()
+        for projection in (['name'], None, ['name'], ['city', 'name']):
+            conferences, _ = api_._run_conference_query(request, projection)
+            self.assertEqual([c.name for c in conferences], ['Projected'])
+        stats = ConferenceApi._get_cache_stats()['query']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+ * Project: udacity-fsnd-p4-conference-app
+ * File: test_queries
+ * Tests of the filter queries of queryConferences.
+"""
+import unittest
+
+import endpoints
+from google.appengine.api import memcache
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+from tests import APP_DIR
+import api
+from api import ConferenceApi
+from models import Conference, ConferenceQueryForm, ConferenceQueryForms
+
+
+class QueryConferencesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+            probability=1)
+        self.testbed.init_datastore_v3_stub(consistency_policy=policy)
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub(root_path=APP_DIR)
+        ndb.get_context().set_cache_policy(False)
+        self.api = ConferenceApi()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def _query_all(self, filters, page_size):
+        """Return the names of all pages of results of a query."""
+        names, token = [], None
+        while True:
+            conferences, token = self.api._run_conference_query(
+                ConferenceQueryForms(
+                    filters=[ConferenceQueryForm(field=field, operator=op,
+                                                 value=value)
+                             for field, op, value in filters],
+                    pageSize=page_size, pageToken=token))
+            names.extend(conf.name for conf in conferences)
+            if not token:
+                return names
+
+    def test_page_not_equal_filter(self):
+        ndb.put_multi([Conference(name='Conf {:02d}'.format(i),
+                                  city='abc'[i % 3]) for i in range(12)])
+        names = self._query_all([('CITY', 'NE', 'b')], 5)
+        # sorted by the inequality field first, then by name
+        self.assertEqual(names, ['Conf {:02d}'.format(i) for i in range(12)
+                                 if i % 3 == 0] +
+                         ['Conf {:02d}'.format(i) for i in range(12)
+                          if i % 3 == 2])
+
+    def test_intersect_more_keys_than_a_batch(self):
+        # 750 conferences after June, 120 of them with attendees
+        ndb.put_multi([Conference(name='Conf {:04d}'.format(i),
+                                  month=i % 12 + 1,
+                                  maxAttendees=10 if i < 240 else 0)
+                       for i in range(1500)])
+        filters = [('MONTH', 'GT', '6'), ('MAX_ATTENDEES', 'GT', '0')]
+        names = self._query_all(filters, 30)
+        self.assertEqual(len(names), 120)
+        self.assertEqual(set(names), {'Conf {:04d}'.format(i)
+                                      for i in range(240) if i % 12 >= 6})
+
+        max_keys = api.MAX_INTERSECTION_KEYS
+        api.MAX_INTERSECTION_KEYS = 500
+        memcache.flush_all()
+        try:
+            with self.assertRaises(endpoints.BadRequestException):
+                self._query_all(filters, 30)
+        finally:
+            api.MAX_INTERSECTION_KEYS = max_keys
+
+
+if __name__ == '__main__':
+    unittest.main()
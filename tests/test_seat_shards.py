@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+ * Project: udacity-fsnd-p4-conference-app
+ * File: test_seat_shards
+ * Contention tests of the sharded seat counter.
+"""
+import threading
+import unittest
+
+from google.appengine.api import memcache
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+from tests import APP_DIR
+from api import ConferenceApi
+from models import Conference, Profile, Registration, \
+    ConflictException
+
+SEATS = 5
+SHARDS = 3
+USERS = 20
+
+
+class SeatShardsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+            probability=1)
+        self.testbed.init_datastore_v3_stub(consistency_policy=policy)
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub(root_path=APP_DIR)
+        ndb.get_context().set_cache_policy(False)
+        self.conf = Conference(name='Sharded', seatsAvailable=SEATS,
+                               maxAttendees=SEATS, seatShards=SHARDS)
+        self.conf.put()
+        ndb.put_multi(ConferenceApi._make_seat_shards(self.conf))
+        self.p_keys = [ndb.Key(Profile, 'user{}@example.com'.format(i))
+                       for i in range(USERS)]
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def _register(self, p_key, results):
+        """Register a user, recording the result or the exception raised."""
+        # each thread has its own ndb context
+        ndb.get_context().set_cache_policy(False)
+        try:
+            results[p_key] = ConferenceApi._sharded_conference_registration(
+                p_key, self.conf)[0]
+        except ConflictException:
+            results[p_key] = False
+        except Exception as e:
+            # transactions giving up after too much contention
+            results[p_key] = e
+
+    def _shard_seats(self):
+        return [shard.seatsAvailable for shard in
+                ndb.get_multi(ConferenceApi._seat_shard_keys(self.conf))]
+
+    def test_make_seat_shards(self):
+        self.assertEqual(sorted(self._shard_seats()), [1, 2, 2])
+        seats = ConferenceApi._get_sharded_seats([self.conf])
+        self.assertEqual(seats, {self.conf.key.urlsafe(): SEATS})
+
+    def test_concurrent_registrations_do_not_oversell(self):
+        results = {}
+        threads = [threading.Thread(target=self._register,
+                                    args=(p_key, results))
+                   for p_key in self.p_keys]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), USERS)
+
+        # users whose transactions failed on contention try again
+        for p_key, result in results.items():
+            if result not in (True, False):
+                self._register(p_key, results)
+
+        registered = [p_key for p_key, result in results.items()
+                      if result is True]
+        self.assertEqual(len(registered), SEATS)
+        self.assertEqual(Registration.query().count(), SEATS)
+        self.assertEqual(sorted(reg.key.parent() for reg in
+                                Registration.query()), sorted(registered))
+        shard_seats = self._shard_seats()
+        self.assertTrue(all(seats >= 0 for seats in shard_seats))
+        self.assertEqual(sum(shard_seats), 0)
+        memcache.flush_all()
+        seats = ConferenceApi._get_sharded_seats([self.conf])
+        self.assertEqual(seats[self.conf.key.urlsafe()], 0)
+
+    def test_unregister_gives_back_seat(self):
+        p_key = self.p_keys[0]
+        self.assertEqual(ConferenceApi._sharded_conference_registration(
+            p_key, self.conf)[0], True)
+        self.assertEqual(sum(self._shard_seats()), SEATS - 1)
+        self.assertEqual(ConferenceApi._sharded_conference_registration(
+            p_key, self.conf, reg=False)[0], True)
+        self.assertEqual(sum(self._shard_seats()), SEATS)
+        self.assertEqual(ConferenceApi._sharded_conference_registration(
+            p_key, self.conf, reg=False)[0], False)
+
+    def test_unregister_without_shards(self):
+        ndb.delete_multi(ConferenceApi._seat_shard_keys(self.conf))
+        self.assertEqual(ConferenceApi._sharded_conference_registration(
+            self.p_keys[0], self.conf, reg=False), (False, None))
+        with self.assertRaises(ConflictException):
+            ConferenceApi._sharded_conference_registration(
+                self.p_keys[0], self.conf)
+
+
+if __name__ == '__main__':
+    unittest.main()
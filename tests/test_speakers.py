@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+ * Project: udacity-fsnd-p4-conference-app
+ * File: test_speakers
+ * Tests of the Speaker autocomplete and email deduplication.
+"""
+import unittest
+
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+from api import ConferenceApi, SPEAKER_CREATE_REQUEST, SPEAKER_SEARCH_REQUEST
+from models import Profile, Speaker
+
+USER_ID = 'organizer@example.com'
+
+
+class SpeakersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+            probability=1)
+        self.testbed.init_datastore_v3_stub(consistency_policy=policy)
+        self.testbed.init_memcache_stub()
+        ndb.get_context().set_cache_policy(False)
+        self.api = ConferenceApi()
+        self.api._get_current_user = lambda: (None, USER_ID)
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def _put_speakers(self, names):
+        p_key = ndb.Key(Profile, USER_ID)
+        ConferenceApi._put_speakers([
+            Speaker(key=ndb.Key(Speaker, i + 1, parent=p_key), name=name)
+            for i, name in enumerate(names)])
+
+    def _search(self, query, page_size):
+        request = SPEAKER_SEARCH_REQUEST.combined_message_class(
+            query=query, pageSize=page_size)
+        return [sp.name for sp in self.api.search_speakers(request).items]
+
+    def test_search_words_longer_than_prefixes(self):
+        # the first speakers share the indexed prefix 'alexandrin' only
+        self._put_speakers(['Alexandrin {}'.format(i) for i in range(5)] +
+                           ['Alexandrina Zed', 'Alexandrina Zoe'])
+        self.assertEqual(self._search('alexandrina', 2),
+                         ['Alexandrina Zed', 'Alexandrina Zoe'])
+        self.assertEqual(self._search('alexandrin', 2),
+                         ['Alexandrin 0', 'Alexandrin 1'])
+
+    def test_create_existing_email_allocates_no_id(self):
+        allocated = []
+        allocate_ids = Speaker.allocate_ids
+
+        def record_allocate_ids(*args, **kwargs):
+            allocated.append(kwargs.get('size'))
+            return allocate_ids(*args, **kwargs)
+        Speaker.allocate_ids = staticmethod(record_allocate_ids)
+        try:
+            first, second = [self.api._create_speaker_object(
+                SPEAKER_CREATE_REQUEST.combined_message_class(
+                    name=name, email=email))
+                for name, email in (('Ada', 'ada@example.com'),
+                                    ('Ada L.', ' ADA@example.com'))]
+        finally:
+            Speaker.allocate_ids = allocate_ids
+        self.assertEqual(allocated, [1])
+        self.assertEqual(second.websafeKey, first.websafeKey)
+        self.assertEqual(Speaker.query().count(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
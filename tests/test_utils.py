@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+ * Project: udacity-fsnd-p4-conference-app
+ * File: test_utils
+ * Offline tests of ID token verification and the token cache, against a
+   local stand-in key set.
+"""
+import base64
+import json
+import os
+import time
+import unittest
+
+from Crypto.Hash import SHA256
+from Crypto.PublicKey import RSA
+from Crypto.Signature import PKCS1_v1_5
+from Crypto.Util.number import long_to_bytes
+from google.appengine.ext import testbed
+
+import utils
+from settings import WEB_CLIENT_ID
+
+KID = 'stand-in'
+
+
+def b64encode(data):
+    """Encode data as base64url without padding."""
+    return base64.urlsafe_b64encode(data).rstrip('=')
+
+
+def make_jwk(key, kid=KID):
+    """Return the public JWK of an RSA key."""
+    return {'kid': kid, 'kty': 'RSA', 'alg': 'RS256',
+            'n': b64encode(long_to_bytes(key.n)),
+            'e': b64encode(long_to_bytes(key.e))}
+
+
+def make_token(key, kid=KID, **claims):
+    """Return an RS256 ID token signed with an RSA key."""
+    now = int(time.time())
+    payload = {'iss': 'accounts.google.com', 'aud': WEB_CLIENT_ID,
+               'sub': '1234567890', 'iat': now, 'exp': now + 3600}
+    payload.update(claims)
+    signing_input = '{}.{}'.format(
+        b64encode(json.dumps({'alg': 'RS256', 'kid': kid})),
+        b64encode(json.dumps(payload)))
+    signature = PKCS1_v1_5.new(key).sign(SHA256.new(signing_input))
+    return '{}.{}'.format(signing_input, b64encode(signature))
+
+
+class FakeResponse(object):
+
+    def __init__(self, status_code, content=''):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {}
+
+
+class VerifyIdTokenTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.key = RSA.generate(1024)
+        cls.other_key = RSA.generate(1024)
+        cls.certs = {KID: make_jwk(cls.key)}
+
+    def test_valid_token(self):
+        payload = utils.verify_id_token(make_token(self.key), self.certs)
+        self.assertEqual(payload['sub'], '1234567890')
+
+    def test_signed_by_other_key(self):
+        self.assertIsNone(utils.verify_id_token(
+            make_token(self.other_key), self.certs))
+
+    def test_signature_larger_than_modulus(self):
+        header, payload, signature = make_token(self.key).split('.')
+        token = '.'.join([header, payload, b64encode('\xff' * 128)])
+        self.assertIsNone(utils.verify_id_token(token, self.certs))
+
+    def test_unknown_key_id(self):
+        self.assertIsNone(utils.verify_id_token(
+            make_token(self.key, kid='other'), self.certs))
+
+    def test_tampered_payload(self):
+        header, payload, signature = make_token(self.key).split('.')
+        claims = json.loads(utils._b64decode(payload))
+        claims['sub'] = 'someone-else'
+        token = '.'.join([header, b64encode(json.dumps(claims)), signature])
+        self.assertIsNone(utils.verify_id_token(token, self.certs))
+
+    def test_expired(self):
+        now = int(time.time())
+        token = make_token(self.key, iat=now - 7200,
+                           exp=now - utils.CLOCK_SKEW - 1)
+        self.assertIsNone(utils.verify_id_token(token, self.certs))
+
+    def test_issued_in_future(self):
+        token = make_token(self.key,
+                           iat=int(time.time()) + utils.CLOCK_SKEW + 60)
+        self.assertIsNone(utils.verify_id_token(token, self.certs))
+
+    def test_wrong_issuer(self):
+        token = make_token(self.key, iss='https://evil.example.com')
+        self.assertIsNone(utils.verify_id_token(token, self.certs))
+
+    def test_wrong_audience(self):
+        token = make_token(self.key, aud='other-client-id')
+        self.assertIsNone(utils.verify_id_token(token, self.certs))
+
+    def test_malformed(self):
+        for token in ('', 'abc', 'a.b.c', 'a.b'):
+            self.assertIsNone(utils.verify_id_token(token, self.certs))
+
+
+class TokenCacheTest(unittest.TestCase):
+
+    def test_get_set(self):
+        cache = utils.TokenCache()
+        self.assertIsNone(cache.get('token'))
+        cache.set('token', 'user')
+        self.assertEqual(cache.get('token'), 'user')
+
+    def test_expires_at_token_expiration(self):
+        cache = utils.TokenCache(ttl=600)
+        cache.set('token', 'user', expires_at=time.time() - 1)
+        self.assertIsNone(cache.get('token'))
+
+    def test_expires_after_ttl(self):
+        cache = utils.TokenCache(ttl=0)
+        cache.set('token', 'user', expires_at=time.time() + 3600)
+        self.assertIsNone(cache.get('token'))
+
+    def test_evicts_least_recently_used(self):
+        cache = utils.TokenCache(max_size=2)
+        cache.set('a', 'user a')
+        cache.set('b', 'user b')
+        cache.get('a')
+        cache.set('c', 'user c')
+        self.assertEqual(cache.get('a'), 'user a')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 'user c')
+
+
+class GetUserIdTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.key = RSA.generate(1024)
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_memcache_stub()
+        self.testbed.init_urlfetch_stub()
+        self.fetches = []
+        self.responses = []
+        self.sleeps = []
+        self.fetch, utils.urlfetch.fetch = utils.urlfetch.fetch, self._fetch
+        self.sleep, utils.time.sleep = utils.time.sleep, self.sleeps.append
+        # the stand-in key set is used instead of Google keys
+        self.certs = dict(utils._certs)
+        utils._certs.update(keys={KID: make_jwk(self.key)},
+                            expires=time.time() + 3600)
+        utils._token_cache = utils.TokenCache()
+
+    def tearDown(self):
+        utils.urlfetch.fetch = self.fetch
+        utils.time.sleep = self.sleep
+        utils._certs.update(self.certs)
+        os.environ.pop('HTTP_AUTHORIZATION', None)
+        self.testbed.deactivate()
+
+    def _fetch(self, url):
+        self.fetches.append(url)
+        return self.responses.pop(0)
+
+    def _get_user_id(self, token):
+        os.environ['HTTP_AUTHORIZATION'] = 'Bearer ' + token
+        return utils.get_user_id(None, 'oauth')
+
+    def test_id_token_verified_locally_and_cached(self):
+        token = make_token(self.key)
+        self.assertEqual(self._get_user_id(token), '1234567890')
+        # cached user ids skip verification
+        utils._certs.update(keys={})
+        self.assertEqual(self._get_user_id(token), '1234567890')
+        self.assertEqual(self.fetches, [])
+
+    def test_tokeninfo_backs_off_exponentially(self):
+        self.responses = [FakeResponse(500), FakeResponse(503),
+                          FakeResponse(200, json.dumps(
+                              {'user_id': '42', 'expires_in': 3600}))]
+        self.assertEqual(self._get_user_id('opaque-token'), '42')
+        self.assertEqual(len(self.fetches), 3)
+        self.assertEqual(self.sleeps, [utils.TOKENINFO_BACKOFF,
+                                       2 * utils.TOKENINFO_BACKOFF])
+
+    def test_tokeninfo_gives_up(self):
+        self.responses = [FakeResponse(500)] * utils.TOKENINFO_RETRIES
+        self.assertEqual(self._get_user_id('opaque-token'), '')
+        # no wait after the last try
+        self.assertEqual(len(self.sleeps), utils.TOKENINFO_RETRIES - 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+ * Project: udacity-fsnd-p4-conference-app
+ * File: test_waitlist
+ * Tests of the waitlist order of conference registrations.
+"""
+import unittest
+
+from google.appengine.api import users
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+from tests import APP_DIR
+from api import ConferenceApi, CONF_GET_REQUEST
+from models import Conference, Profile, ConflictException
+
+
+class WaitlistTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+            probability=1)
+        self.testbed.init_datastore_v3_stub(consistency_policy=policy)
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub(root_path=APP_DIR)
+        self.testbed.init_user_stub()
+        ndb.get_context().set_cache_policy(False)
+        self.conf = Conference(
+            key=ndb.Key(Conference, 1, parent=ndb.Key(Profile, 'organizer')),
+            name='Waitlist', maxAttendees=1, seatsAvailable=1)
+        self.conf.put()
+        self.wsck = self.conf.key.urlsafe()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def _call(self, method, email):
+        """Call an endpoint on the conference as a new request of a user."""
+        service = ConferenceApi()
+        user = users.User(email)
+        service._get_current_user = lambda: (user, email)
+        request = CONF_GET_REQUEST.combined_message_class(
+            websafeConferenceKey=self.wsck)
+        return getattr(service, method)(request).data
+
+    def test_waiting_users_register_first(self):
+        self.assertTrue(self._call('register_for_conference', 'a@x.com'))
+        self.assertTrue(self._call('join_waitlist', 'b@x.com'))
+        self.assertTrue(self._call('join_waitlist', 'c@x.com'))
+        # the freed seat is taken before the promotion task runs
+        self.assertTrue(self._call('unregister_from_conference', 'a@x.com'))
+        for email in ('d@x.com', 'c@x.com'):
+            with self.assertRaises(ConflictException):
+                self._call('register_for_conference', email)
+        # the first waiting user can register without waiting for the task
+        self.assertTrue(self._call('register_for_conference', 'b@x.com'))
+        self.assertEqual(ConferenceApi._get_waitlist_head(self.conf.key),
+                         ndb.Key(Profile, 'c@x.com'))
+
+
+if __name__ == '__main__':
+    unittest.main()
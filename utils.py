@@ -9,13 +9,166 @@
  * Time: 17:40
  * To change this template use File | Settings | File Templates.
 """
+import base64
+import binascii
+import collections
+import hashlib
 import json
 import os
+import re
+import threading
 import time
 import uuid
 
+import endpoints
+from Crypto.Hash import SHA256
+from Crypto.PublicKey import RSA
+from Crypto.Signature import PKCS1_v1_5
+from google.appengine.api import memcache
 from google.appengine.api import urlfetch
 from models import Profile
+from settings import WEB_CLIENT_ID
+
+GOOGLE_CERTS_URL = 'https://www.googleapis.com/oauth2/v3/certs'
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+ID_TOKEN_AUDIENCES = (WEB_CLIENT_ID, endpoints.API_EXPLORER_CLIENT_ID)
+MEMCACHE_GOOGLE_CERTS_KEY = "GOOGLE CERTS"
+CERTS_DEFAULT_MAX_AGE = 3600
+# allowed clock difference when checking token timestamps
+CLOCK_SKEW = 300
+TOKENINFO_URL = 'https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
+TOKENINFO_RETRIES = 3
+# seconds to wait before the first tokeninfo retry, doubled on each one
+TOKENINFO_BACKOFF = 0.25
+
+
+class TokenCache(object):
+    """
+    TokenCache -- Thread-safe LRU cache from token hash to user id, with
+    entries expiring after a TTL or at the token expiration.
+    """
+
+    def __init__(self, max_size=1000, ttl=600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _hash(token):
+        return hashlib.sha256(token).hexdigest()
+
+    def get(self, token):
+        """Return cached user id of token, None if missing or expired."""
+        key = self._hash(token)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[1] <= time.time():
+                return None
+            # re-insert to mark as most recently used
+            self._entries[key] = entry
+            return entry[0]
+
+    def set(self, token, user_id, expires_at=None):
+        """Cache user id of token, evicting least recently used entries."""
+        expires = time.time() + self.ttl
+        if expires_at is not None:
+            expires = min(expires, expires_at)
+        key = self._hash(token)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (user_id, expires)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+_token_cache = TokenCache()
+_certs = {'keys': {}, 'expires': 0}
+
+
+def _b64decode(data):
+    """Decode base64url data without padding."""
+    if isinstance(data, unicode):
+        data = data.encode('ascii')
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def get_google_certs():
+    """
+    Return Google ID token signing keys, cached in the instance and in
+    memcache for as long as Google allows.
+
+    Returns:
+        A dict of JWK keys by key id.
+    """
+    if _certs['expires'] > time.time():
+        return _certs['keys']
+
+    cached = memcache.get(MEMCACHE_GOOGLE_CERTS_KEY)
+    if cached is None:
+        resp = urlfetch.fetch(GOOGLE_CERTS_URL)
+        if resp.status_code != 200:
+            # keep using stale keys instead of failing every request
+            return _certs['keys']
+        max_age = re.search(r'max-age=(\d+)',
+                            resp.headers.get('cache-control', ''))
+        max_age = int(max_age.group(1)) if max_age else CERTS_DEFAULT_MAX_AGE
+        keys = {jwk['kid']: jwk for jwk in json.loads(resp.content)['keys']}
+        cached = (keys, time.time() + max_age)
+        memcache.set(MEMCACHE_GOOGLE_CERTS_KEY, cached, time=max_age)
+
+    _certs['keys'], _certs['expires'] = cached
+    return _certs['keys']
+
+
+def verify_id_token(token, certs=None, audiences=ID_TOKEN_AUDIENCES):
+    """
+    Verify a Google ID token locally against the signing keys.
+
+    Args:
+        token: The ID token (RS256 signed JWT).
+        certs: A dict of JWK keys by key id. Google keys if None.
+        audiences: The client ids allowed in the token 'aud' claim.
+
+    Returns:
+        The token payload dict, None if the token is invalid.
+    """
+    try:
+        header, payload, signature = token.split('.')
+        jwt_header = json.loads(_b64decode(header))
+        jwt_payload = json.loads(_b64decode(payload))
+        signature = _b64decode(signature)
+    except (ValueError, TypeError):
+        return None
+    if jwt_header.get('alg') != 'RS256':
+        return None
+
+    if certs is None:
+        certs = get_google_certs()
+    jwk = certs.get(jwt_header.get('kid'))
+    if not jwk:
+        return None
+    modulus = long(binascii.hexlify(_b64decode(jwk['n'])), 16)
+    exponent = long(binascii.hexlify(_b64decode(jwk['e'])), 16)
+    verifier = PKCS1_v1_5.new(RSA.construct((modulus, exponent)))
+    try:
+        if not verifier.verify(SHA256.new('{}.{}'.format(header, payload)),
+                               signature):
+            return None
+    except ValueError:
+        # a signature larger than the key modulus
+        return None
+
+    now = time.time()
+    if jwt_payload.get('iat', 0) > now + CLOCK_SKEW:
+        return None
+    if jwt_payload.get('exp', 0) < now - CLOCK_SKEW:
+        return None
+    if jwt_payload.get('iss') not in GOOGLE_ISSUERS:
+        return None
+    if audiences and jwt_payload.get('aud') not in audiences:
+        return None
+    return jwt_payload
 
 
 def get_user_id(user, id_type="email"):
@@ -26,25 +179,43 @@ def get_user_id(user, id_type="email"):
         """A workaround implementation for getting userid."""
         auth = os.getenv('HTTP_AUTHORIZATION')
         bearer, token = auth.split()
+        user_id = _token_cache.get(token)
+        if user_id is not None:
+            return user_id
+
         token_type = 'id_token'
         if 'OAUTH_USER_ID' in os.environ:
             token_type = 'access_token'
-        url = ('https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
-               % (token_type, token))
+        else:
+            # verify ID tokens locally, without calling tokeninfo
+            payload = verify_id_token(token)
+            if payload:
+                _token_cache.set(token, payload['sub'], payload['exp'])
+                return payload['sub']
+
+        url = TOKENINFO_URL % (token_type, token)
         user = {}
-        wait = 1
-        for i in range(3):
-            resp = urlfetch.fetch(url)
-            if resp.status_code == 200:
+        wait = TOKENINFO_BACKOFF
+        for i in range(TOKENINFO_RETRIES):
+            try:
+                resp = urlfetch.fetch(url)
+            except urlfetch.Error:
+                resp = None
+            if resp and resp.status_code == 200:
                 user = json.loads(resp.content)
                 break
-            elif resp.status_code == 400 and 'invalid_token' in resp.content:
-                url = ('https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
-                       % ('access_token', token))
-            else:
+            elif (resp and resp.status_code == 400 and
+                    'invalid_token' in resp.content):
+                url = TOKENINFO_URL % ('access_token', token)
+            elif i < TOKENINFO_RETRIES - 1:
+                # back off exponentially on transient failures
                 time.sleep(wait)
-                wait += i
-        return user.get('user_id', '')
+                wait *= 2
+        user_id = user.get('user_id', '')
+        if user_id:
+            _token_cache.set(token, user_id,
+                             time.time() + int(user.get('expires_in', 0)))
+        return user_id
 
     # if id_type == "custom":
     #     # implement your own user_id creation and getting algorythm